@@ -1,12 +1,23 @@
 import os
 import uuid
+import time
 import logging
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file, abort
+from datetime import datetime
+from flask import Flask, request, jsonify, send_file, abort, Response, stream_with_context, g
 from flask_cors import CORS
-from celery import Celery
+from celery import Celery, chord, group
 from werkzeug.utils import secure_filename
-import magic
+from cache import ResultCache, MathSpeechCache, TEICache, get_redis, make_result_key
+from uploads import UploadRequest, InvalidUpload, extract_zip_pdfs, file_extension
+from batches import BATCH_MAX_FILES, create_batch, get_batch, aggregate_status
+from scheduling import EXTRACT_QUEUE, CPU_QUEUE, STAGE_QUEUES, client_id, document_queues, claim_priority, release_client
+from progress import status_payload, progress_events
+from metrics import CONTENT_TYPE, HTTP_REQUEST_DURATION, observe_artifact, render_metrics
+from tracing import start_request_span, end_span, tag_job
+from audio import (
+    AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT, CONVERSION_TIMEOUT, audio_filename, partial_audio_filename,
+    read_audio_etag, streaming_wav_header, conversion_key
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,10 +25,18 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+# Uploads are hashed, sniffed and written to UPLOAD_FOLDER as they arrive
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['MAX_BATCH_CONTENT_LENGTH'] = int(os.environ.get('MAX_BATCH_SIZE', 1024 * 1024 * 1024))  # 1GB per batch
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
 app.config['TEMP_FOLDER'] = os.environ.get('TEMP_FOLDER', '/app/temp')
 
+# Let the web server send audio files: X-Sendfile (Apache, lighttpd) or
+# X-Accel-Redirect to an internal nginx location that maps to TEMP_FOLDER
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX', '')
+
 # Enable CORS for all routes
 CORS(app, origins=['http://localhost:12000', 'https://work-1-yynvnckwdflsxwor.prod-runtime.all-hands.dev'])
 
@@ -43,27 +62,90 @@ celery.conf.update(
     task_soft_time_limit=25 * 60,  # 25 minutes
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    imports=('tasks',),
+    # Each pipeline stage has its own queue, with separate extraction and
+    # synthesis queues for long documents; see scheduling.py. Run one worker
+    # pool for the stages that wait on GROBID, SRE and Piper, and one for
+    # the CPU queue, each with its own concurrency.
+    task_default_queue=EXTRACT_QUEUE,
+    task_routes=dict(
+        {stage: {'queue': queue} for stage, queue in STAGE_QUEUES.items()},
+        **{'tasks.combine_batch_audio': {'queue': CPU_QUEUE}, 'tasks.convert_audio': {'queue': CPU_QUEUE}}
+    ),
+    # Acknowledge after running, so a worker process reserves no task beyond
+    # the one it runs and queued priorities decide what runs next
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
 )
 
 # Ensure upload and temp directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['TEMP_FOLDER'], exist_ok=True)
 
-ALLOWED_EXTENSIONS = {'pdf'}
+# Most task IDs accepted by one batch status request
+STATUS_BATCH_MAX = int(os.environ.get('STATUS_BATCH_MAX', 1000))
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Speech speeds the Piper service accepts
+MIN_SPEED = 0.5
+MAX_SPEED = 2.0
 
-def validate_pdf(file_path):
-    """Validate that the uploaded file is actually a PDF"""
-    try:
-        mime = magic.Magic(mime=True)
-        file_type = mime.from_file(file_path)
-        return file_type == 'application/pdf'
-    except Exception as e:
-        logger.error(f"Error validating PDF: {e}")
-        return False
+# Progressive audio streaming; streams are tailed on gevent greenlets
+STREAM_POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', 0.5))
+STREAM_IDLE_TIMEOUT = int(os.environ.get('STREAM_IDLE_TIMEOUT', 300))
+# Seconds clients are asked to wait before retrying a stream with no audio yet
+STREAM_RETRY_AFTER = int(os.environ.get('STREAM_RETRY_AFTER', 2))
+STREAM_READ_SIZE = 64 * 1024
+WAV_HEADER_SIZE = 44
+
+# Seconds clients are asked to wait before retrying a format being converted
+CONVERSION_RETRY_AFTER = int(os.environ.get('CONVERSION_RETRY_AFTER', 5))
+
+def serve_cached_result(cache_key, task_id):
+    """Link a cached result to task_id and record it as a finished task"""
+    result_cache = ResultCache()
+    entry = result_cache.get(cache_key)
+    if not entry:
+        return None
+    
+    audio_format = entry['result'].get('format', 'wav')
+    audio_path = os.path.join(app.config['TEMP_FOLDER'], audio_filename(task_id, audio_format))
+    result = result_cache.link(cache_key, entry, task_id, audio_path)
+    if result is None:
+        return None
+    
+    # Make the status endpoint report the cached task as completed
+    celery.backend.store_result(task_id, result, 'SUCCESS')
+    return result
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    g.request_span = start_request_span(
+        f"{request.method} {route}", request.headers,
+        **{'http.method': request.method, 'http.route': route}
+    )
+
+@app.after_request
+def observe_request(response):
+    if 'request_started' in g:
+        HTTP_REQUEST_DURATION.labels(
+            request.endpoint or 'unknown', request.method, response.status_code
+        ).observe(time.perf_counter() - g.request_started)
+    if 'request_span' in g:
+        g.request_span[0].set_attribute('http.status_code', response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_span(error=None):
+    # Streamed responses end their span once the stream is closed
+    if 'request_span' in g:
+        end_span(*g.pop('request_span'), error=error)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of the API; workers serve theirs on WORKER_METRICS_PORT"""
+    return Response(render_metrics(), headers={'Content-Type': CONTENT_TYPE})
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -78,6 +160,37 @@ def health_check():
         }
     })
 
+def scheduling_options(pdf_path, client):
+    """Stage queues and priority of a document's pipeline"""
+    from tasks import get_page_count
+    try:
+        page_count = get_page_count(pdf_path)
+    except Exception as e:
+        # Unreadable PDFs fail quickly; no need to hold up the long queues
+        logger.warning(f"Could not count pages of {pdf_path}: {e}")
+        page_count = 0
+    return {'queues': document_queues(page_count), 'priority': claim_priority(client)}
+
+def processing_options():
+    """Read the voice settings and audio format of an upload request"""
+    audio_format = request.form.get('format', DEFAULT_AUDIO_FORMAT).lower()
+    if audio_format not in AUDIO_FORMATS:
+        raise InvalidUpload(f'Unsupported audio format. Choose one of: {", ".join(AUDIO_FORMATS)}')
+    
+    try:
+        speed = float(request.form.get('speed', 1.0))
+    except ValueError:
+        raise InvalidUpload('Speed must be a number')
+    if not MIN_SPEED <= speed <= MAX_SPEED:
+        raise InvalidUpload(f'Speed must be between {MIN_SPEED} and {MAX_SPEED}')
+    
+    voice_settings = {
+        'language': request.form.get('language', 'en'),
+        'voice': request.form.get('voice', 'default'),
+        'speed': speed
+    }
+    return voice_settings, audio_format
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Upload PDF file and start processing"""
@@ -85,36 +198,57 @@ def upload_file():
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
+        # Reading the form receives the file; non-PDFs are rejected from their
+        # first bytes and already written to the upload folder otherwise
         file = request.files['file']
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type. Only PDF files are allowed.'}), 400
+        voice_settings, audio_format = processing_options()
         
         # Generate unique task ID
         task_id = str(uuid.uuid4())
+        tag_job(task_id)
         
-        # Secure filename and save
+        # Keep the received file under its task name
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}_{filename}")
-        file.save(file_path)
+        file.stream.commit(file_path)
+        observe_artifact('upload', file_path)
         
-        # Validate PDF
-        if not validate_pdf(file_path):
+        # Serve repeat conversions of the same PDF from the result cache
+        pdf_hash = file.stream.hexdigest()
+        cache_key = make_result_key(pdf_hash, dict(voice_settings, format=audio_format))
+        cached = serve_cached_result(cache_key, task_id)
+        if cached:
             os.remove(file_path)
-            return jsonify({'error': 'Invalid PDF file'}), 400
-        
-        # Get processing options from request
-        voice_settings = {
-            'language': request.form.get('language', 'en'),
-            'voice': request.form.get('voice', 'default'),
-            'speed': float(request.form.get('speed', 1.0))
-        }
+            return jsonify({
+                'task_id': task_id,
+                'status': 'completed',
+                'message': 'Audio served from cache',
+                'cached': True,
+                'result': cached
+            }), 200
         
         # Start background processing
-        from tasks import process_pdf_to_audio
-        task = process_pdf_to_audio.delay(task_id, file_path, voice_settings)
+        from tasks import document_pipeline
+        client = client_id(request)
+        # The pipeline finishes under our task ID so status and progress
+        # events can find it
+        pipeline = document_pipeline(
+            task_id, file_path, voice_settings,
+            cache_key=cache_key,
+            pdf_hash=pdf_hash,
+            audio_format=audio_format,
+            client_id=client,
+            **scheduling_options(file_path, client)
+        )
+        try:
+            pipeline.apply_async()
+        except Exception:
+            # The document will never run, so it must not count against the client
+            release_client(client)
+            raise
         
         return jsonify({
             'task_id': task_id,
@@ -122,10 +256,170 @@ def upload_file():
             'message': 'PDF processing started'
         }), 202
         
+    except InvalidUpload as e:
+        return jsonify({'error': e.description}), 400
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def receive_batch_documents(files):
+    """Keep the PDFs of a batch upload, expanding ZIP archives.
+    
+    Returns (filename, path, sha256) per PDF in upload order and the names of
+    archive entries that were skipped.
+    """
+    documents = []
+    skipped = []
+    try:
+        for file in files:
+            if file_extension(file.filename) == 'zip':
+                extracted, skipped_entries = extract_zip_pdfs(
+                    file.stream.path, app.config['UPLOAD_FOLDER'],
+                    BATCH_MAX_FILES - len(documents), app.config['MAX_CONTENT_LENGTH']
+                )
+                documents.extend(extracted)
+                skipped.extend(skipped_entries)
+            else:
+                if len(documents) >= BATCH_MAX_FILES:
+                    raise InvalidUpload(f'At most {BATCH_MAX_FILES} PDFs per batch')
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}.pdf")
+                file.stream.commit(file_path)
+                documents.append((file.filename, file_path, file.stream.hexdigest()))
+    except Exception:
+        for _, path, _ in documents:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    
+    return documents, skipped
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Upload many PDFs, or ZIP archives of them, as one batch job.
+    
+    Every PDF gets a pipeline of its own, so the documents are spread over
+    all workers like separate uploads, and the client's fair share
+    lowers the priority of the later ones. With combine=true the children
+    run as a chord whose callback joins their audio into one file with a
+    chapter per document.
+    """
+    try:
+        files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        
+        voice_settings, audio_format = processing_options()
+        combine = request.form.get('combine', 'false').lower() == 'true'
+        
+        documents, skipped = receive_batch_documents(files)
+        if not documents:
+            return jsonify({'error': 'No PDF files found in upload', 'skipped': skipped}), 400
+        
+        batch_id = str(uuid.uuid4())
+        tag_job(batch_id)
+        
+        from tasks import document_pipeline, combine_batch_audio
+        client = client_id(request)
+        children = []
+        signatures = []
+        claimed = 0
+        try:
+            for filename, file_path, digest in documents:
+                task_id = str(uuid.uuid4())
+                
+                # Keep the received file under its task name
+                task_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}_{secure_filename(filename)}")
+                os.replace(file_path, task_path)
+                observe_artifact('upload', task_path)
+                
+                cache_key = make_result_key(digest, dict(voice_settings, format=audio_format))
+                options = scheduling_options(task_path, client)
+                claimed += 1
+                signatures.append(document_pipeline(
+                    task_id, task_path, voice_settings,
+                    cache_key=cache_key,
+                    pdf_hash=digest,
+                    audio_format=audio_format,
+                    check_cache=True,
+                    client_id=client,
+                    **options
+                ))
+                children.append({'task_id': task_id, 'filename': filename})
+            
+            create_batch(batch_id, children, audio_format, combine)
+            
+            if combine:
+                titles = [os.path.splitext(child['filename'])[0] for child in children]
+                chord(signatures)(combine_batch_audio.s(
+                    batch_id, [child['task_id'] for child in children], titles, audio_format
+                ).set(queue=CPU_QUEUE))
+            else:
+                group(signatures).apply_async()
+        except Exception:
+            # None of the documents will run, so none may count against the client
+            for _ in range(claimed):
+                release_client(client)
+            raise
+        
+        return jsonify({
+            'batch_id': batch_id,
+            'status': 'started',
+            'message': f'Processing {len(children)} PDFs',
+            'tasks': children,
+            'skipped': skipped
+        }), 202
+        
+    except InvalidUpload as e:
+        return jsonify({'error': e.description}), 400
+    except Exception as e:
+        logger.error(f"Batch upload error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+def get_batch_job(batch_id):
+    """Get the aggregate status of a batch job and of each of its documents"""
+    try:
+        try:
+            uuid.UUID(batch_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid batch ID format'}), 400
+        
+        batch = get_batch(batch_id)
+        if batch is None:
+            return jsonify({'error': 'Batch not found'}), 404
+        
+        documents = batch['documents']
+        states = fetch_task_states([document['task_id'] for document in documents])
+        children = [
+            dict(document, **compact_status(document['task_id'], state, info))
+            for document, (state, info) in zip(documents, states)
+        ]
+        
+        combined = batch.get('combined')
+        combined_ready = bool(combined and 'audio_url' in combined)
+        status = aggregate_status(batch, children, combined_ready)
+        status.update({
+            'batch_id': batch_id,
+            'format': batch['format'],
+            'tasks': children
+        })
+        if batch['combine']:
+            if combined_ready:
+                status['combined'] = dict(combined, status='ready')
+            elif (combined and 'error' in combined) or status['failed']:
+                # A chord callback never runs once a child has failed
+                status['combined'] = {'status': 'failed'}
+            else:
+                status['combined'] = {'status': 'pending'}
+        
+        return jsonify(status)
+        
+    except Exception as e:
+        logger.error(f"Batch job status error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/status/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     """Get processing status for a task"""
@@ -136,80 +430,296 @@ def get_task_status(task_id):
         except ValueError:
             return jsonify({'error': 'Invalid task ID format'}), 400
         
-        from tasks import process_pdf_to_audio
-        task = process_pdf_to_audio.AsyncResult(task_id)
-        
-        if task.state == 'PENDING':
-            # For invalid task IDs, Celery returns PENDING but with no info
-            # We can check if this is a real pending task or invalid ID
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'stage': 'queued',
-                'progress': 0,
-                'message': 'Task is waiting to be processed'
-            }
-        elif task.state == 'PROGRESS':
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'stage': task.info.get('stage', 'processing'),
-                'progress': task.info.get('progress', 0),
-                'message': task.info.get('message', 'Processing...')
-            }
-        elif task.state == 'SUCCESS':
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'stage': 'completed',
-                'progress': 100,
-                'message': 'Processing completed successfully',
-                'result': task.result
-            }
-        else:  # FAILURE
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'stage': 'failed',
-                'progress': 0,
-                'message': str(task.info),
-                'error': str(task.info)
-            }
+        from tasks import encode_audio
+        # The pipeline's last stage runs under the task ID
+        task = encode_audio.AsyncResult(task_id)
         
-        return jsonify(response)
+        return jsonify(status_payload(task_id, task.state, task.info))
         
     except Exception as e:
         logger.error(f"Status check error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def fetch_task_states(task_ids):
+    """Fetch (state, info) for many tasks in one round trip to the result backend"""
+    backend = celery.backend
+    if not hasattr(backend, 'client') or not hasattr(backend, 'get_key_for_task'):
+        # Result backends other than Redis have no multi-get
+        return [(r.state, r.info) for r in (celery.AsyncResult(t) for t in task_ids)]
+    
+    raw_metas = backend.client.mget([backend.get_key_for_task(t) for t in task_ids])
+    states = []
+    for raw in raw_metas:
+        if raw is None:
+            states.append(('PENDING', None))
+        else:
+            meta = backend.decode_result(raw)
+            states.append((meta['status'], meta['result']))
+    return states
+
+def compact_status(task_id, state, info):
+    """Reduce a task's status to the fields dashboards need"""
+    status = status_payload(task_id, state, info)
+    compact = {
+        'state': status['state'],
+        'stage': status['stage'],
+        'progress': status['progress']
+    }
+    if state == 'SUCCESS' and isinstance(info, dict):
+        compact['audio_url'] = info.get('audio_url')
+    elif 'error' in status:
+        compact['error'] = status['error']
+    return compact
+
+@app.route('/status/batch', methods=['POST'])
+def get_batch_status():
+    """Get the status of many tasks in one request"""
+    try:
+        data = request.get_json(silent=True) or {}
+        task_ids = data.get('task_ids')
+        if not isinstance(task_ids, list) or not task_ids:
+            return jsonify({'error': 'task_ids must be a non-empty list'}), 400
+        if len(task_ids) > STATUS_BATCH_MAX:
+            return jsonify({'error': f'At most {STATUS_BATCH_MAX} task IDs per request'}), 400
+        
+        valid_ids = []
+        invalid_ids = []
+        for task_id in dict.fromkeys(map(str, task_ids)):
+            try:
+                uuid.UUID(task_id)
+                valid_ids.append(task_id)
+            except ValueError:
+                invalid_ids.append(task_id)
+        
+        states = fetch_task_states(valid_ids) if valid_ids else []
+        return jsonify({
+            'tasks': {
+                task_id: compact_status(task_id, state, info)
+                for task_id, (state, info) in zip(valid_ids, states)
+            },
+            'invalid': invalid_ids
+        })
+        
+    except Exception as e:
+        logger.error(f"Batch status error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/events/<task_id>', methods=['GET'])
+def get_task_events(task_id):
+    """Push status updates for a task as Server-Sent Events"""
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid task ID format'}), 400
+    
+    from tasks import encode_audio
+    
+    def snapshot():
+        task = encode_audio.AsyncResult(task_id)
+        return status_payload(task_id, task.state, task.info)
+    
+    return Response(
+        stream_with_context(progress_events(task_id, snapshot)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def find_audio_files(task_id):
+    """Return the audio files produced for a task, keyed by format"""
+    audio_files = {}
+    for audio_format in AUDIO_FORMATS:
+        audio_path = os.path.join(app.config['TEMP_FOLDER'], audio_filename(task_id, audio_format))
+        if os.path.exists(audio_path):
+            audio_files[audio_format] = audio_path
+    return audio_files
+
 @app.route('/audio/<task_id>', methods=['GET'])
 def get_audio(task_id):
-    """Stream or download the generated audio file"""
+    """Stream or download the generated audio file.
+    
+    The format is taken from the format query parameter, or else negotiated
+    from the Accept header among the formats already produced. A format not
+    produced yet is converted on the CPU queue, and the request is answered
+    with 202 and Retry-After until it is ready. Responses carry a strong ETag from
+    the content hash and support byte ranges and conditional requests.
+    Expired audio is removed by the cleanup service.
+    """
     try:
-        audio_path = os.path.join(app.config['TEMP_FOLDER'], f"{task_id}_audio.wav")
-        
-        if not os.path.exists(audio_path):
+        audio_files = find_audio_files(task_id)
+        if not audio_files:
             return jsonify({'error': 'Audio file not found'}), 404
         
-        # Check if file is too old (24 hours)
-        file_age = datetime.now() - datetime.fromtimestamp(os.path.getctime(audio_path))
-        if file_age > timedelta(hours=24):
-            os.remove(audio_path)
-            return jsonify({'error': 'Audio file has expired'}), 410
+        audio_format = request.args.get('format')
+        if audio_format:
+            audio_format = audio_format.lower()
+            if audio_format not in AUDIO_FORMATS:
+                return jsonify({'error': f'Unsupported audio format. Choose one of: {", ".join(AUDIO_FORMATS)}'}), 400
+            if audio_format not in audio_files:
+                request_conversion(task_id, audio_format)
+                response = jsonify({'status': 'converting', 'format': audio_format})
+                response.headers['Retry-After'] = str(CONVERSION_RETRY_AFTER)
+                return response, 202
+        else:
+            mimetype = request.accept_mimetypes.best_match(
+                [AUDIO_FORMATS[f]['mimetype'] for f in audio_files]
+            )
+            audio_format = next(
+                (f for f in audio_files if AUDIO_FORMATS[f]['mimetype'] == mimetype),
+                next(iter(audio_files))
+            )
         
         download = request.args.get('download', 'false').lower() == 'true'
+        audio_path = audio_files[audio_format]
+        etag = read_audio_etag(audio_path)
+        
+        if app.config['X_ACCEL_REDIRECT_PREFIX']:
+            response = accel_redirect(audio_path, audio_format, etag)
+        else:
+            # send_file sets Content-Length from the finished file on disk and
+            # answers Range, If-Range and If-None-Match against the ETag
+            response = send_file(
+                audio_path,
+                mimetype=AUDIO_FORMATS[audio_format]['mimetype'],
+                etag=etag,
+                conditional=True
+            )
+            response.headers['Accept-Ranges'] = 'bytes'
         
-        return send_file(
-            audio_path,
-            as_attachment=download,
-            download_name=f"audio_{task_id}.wav",
-            mimetype='audio/wav'
+        disposition = 'attachment' if download else 'inline'
+        response.headers.set(
+            'Content-Disposition', disposition,
+            filename=f"audio_{task_id}.{AUDIO_FORMATS[audio_format]['extension']}"
         )
+        response.vary.add('Accept')
+        return response
         
     except Exception as e:
         logger.error(f"Audio retrieval error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def request_conversion(task_id, audio_format):
+    """Queue a conversion of a task's audio unless one is already queued"""
+    from tasks import convert_audio
+    if get_redis().set(conversion_key(task_id, audio_format), 1, nx=True, ex=CONVERSION_TIMEOUT):
+        convert_audio.apply_async(args=(task_id, audio_format))
+
+def accel_redirect(audio_path, audio_format, etag):
+    """Hand an audio file to nginx through X-Accel-Redirect.
+    
+    Conditional requests are answered here, so a matching If-None-Match gets
+    a 304 without touching the file; nginx serves the bytes and byte ranges.
+    """
+    response = Response(mimetype=AUDIO_FORMATS[audio_format]['mimetype'])
+    response.set_etag(etag)
+    response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_REDIRECT_PREFIX'].rstrip('/') + '/' + os.path.basename(audio_path)
+    return response.make_conditional(request)
+
+def find_streamable_audio(task_id):
+    """Return (format, partial path, final path) of a task's audio, or None"""
+    for audio_format in AUDIO_FORMATS:
+        partial_path = os.path.join(app.config['TEMP_FOLDER'], partial_audio_filename(task_id, audio_format))
+        final_path = os.path.join(app.config['TEMP_FOLDER'], audio_filename(task_id, audio_format))
+        if os.path.exists(partial_path) or os.path.exists(final_path):
+            return audio_format, partial_path, final_path
+    return None
+
+def follow_audio(audio_format, partial_path, final_path):
+    """Yield an audio file's bytes as they are written, until it is complete.
+    
+    The task renames the partial file once synthesis finishes (or removes it
+    on failure), so the open file is read to its end once the partial name is
+    gone.
+    """
+    try:
+        audio_file = open(partial_path, 'rb')
+    except FileNotFoundError:
+        audio_file = open(final_path, 'rb')
+    
+    with audio_file:
+        # A WAV header announces the length, which is unknown until the end
+        if audio_format == 'wav':
+            header = b''
+            last_data = time.time()
+            while len(header) < WAV_HEADER_SIZE and time.time() - last_data < STREAM_IDLE_TIMEOUT:
+                data = audio_file.read(WAV_HEADER_SIZE - len(header))
+                if data:
+                    header += data
+                else:
+                    time.sleep(STREAM_POLL_INTERVAL)
+            yield streaming_wav_header(header)
+        
+        complete = False
+        last_data = time.time()
+        while True:
+            data = audio_file.read(STREAM_READ_SIZE)
+            if data:
+                last_data = time.time()
+                yield data
+                continue
+            
+            if complete or time.time() - last_data > STREAM_IDLE_TIMEOUT:
+                return
+            # Read once more after the rename to pick up the last bytes
+            complete = not os.path.exists(partial_path)
+            if not complete:
+                time.sleep(STREAM_POLL_INTERVAL)
+
+@app.route('/audio/<task_id>/stream', methods=['GET'])
+def stream_audio(task_id):
+    """Stream the audio of a task while it is still being synthesized.
+    
+    Until the task has written its first audio the request is answered with
+    202 and Retry-After, rather than held open waiting for it.
+    """
+    try:
+        try:
+            uuid.UUID(task_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid task ID format'}), 400
+        
+        # Finished audio is served as a regular file
+        if find_audio_files(task_id):
+            return get_audio(task_id)
+        
+        audio = find_streamable_audio(task_id)
+        if audio is None:
+            if celery.AsyncResult(task_id).state not in ('STARTED', 'PROGRESS'):
+                return jsonify({'error': 'Audio stream not found'}), 404
+            response = jsonify({'status': 'synthesizing'})
+            response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+            return response, 202
+        
+        audio_format, partial_path, final_path = audio
+        return Response(
+            stream_with_context(follow_audio(audio_format, partial_path, final_path)),
+            mimetype=AUDIO_FORMATS[audio_format]['mimetype'],
+            headers={
+                'Cache-Control': 'no-cache',
+                # Keep reverse proxies from buffering the stream
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        logger.error(f"Audio stream error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get result, math speech and GROBID TEI cache hit/miss counters"""
+    try:
+        return jsonify({
+            'results': ResultCache().stats(),
+            'math': MathSpeechCache().shared_stats(),
+            'tei': TEICache().stats()
+        })
+    except Exception as e:
+        logger.error(f"Cache stats error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/voices', methods=['GET'])
 def get_available_voices():
     """Get list of available voices and languages"""
@@ -248,7 +758,8 @@ def get_available_voices():
 
 @app.errorhandler(413)
 def too_large(e):
-    return jsonify({'error': 'File too large. Maximum size is 100MB.'}), 413
+    limit = request.max_content_length // (1024 * 1024)
+    return jsonify({'error': f'File too large. Maximum size is {limit}MB.'}), 413
 
 @app.errorhandler(404)
 def not_found(e):
@@ -0,0 +1,228 @@
+import io
+import os
+import wave
+import logging
+import tempfile
+import subprocess
+from cache import hash_file
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+DEFAULT_AUDIO_FORMAT = os.environ.get('DEFAULT_AUDIO_FORMAT', 'mp3')
+
+# Conversions requested through GET /audio/<id>?format= run on the CPU queue;
+# a Redis key per task and format keeps them from being queued twice
+CONVERSION_PREFIX = 'pdf2audio:convert:'
+CONVERSION_TIMEOUT = int(os.environ.get('CONVERSION_TIMEOUT', 600))
+
+# Output formats, in order of preference when the client accepts several.
+# Every format can be written while it is being encoded, so none of them
+# needs a seekable output (AAC is written as ADTS rather than MP4).
+AUDIO_FORMATS = {
+    'opus': {
+        'extension': 'opus',
+        'mimetype': 'audio/ogg',
+        'ffmpeg_args': ['-c:a', 'libopus', '-b:a', os.environ.get('OPUS_BITRATE', '32k'), '-ar', '24000', '-f', 'ogg']
+    },
+    'mp3': {
+        'extension': 'mp3',
+        'mimetype': 'audio/mpeg',
+        'ffmpeg_args': ['-c:a', 'libmp3lame', '-b:a', os.environ.get('MP3_BITRATE', '64k'), '-f', 'mp3']
+    },
+    'aac': {
+        'extension': 'aac',
+        'mimetype': 'audio/aac',
+        'ffmpeg_args': ['-c:a', 'aac', '-b:a', os.environ.get('AAC_BITRATE', '64k'), '-f', 'adts']
+    },
+    'wav': {
+        'extension': 'wav',
+        'mimetype': 'audio/wav',
+        'ffmpeg_args': ['-c:a', 'pcm_s16le', '-f', 'wav']
+    }
+}
+
+def audio_filename(task_id, audio_format):
+    """Name of the audio file produced for a task in the given format"""
+    return f"{task_id}_audio.{AUDIO_FORMATS[audio_format]['extension']}"
+
+def partial_audio_filename(task_id, audio_format):
+    """Name of the audio file while it is still being synthesized"""
+    return f"{task_id}_audio.part.{AUDIO_FORMATS[audio_format]['extension']}"
+
+def conversion_key(task_id, audio_format):
+    return f"{CONVERSION_PREFIX}{task_id}:{audio_format}"
+
+def conversion_source(audio_dir, task_id):
+    """The audio of a task to convert from, the lossless WAV if it exists"""
+    for audio_format in ('wav', *AUDIO_FORMATS):
+        audio_path = os.path.join(audio_dir, audio_filename(task_id, audio_format))
+        if os.path.exists(audio_path):
+            return audio_path
+    return None
+
+def partial_file(path):
+    """Create a uniquely named file next to path to write it under"""
+    fd, partial_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.part', dir=os.path.dirname(path))
+    os.close(fd)
+    return partial_path
+
+def etag_path(audio_path):
+    """Sidecar file holding the content hash of an audio file"""
+    return f"{audio_path}.sha256"
+
+def write_audio_etag(audio_path):
+    """Hash a finished audio file and store the hash next to it"""
+    etag = hash_file(audio_path)
+    partial_path = partial_file(etag_path(audio_path))
+    with open(partial_path, 'w') as f:
+        f.write(etag)
+    os.replace(partial_path, etag_path(audio_path))
+    return etag
+
+def read_audio_etag(audio_path):
+    """Return the content hash of an audio file, computing it on first use"""
+    try:
+        with open(etag_path(audio_path)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return write_audio_etag(audio_path)
+
+def streaming_wav_header(header):
+    """Rewrite a WAV header for a file whose final length is not yet known.
+    
+    The RIFF and data sizes are set to the maximum, which players treat as
+    "read until the end of the stream".
+    """
+    header = bytearray(header)
+    header[4:8] = b'\xff\xff\xff\xff'
+    data_offset = header.find(b'data', 12)
+    if data_offset >= 0:
+        header[data_offset + 4:data_offset + 8] = b'\xff\xff\xff\xff'
+    return bytes(header)
+
+class WavAppender:
+    """Append WAV chunks to a single output file.
+    
+    The PCM frames of each chunk are copied as-is, so nothing is re-decoded.
+    The wave module keeps the RIFF and data chunk sizes in the header up to
+    date on every write, and each chunk is flushed to disk, so the output is
+    a valid WAV file at all times and can be streamed while it grows.
+    """
+    
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.params = None
+        self.frames_written = 0
+        self._file = None
+        self._wav = None
+    
+    def append(self, wav_data):
+        """Append the frames of a WAV file given as bytes"""
+        with wave.open(io.BytesIO(wav_data), 'rb') as chunk:
+            params = (chunk.getnchannels(), chunk.getsampwidth(), chunk.getframerate())
+            
+            if self._wav is None:
+                self._file = open(self.output_path, 'wb')
+                self._wav = wave.open(self._file, 'wb')
+                self._wav.setnchannels(params[0])
+                self._wav.setsampwidth(params[1])
+                self._wav.setframerate(params[2])
+                self.params = params
+            elif params != self.params:
+                raise ValueError(f"WAV chunk format {params} does not match {self.params}")
+            
+            nframes = chunk.getnframes()
+            self._wav.writeframes(chunk.readframes(nframes))
+            self._file.flush()
+            self.frames_written += nframes
+    
+    @property
+    def duration(self):
+        """Duration of the audio written so far, in seconds"""
+        if not self.params:
+            return 0.0
+        return self.frames_written / self.params[2]
+    
+    def close(self):
+        if self._wav is not None:
+            self._wav.close()
+            self._file.close()
+            self._wav = None
+            self._file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def transcode_audio(source_path, output_path, audio_format, partial_path=None):
+    """Convert an audio file to another format.
+    
+    The output is written under partial_path, by default a unique name next
+    to output_path, and renamed into place, so a reader of output_path never
+    sees a partial file. Packets are flushed as they are encoded, so
+    partial_path can be streamed while it grows.
+    """
+    partial_path = partial_path or partial_file(output_path)
+    cmd = [
+        FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', source_path,
+        *AUDIO_FORMATS[audio_format]['ffmpeg_args'],
+        '-flush_packets', '1',
+        partial_path
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        os.replace(partial_path, output_path)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.decode('utf-8', errors='replace').strip()}")
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+def ffmetadata_escape(value):
+    """Escape a value for an FFMETADATA file"""
+    return ''.join('\\' + c if c in '=;#\\\n' else c for c in str(value))
+
+def concat_audio(source_paths, chapters, output_path, audio_format):
+    """Join audio files into one, with a chapter marker per source.
+    
+    chapters is a list of (title, start, end) in seconds. Chapters are
+    embedded where the container supports them (ID3 CHAP frames in MP3,
+    Vorbis comments in Ogg); ADTS and WAV have nowhere to keep them. The
+    output is renamed into place once complete.
+    """
+    partial_path = partial_file(output_path)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        list_path = os.path.join(temp_dir, 'inputs.txt')
+        with open(list_path, 'w') as f:
+            for path in source_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        
+        metadata_path = os.path.join(temp_dir, 'chapters.txt')
+        with open(metadata_path, 'w') as f:
+            f.write(';FFMETADATA1\n')
+            for title, start, end in chapters:
+                f.write('[CHAPTER]\nTIMEBASE=1/1000\n')
+                f.write(f"START={int(start * 1000)}\nEND={int(end * 1000)}\n")
+                f.write(f"title={ffmetadata_escape(title)}\n")
+        
+        cmd = [
+            FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-f', 'ffmetadata', '-i', metadata_path,
+            '-map', '0:a', '-map_metadata', '1', '-map_chapters', '1',
+            *AUDIO_FORMATS[audio_format]['ffmpeg_args'],
+            partial_path
+        ]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True)
+            os.replace(partial_path, output_path)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"ffmpeg failed: {e.stderr.decode('utf-8', errors='replace').strip()}")
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import logging
+from cache import get_redis, RESULT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+BATCH_PREFIX = 'pdf2audio:batch:'
+
+# Batch records live as long as the audio they describe
+BATCH_TTL = RESULT_CACHE_TTL
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 50))
+
+def create_batch(batch_id, documents, audio_format, combine):
+    """Record a batch job and its child tasks.
+    
+    documents is a list of dicts with the task_id and filename of each child,
+    in reading order.
+    """
+    batch = {
+        'batch_id': batch_id,
+        'documents': documents,
+        'format': audio_format,
+        'combine': combine,
+        'combined': None,
+        'created_at': time.time()
+    }
+    get_redis().set(f"{BATCH_PREFIX}{batch_id}", json.dumps(batch), ex=BATCH_TTL)
+    return batch
+
+def get_batch(batch_id):
+    """Return a batch record, or None if it does not exist or has expired"""
+    raw = get_redis().get(f"{BATCH_PREFIX}{batch_id}")
+    return json.loads(raw) if raw else None
+
+def update_batch(batch_id, **fields):
+    """Update fields of a batch record, keeping its expiry"""
+    key = f"{BATCH_PREFIX}{batch_id}"
+    client = get_redis()
+    raw = client.get(key)
+    if not raw:
+        logger.warning(f"Batch {batch_id} not found for update")
+        return None
+    batch = dict(json.loads(raw), **fields)
+    client.set(key, json.dumps(batch), keepttl=True)
+    return batch
+
+def aggregate_status(batch, children, combined_ready):
+    """Summarize the compact statuses of a batch's children.
+    
+    The batch completes when every child has completed and, if requested,
+    the combined audio has been written.
+    """
+    total = len(children)
+    completed = sum(1 for c in children if c['state'] == 'SUCCESS')
+    failed = sum(1 for c in children if c['state'] == 'FAILURE')
+    progress = sum(c['progress'] for c in children) / total if total else 0
+    
+    if completed + failed < total:
+        state = 'PROGRESS' if any(c['state'] != 'PENDING' for c in children) else 'PENDING'
+    elif failed == total:
+        state = 'FAILURE'
+    elif failed:
+        state = 'PARTIAL'
+    elif batch['combine'] and not combined_ready:
+        # Every document is done; only the combined file is missing
+        state = 'PROGRESS'
+        progress = 99
+    else:
+        state = 'SUCCESS'
+    
+    return {
+        'state': state,
+        'progress': int(progress),
+        'total': total,
+        'completed': completed,
+        'failed': failed
+    }
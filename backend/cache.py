@@ -0,0 +1,448 @@
+import os
+import io
+import gzip
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+import redis
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Redis connection shared by the Flask app and the Celery workers
+REDIS_URL = os.environ.get('REDIS_URL', os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
+
+# Result cache configuration. The TTL matches the cleanup service so cache
+# entries never outlive the audio files they point at.
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL_HOURS', os.environ.get('TTL_HOURS', 24))) * 3600
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1000))
+
+# MathML speech cache configuration
+MATH_CACHE_LOCAL_SIZE = int(os.environ.get('MATH_CACHE_LOCAL_SIZE', 10000))
+MATH_CACHE_TTL = int(os.environ.get('MATH_CACHE_TTL_DAYS', 30)) * 86400
+
+# GROBID TEI cache configuration. GROBID is the slowest service, so its output
+# is kept far longer than the audio and shared by every job for the same PDF.
+TEI_CACHE_TTL = int(os.environ.get('TEI_CACHE_TTL_DAYS', 30)) * 86400
+TEI_CACHE_MAX_BYTES = int(os.environ.get('TEI_CACHE_MAX_BYTES', 8 * 1024 * 1024))  # Compressed
+# How long a GROBID request for a PDF may hold off other jobs for the same PDF
+TEI_LOCK_TIMEOUT = int(os.environ.get('TEI_LOCK_TIMEOUT', 600))
+TEI_WAIT_INTERVAL = float(os.environ.get('TEI_WAIT_INTERVAL', 1))
+# Bump when the GROBID version or request options change
+TEI_CACHE_VERSION = os.environ.get('TEI_CACHE_VERSION', '0.8.0')
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Attributes that label an expression but do not change how it is spoken
+MATHML_IGNORED_ATTRIBUTES = {'id', 'class', 'style', 'href'}
+
+_redis_client = None
+
+def get_redis():
+    """Return a lazily created, process-wide Redis client"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+def hash_file(file_path):
+    """Compute the SHA-256 of a file without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_result_key(pdf_hash, voice_settings):
+    """Build a cache key from the PDF hash and the voice settings"""
+    settings = json.dumps(voice_settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{pdf_hash}:{settings}".encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """Content-addressed cache of finished audio, stored in Redis.
+    
+    Each entry maps a result key to the task that produced the audio. Entries
+    expire after RESULT_CACHE_TTL and the least recently used ones are evicted
+    once RESULT_CACHE_MAX_ENTRIES is exceeded. A hit links the cached audio
+    under the new task ID and refreshes its mtime, so the cleanup service only
+    removes audio that has not been requested for TTL_HOURS.
+    """
+    
+    ENTRY_PREFIX = 'pdf2audio:result:'
+    LRU_KEY = 'pdf2audio:result:lru'
+    STATS_KEY = 'pdf2audio:result:stats'
+    
+    def __init__(self, client=None, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.client = client or get_redis()
+        self.ttl = ttl
+        self.max_entries = max_entries
+    
+    def _entry_key(self, key):
+        return f"{self.ENTRY_PREFIX}{key}"
+    
+    def get(self, key):
+        """Return the cached entry for key, or None on a miss"""
+        try:
+            raw = self.client.get(self._entry_key(key))
+            entry = json.loads(raw) if raw else None
+            
+            # The cleanup service may have removed the audio behind our back
+            if entry and not os.path.exists(entry['audio_path']):
+                self.delete(key)
+                entry = None
+            
+            self.client.hincrby(self.STATS_KEY, 'hits' if entry else 'misses', 1)
+            return entry
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            return None
+    
+    def put(self, key, task_id, audio_path, result):
+        """Store a finished result and evict the least recently used entries"""
+        try:
+            entry = {
+                'task_id': task_id,
+                'audio_path': audio_path,
+                'result': result,
+                'created_at': time.time()
+            }
+            pipe = self.client.pipeline()
+            pipe.set(self._entry_key(key), json.dumps(entry), ex=self.ttl)
+            pipe.zadd(self.LRU_KEY, {key: time.time()})
+            pipe.execute()
+            self._evict()
+        except Exception as e:
+            logger.warning(f"Result cache store failed: {e}")
+    
+    def delete(self, key):
+        """Drop a single entry"""
+        pipe = self.client.pipeline()
+        pipe.delete(self._entry_key(key))
+        pipe.zrem(self.LRU_KEY, key)
+        pipe.execute()
+    
+    def link(self, key, entry, task_id, audio_path):
+        """Serve a cached entry under a new task ID.
+        
+        The audio is hard-linked (no copy) to audio_path and the entry is
+        repointed at the new link, so it survives the cleanup of older links.
+        """
+        try:
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+            os.link(entry['audio_path'], audio_path)
+            os.utime(audio_path)
+        except OSError as e:
+            logger.warning(f"Result cache link failed: {e}")
+            self.delete(key)
+            return None
+        
+        result = dict(entry['result'], audio_url=f"/audio/{task_id}", cached=True)
+        entry = dict(entry, task_id=task_id, audio_path=audio_path)
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(self._entry_key(key), json.dumps(entry), ex=self.ttl)
+            pipe.zadd(self.LRU_KEY, {key: time.time()})
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Result cache refresh failed: {e}")
+        return result
+    
+    def _evict(self):
+        """Trim the cache down to max_entries, oldest access first"""
+        # Entries that expired through their TTL leave stale LRU members behind
+        self.client.zremrangebyscore(self.LRU_KEY, '-inf', time.time() - self.ttl)
+        
+        excess = self.client.zcard(self.LRU_KEY) - self.max_entries
+        if excess <= 0:
+            return
+        
+        evicted = self.client.zpopmin(self.LRU_KEY, excess)
+        if evicted:
+            self.client.delete(*[self._entry_key(k.decode('utf-8')) for k, _ in evicted])
+            self.client.hincrby(self.STATS_KEY, 'evictions', len(evicted))
+    
+    def stats(self):
+        """Return hit/miss counters and the current entry count"""
+        counters = {k.decode('utf-8'): int(v) for k, v in self.client.hgetall(self.STATS_KEY).items()}
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'entries': self.client.zcard(self.LRU_KEY),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl
+        }
+
+def make_tei_key(pdf_hash, pages=None):
+    """Build a TEI cache key from the PDF hash and the pages sent to GROBID"""
+    scope = ','.join(str(page) for page in pages) if pages else 'all'
+    return hashlib.sha256(f"{TEI_CACHE_VERSION}:{pdf_hash}:{scope}".encode('utf-8')).hexdigest()
+
+class TEICache:
+    """Gzipped GROBID output, stored in Redis, with single-flight requests.
+    
+    fetch() serves TEI from the cache, or runs GROBID while holding a Redis
+    lock for the key, so jobs for the same PDF that run at the same time wait
+    for the first one's request instead of sending their own. If the lock
+    holder fails, the next waiter takes the lock and tries itself. Entries
+    expire after TEI_CACHE_TTL; TEI larger than max_bytes once compressed is
+    not cached.
+    """
+    
+    ENTRY_PREFIX = 'pdf2audio:tei:'
+    LOCK_PREFIX = 'pdf2audio:tei:lock:'
+    STATS_KEY = 'pdf2audio:tei:stats'
+    
+    def __init__(self, client=None, ttl=TEI_CACHE_TTL, max_bytes=TEI_CACHE_MAX_BYTES,
+                 lock_timeout=TEI_LOCK_TIMEOUT, wait_interval=TEI_WAIT_INTERVAL):
+        self.client = client or get_redis()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.wait_interval = wait_interval
+    
+    def fetch(self, key, output_path, produce):
+        """Write the TEI for key to output_path.
+        
+        produce(output_path) runs GROBID on a miss and returns output_path, or
+        None on failure. Returns output_path, or None if no TEI was produced.
+        """
+        lock_key = f"{self.LOCK_PREFIX}{key}"
+        token = uuid.uuid4().hex
+        locked = False
+        waited = False
+        deadline = time.time() + self.lock_timeout
+        try:
+            while True:
+                if self.load(key, output_path):
+                    self._count('coalesced' if waited else 'hits')
+                    return output_path
+                
+                if self.client.set(lock_key, token, nx=True, ex=self.lock_timeout):
+                    locked = True
+                    break
+                # A lock holder that died lets its lock expire; past that,
+                # stop waiting and run GROBID regardless
+                if time.time() >= deadline:
+                    logger.warning(f"Gave up waiting for GROBID output of {key}")
+                    break
+                waited = True
+                time.sleep(self.wait_interval)
+        except Exception as e:
+            logger.warning(f"TEI cache lookup failed: {e}")
+        
+        self._count('misses')
+        try:
+            result = produce(output_path)
+            if result:
+                self.store(key, output_path)
+            return result
+        finally:
+            if locked:
+                self._unlock(lock_key, token)
+    
+    def _unlock(self, lock_key, token):
+        """Release the lock unless it expired and another job holds it now"""
+        try:
+            # Not atomic, but the worst a race here costs is one extra GROBID
+            # request, and it needs no Lua scripting
+            if self.client.get(lock_key) == token.encode('utf-8'):
+                self.client.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"TEI cache lock release failed: {e}")
+    
+    def load(self, key, output_path):
+        """Write a cached entry to output_path; False on a miss"""
+        compressed = self.client.get(f"{self.ENTRY_PREFIX}{key}")
+        if compressed is None:
+            return False
+        with gzip.GzipFile(fileobj=io.BytesIO(compressed)) as source, open(output_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        return True
+    
+    def store(self, key, tei_path):
+        """Compress and cache the TEI in tei_path"""
+        try:
+            buffer = io.BytesIO()
+            with open(tei_path, 'rb') as source, gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as target:
+                shutil.copyfileobj(source, target)
+            if buffer.tell() > self.max_bytes:
+                logger.info(f"TEI for {key} is too large to cache ({buffer.tell()} bytes compressed)")
+                return
+            self.client.set(f"{self.ENTRY_PREFIX}{key}", buffer.getvalue(), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"TEI cache store failed: {e}")
+    
+    def _count(self, outcome):
+        try:
+            self.client.hincrby(self.STATS_KEY, outcome, 1)
+        except Exception as e:
+            logger.debug(f"TEI cache stats update failed: {e}")
+    
+    def stats(self):
+        """Return hit, coalesced and miss counters aggregated over all workers"""
+        counters = {k.decode('utf-8'): int(v) for k, v in self.client.hgetall(self.STATS_KEY).items()}
+        counters = {name: counters.get(name, 0) for name in ('hits', 'coalesced', 'misses')}
+        served = counters['hits'] + counters['coalesced']
+        lookups = served + counters['misses']
+        return dict(
+            counters,
+            hit_rate=round(served / lookups, 4) if lookups else 0.0,
+            ttl_seconds=self.ttl
+        )
+
+def canonicalize_mathml(mathml):
+    """Serialize MathML in a canonical form for use as a cache key.
+    
+    Namespace prefixes and declarations are dropped, insignificant whitespace
+    is stripped and attributes are sorted, so the same expression written by
+    different tools maps to the same string.
+    """
+    try:
+        root = etree.fromstring(mathml.encode('utf-8'))
+    except etree.XMLSyntaxError:
+        return " ".join(mathml.split())
+    
+    parts = []
+    
+    def serialize(elem):
+        tag = etree.QName(elem).localname
+        attributes = sorted(
+            (etree.QName(name).localname, " ".join(value.split()))
+            for name, value in elem.attrib.items()
+            if etree.QName(name).localname not in MATHML_IGNORED_ATTRIBUTES
+        )
+        parts.append(f"<{tag}" + "".join(f" {name}={quoteattr(value)}" for name, value in attributes) + ">")
+        if elem.text and elem.text.strip():
+            parts.append(escape(" ".join(elem.text.split())))
+        for child in elem:
+            # Skip comments and processing instructions
+            if isinstance(child.tag, str):
+                serialize(child)
+            if child.tail and child.tail.strip():
+                parts.append(escape(" ".join(child.tail.split())))
+        parts.append(f"</{tag}>")
+    
+    serialize(root)
+    return "".join(parts)
+
+class MathSpeechCache:
+    """Two-tier cache of MathML speech: an in-process LRU in front of Redis.
+    
+    Keys combine the canonical MathML with the SRE domain and style. Hit and
+    miss counters are kept per process and aggregated in Redis.
+    """
+    
+    KEY_PREFIX = 'pdf2audio:math:'
+    STATS_KEY = 'pdf2audio:math:stats'
+    
+    def __init__(self, client=None, local_size=MATH_CACHE_LOCAL_SIZE, ttl=MATH_CACHE_TTL):
+        self.client = client or get_redis()
+        self.local_size = local_size
+        self.ttl = ttl
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'redis_hits': 0, 'misses': 0}
+    
+    def make_key(self, mathml, domain, style):
+        canonical = canonicalize_mathml(mathml)
+        return hashlib.sha256(f"{domain}:{style}:{canonical}".encode('utf-8')).hexdigest()
+    
+    def get_many(self, keys):
+        """Look up keys, returning a dict of the ones found"""
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.local:
+                    self.local.move_to_end(key)
+                    found[key] = self.local[key]
+        local_hits = len(found)
+        
+        remote = [k for k in dict.fromkeys(keys) if k not in found]
+        if remote:
+            try:
+                values = self.client.mget([f"{self.KEY_PREFIX}{k}" for k in remote])
+                for key, value in zip(remote, values):
+                    if value is not None:
+                        found[key] = value.decode('utf-8')
+                        self._remember(key, found[key])
+            except Exception as e:
+                logger.warning(f"Math cache lookup failed: {e}")
+        
+        redis_hits = len(found) - local_hits
+        self._count(local_hits=local_hits, redis_hits=redis_hits, misses=len(remote) - redis_hits)
+        return found
+    
+    def set_many(self, mapping):
+        """Store speech for several keys in both tiers"""
+        for key, speech in mapping.items():
+            self._remember(key, speech)
+        
+        if not mapping:
+            return
+        try:
+            pipe = self.client.pipeline()
+            for key, speech in mapping.items():
+                pipe.set(f"{self.KEY_PREFIX}{key}", speech, ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Math cache store failed: {e}")
+    
+    def _remember(self, key, speech):
+        with self.lock:
+            self.local[key] = speech
+            self.local.move_to_end(key)
+            while len(self.local) > self.local_size:
+                self.local.popitem(last=False)
+    
+    def _count(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.counters[name] += value
+        try:
+            pipe = self.client.pipeline()
+            for name, value in counts.items():
+                if value:
+                    pipe.hincrby(self.STATS_KEY, name, value)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Math cache stats update failed: {e}")
+    
+    @staticmethod
+    def _hit_rate(counters):
+        hits = counters.get('local_hits', 0) + counters.get('redis_hits', 0)
+        lookups = hits + counters.get('misses', 0)
+        return round(hits / lookups, 4) if lookups else 0.0
+    
+    def stats(self):
+        """Return hit/miss counters for this process"""
+        with self.lock:
+            counters = dict(self.counters)
+            local_entries = len(self.local)
+        return dict(counters, hit_rate=self._hit_rate(counters), local_entries=local_entries)
+    
+    def shared_stats(self):
+        """Return hit/miss counters aggregated over all processes"""
+        counters = {k.decode('utf-8'): int(v) for k, v in self.client.hgetall(self.STATS_KEY).items()}
+        counters = {name: counters.get(name, 0) for name in ('local_hits', 'redis_hits', 'misses')}
+        return dict(counters, hit_rate=self._hit_rate(counters))
+
+_math_cache = None
+
+def get_math_cache():
+    """Return the process-wide MathML speech cache"""
+    global _math_cache
+    if _math_cache is None:
+        _math_cache = MathSpeechCache()
+    return _math_cache
@@ -0,0 +1,9 @@
+# Loaded by gunicorn from the working directory, on top of the command line
+
+from metrics import reset_multiprocess_dir, mark_process_dead
+
+def on_starting(server):
+    reset_multiprocess_dir()
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
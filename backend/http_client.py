@@ -0,0 +1,83 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection to any service
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF', 0.5))
+
+# Responses that mean "busy, try again": GROBID answers 503 when all of its
+# threads are taken
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Per-service settings. max_connections caps the connections each worker
+# process keeps open to the service; callers beyond it wait for a free
+# connection. timeout is the read timeout of one request.
+SERVICES = {
+    'grobid': {
+        'max_connections': int(os.environ.get('GROBID_MAX_CONNECTIONS', 2)),
+        'timeout': float(os.environ.get('GROBID_TIMEOUT', 300)),
+        'retries': int(os.environ.get('GROBID_RETRIES', 3))
+    },
+    'piper': {
+        'max_connections': int(os.environ.get('PIPER_MAX_CONNECTIONS', os.environ.get('PIPER_MAX_WORKERS', 4))),
+        'timeout': float(os.environ.get('PIPER_TIMEOUT', 120)),
+        'retries': int(os.environ.get('PIPER_RETRIES', 3))
+    },
+    # Math speech falls back to local SRE, so failures are not retried for long
+    'sre': {
+        'max_connections': int(os.environ.get('SRE_MAX_CONNECTIONS', os.environ.get('SRE_CONCURRENCY', 2))),
+        'timeout': float(os.environ.get('SRE_TIMEOUT', 60)),
+        'retries': int(os.environ.get('SRE_RETRIES', 1))
+    }
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Pooled connections must not be shared with forked Celery worker processes
+os.register_at_fork(after_in_child=_sessions.clear)
+
+def create_session(service):
+    """Create a keep-alive session with pooling and retries for a service"""
+    config = SERVICES[service]
+    retry = Retry(
+        total=config['retries'],
+        connect=config['retries'],
+        status=config['retries'],
+        # A request that timed out reading has already cost a full timeout
+        read=0,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        # Conversion requests have no side effects, so POSTs are retried too
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=config['max_connections'],
+        pool_block=True,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_session(service):
+    """Return this process's shared session for a service"""
+    with _sessions_lock:
+        session = _sessions.get(service)
+        if session is None:
+            session = _sessions[service] = create_session(service)
+        return session
+
+def service_timeout(service):
+    """(connect, read) timeout for requests to a service"""
+    return (HTTP_CONNECT_TIMEOUT, SERVICES[service]['timeout'])
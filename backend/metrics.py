@@ -0,0 +1,155 @@
+import os
+import time
+import shutil
+import logging
+from contextlib import contextmanager
+from celery.signals import before_task_publish, task_prerun, task_postrun, worker_init, worker_process_shutdown
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+    generate_latest, multiprocess, start_http_server
+)
+
+logger = logging.getLogger(__name__)
+
+# Gunicorn and Celery run several processes, so metrics are kept in files
+# under PROMETHEUS_MULTIPROC_DIR and summed over all of them when scraped.
+# Without it, each process only reports its own.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Celery workers have no web server; their main process serves /metrics here
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 9808))
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1KB to 1GB
+
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+STAGE_DURATION = Histogram(
+    'pdf2audio_stage_duration_seconds',
+    'Time spent in each processing step: grobid, tei_parse, sre, sre_local, piper, encode',
+    ['stage'], buckets=DURATION_BUCKETS
+)
+STAGE_FAILURES = Counter(
+    'pdf2audio_stage_failures_total',
+    'Processing steps that failed',
+    ['stage']
+)
+TASK_DURATION = Histogram(
+    'pdf2audio_task_duration_seconds',
+    'Run time of each Celery task',
+    ['task'], buckets=DURATION_BUCKETS
+)
+TASK_RUNS = Counter(
+    'pdf2audio_task_runs_total',
+    'Celery task runs by final state',
+    ['task', 'state']
+)
+QUEUE_WAIT = Histogram(
+    'pdf2audio_queue_wait_seconds',
+    'Time tasks spent queued before a worker started them',
+    ['queue'], buckets=DURATION_BUCKETS
+)
+DOCUMENT_DURATION = Histogram(
+    'pdf2audio_document_duration_seconds',
+    'Time from upload to finished audio',
+    ['format'], buckets=DURATION_BUCKETS
+)
+ARTIFACT_BYTES = Histogram(
+    'pdf2audio_artifact_bytes',
+    'Size of uploads and of the files passed between stages',
+    ['artifact'], buckets=SIZE_BUCKETS
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'pdf2audio_http_request_duration_seconds',
+    'Time to handle API requests, up to the start of streamed responses',
+    ['endpoint', 'method', 'status'], buckets=DURATION_BUCKETS
+)
+
+def observe_stage(stage, started, failed=False):
+    """Record a processing step that began at started (a perf_counter value)"""
+    STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+    if failed:
+        STAGE_FAILURES.labels(stage).inc()
+
+@contextmanager
+def timed(stage):
+    """Record the duration of a block as a processing step, failed if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        observe_stage(stage, started, failed=True)
+        raise
+    observe_stage(stage, started)
+
+def observe_artifact(artifact, path):
+    """Record the size of a file produced by a stage"""
+    try:
+        ARTIFACT_BYTES.labels(artifact).observe(os.path.getsize(path))
+    except OSError:
+        pass
+
+def registry():
+    """The registry to expose: all processes' metrics in multiprocess mode"""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+def render_metrics():
+    return generate_latest(registry())
+
+def reset_multiprocess_dir():
+    """Remove metric files left by an earlier run of the server or worker"""
+    if MULTIPROC_DIR:
+        shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+def mark_process_dead(pid):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+# Task timings. Publishers stamp each message, so a worker can tell how long
+# the task waited in its queue; chain stages are published by the worker
+# that ran the previous stage.
+_task_started = {}
+
+@before_task_publish.connect
+def stamp_published(headers=None, **extra):
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **extra):
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        queue = (task.request.delivery_info or {}).get('routing_key') or 'unknown'
+        QUEUE_WAIT.labels(queue).observe(max(0, time.time() - published_at))
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **extra):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task.name).observe(time.perf_counter() - started)
+    TASK_RUNS.labels(task.name, state or 'UNKNOWN').inc()
+
+@worker_init.connect
+def serve_worker_metrics(**extra):
+    """Serve the worker's metrics from its main process"""
+    reset_multiprocess_dir()
+    if not WORKER_METRICS_PORT:
+        return
+    try:
+        start_http_server(WORKER_METRICS_PORT, registry=registry())
+        logger.info(f"Serving worker metrics on port {WORKER_METRICS_PORT}")
+    except OSError as e:
+        logger.warning(f"Could not serve worker metrics on port {WORKER_METRICS_PORT}: {e}")
+
+@worker_process_shutdown.connect
+def forget_worker_process(pid=None, **extra):
+    mark_process_dead(pid or os.getpid())
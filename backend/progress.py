@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import logging
+from cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'pdf2audio:progress:'
+TERMINAL_STATES = {'SUCCESS', 'FAILURE'}
+
+# Server-Sent Events configuration
+SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 3000))
+# Streams hold a gevent greenlet and a Redis connection, so they are closed
+# after SSE_MAX_DURATION, or SSE_IDLE_TIMEOUT without an update (a task ID that
+# was never submitted stays PENDING forever). Clients are told to reconnect
+# after SSE_TIMEOUT_RETRY_MS.
+SSE_MAX_DURATION = int(os.environ.get('SSE_MAX_DURATION', 3600))
+SSE_IDLE_TIMEOUT = int(os.environ.get('SSE_IDLE_TIMEOUT', 600))
+SSE_TIMEOUT_RETRY_MS = int(os.environ.get('SSE_TIMEOUT_RETRY_MS', 30000))
+
+def progress_channel(task_id):
+    return f"{CHANNEL_PREFIX}{task_id}"
+
+def status_payload(task_id, state, info):
+    """Build the status body shared by /status, /events and progress messages.
+    
+    info is the task's progress meta while it runs, its result on success and
+    the error on failure.
+    """
+    if state in ('PENDING', 'STARTED'):
+        return {
+            'task_id': task_id,
+            'state': state,
+            'stage': 'queued',
+            'progress': 0,
+            'message': 'Task is waiting to be processed' if state == 'PENDING' else 'Processing started'
+        }
+    elif state == 'PROGRESS':
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'stage': info.get('stage', 'processing'),
+            'progress': info.get('progress', 0),
+            'message': info.get('message', 'Processing...')
+        }
+        if 'section' in info:
+            response['section'] = info['section']
+        # The stream follows the encoded file once synthesis is done
+        if response['stage'] in ('synthesizing', 'encoding'):
+            response['stream_url'] = f"/audio/{task_id}/stream"
+        return response
+    elif state == 'SUCCESS':
+        return {
+            'task_id': task_id,
+            'state': state,
+            'stage': 'completed',
+            'progress': 100,
+            'message': 'Processing completed successfully',
+            'result': info
+        }
+    else:  # FAILURE
+        return {
+            'task_id': task_id,
+            'state': state,
+            'stage': 'failed',
+            'progress': 0,
+            'message': str(info),
+            'error': str(info)
+        }
+
+def publish_progress(task_id, payload):
+    """Push a status update to everyone subscribed to the task"""
+    try:
+        get_redis().publish(progress_channel(task_id), json.dumps(payload))
+    except Exception as e:
+        logger.warning(f"Progress publish failed for {task_id}: {e}")
+
+def format_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+def progress_events(task_id, get_snapshot):
+    """Yield Server-Sent Events with a task's status until it finishes.
+    
+    The channel is subscribed before get_snapshot is called, so no update
+    published in between is lost. A comment line is sent when nothing
+    happens for SSE_HEARTBEAT_INTERVAL seconds, to keep proxies from closing
+    the connection, and the snapshot is taken again: a task publishes its
+    final state before Celery stores it, so a client that subscribed in
+    between only sees the task finish in the result backend. Streams that pass SSE_MAX_DURATION or SSE_IDLE_TIMEOUT end
+    with a retry hint, and the client's reconnect starts from a new snapshot.
+    """
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(progress_channel(task_id))
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        
+        payload = get_snapshot()
+        yield format_event(payload)
+        
+        started = last_update = time.monotonic()
+        while payload['state'] not in TERMINAL_STATES:
+            now = time.monotonic()
+            if now - started >= SSE_MAX_DURATION or now - last_update >= SSE_IDLE_TIMEOUT:
+                logger.info(f"Closing event stream for {task_id} after {now - started:.0f}s")
+                yield f"retry: {SSE_TIMEOUT_RETRY_MS}\n\n"
+                return
+            
+            message = pubsub.get_message(timeout=SSE_HEARTBEAT_INTERVAL)
+            if message is None:
+                yield ": keepalive\n\n"
+                snapshot = get_snapshot()
+                if snapshot['state'] in TERMINAL_STATES:
+                    yield format_event(snapshot)
+                    return
+                continue
+            last_update = time.monotonic()
+            payload = json.loads(message['data'])
+            yield format_event(payload)
+    finally:
+        pubsub.close()
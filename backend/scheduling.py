@@ -0,0 +1,75 @@
+import os
+import logging
+from cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Queues. Each pipeline stage has its own queue, so workers for each stage
+# can be scaled separately: extraction waits on GROBID, math speech on SRE
+# and synthesis on Piper, while encoding (and joining batch audio) with
+# ffmpeg is CPU-bound. Long documents take their extraction and synthesis
+# from queues of their own, so a backlog of long documents never holds up a
+# short paper. Workers choose queues with -Q.
+EXTRACT_QUEUE = os.environ.get('EXTRACT_QUEUE', 'extract')
+TEXT_QUEUE = os.environ.get('TEXT_QUEUE', 'text')
+SYNTHESIZE_QUEUE = os.environ.get('SYNTHESIZE_QUEUE', 'synthesize')
+CPU_QUEUE = os.environ.get('CPU_QUEUE', 'cpu')
+LONG_QUEUE_SUFFIX = '.long'
+LONG_DOCUMENT_PAGES = int(os.environ.get('LONG_DOCUMENT_PAGES', 40))
+
+STAGE_QUEUES = {
+    'tasks.extract_document': EXTRACT_QUEUE,
+    'tasks.speak_mathematics': TEXT_QUEUE,
+    'tasks.synthesize_document': SYNTHESIZE_QUEUE,
+    'tasks.encode_audio': CPU_QUEUE,
+}
+LENGTH_SPLIT_STAGES = {'tasks.extract_document', 'tasks.synthesize_document'}
+
+# Per-client fair share. Each client's queued documents are counted, and every
+# FAIR_SHARE_STEP documents a client already has waiting lower the priority of
+# its next one, so a new client's upload overtakes the tail of a large batch.
+# The Redis transport serves priority 0 first and groups priorities into
+# these steps.
+PRIORITY_STEPS = [0, 3, 6, 9]
+FAIR_SHARE_STEP = int(os.environ.get('FAIR_SHARE_STEP', 2))
+CLIENT_PREFIX = 'pdf2audio:client:'
+
+# Counters of clients whose tasks were lost (e.g. a purged queue) expire
+CLIENT_COUNTER_TTL = 6 * 3600
+
+def client_id(request):
+    """Identify the client an upload is scheduled for"""
+    return request.headers.get('X-Client-ID') or request.remote_addr or 'anonymous'
+
+def document_queues(page_count):
+    """Map each pipeline stage to its queue for a document of page_count pages"""
+    if page_count < LONG_DOCUMENT_PAGES:
+        return dict(STAGE_QUEUES)
+    return {
+        stage: queue + LONG_QUEUE_SUFFIX if stage in LENGTH_SPLIT_STAGES else queue
+        for stage, queue in STAGE_QUEUES.items()
+    }
+
+def claim_priority(client):
+    """Count a queued document against client and return its priority"""
+    try:
+        key = f"{CLIENT_PREFIX}{client}"
+        pipe = get_redis().pipeline()
+        pipe.incr(key)
+        pipe.expire(key, CLIENT_COUNTER_TTL)
+        queued = pipe.execute()[0]
+    except Exception as e:
+        logger.warning(f"Fair share accounting failed: {e}")
+        return PRIORITY_STEPS[0]
+    
+    level = min((queued - 1) // FAIR_SHARE_STEP, len(PRIORITY_STEPS) - 1)
+    return PRIORITY_STEPS[level]
+
+def release_client(client):
+    """Stop counting a finished document against client"""
+    try:
+        key = f"{CLIENT_PREFIX}{client}"
+        if get_redis().decr(key) <= 0:
+            get_redis().delete(key)
+    except Exception as e:
+        logger.warning(f"Fair share accounting failed: {e}")
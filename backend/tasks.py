@@ -3,13 +3,29 @@ import logging
 import requests
 import time
 import subprocess
-from celery import Celery
+from celery import Celery, chain
+from celery.signals import task_postrun
 from lxml import etree
 import PyPDF2
 import pytesseract
-from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
 import tempfile
 import json
+import re
+from collections import deque
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from cache import ResultCache, TEICache, get_math_cache, get_redis, hash_file, make_tei_key
+from progress import publish_progress, status_payload
+from audio import (
+    DEFAULT_AUDIO_FORMAT, WavAppender, audio_filename, partial_audio_filename, write_audio_etag,
+    concat_audio, transcode_audio, conversion_key, conversion_source
+)
+from batches import update_batch
+from scheduling import release_client
+from http_client import get_session, service_timeout
+from metrics import DOCUMENT_DURATION, observe_stage, observe_artifact, timed
+from tracing import SpanKind, tracer, trace_headers, in_current_context
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,16 +44,170 @@ celery = Celery(
 # Service URLs
 GROBID_URL = os.environ.get('GROBID_URL', 'http://grobid:8070')
 PIPER_URL = os.environ.get('PIPER_URL', 'http://piper:8080')
+SRE_URL = os.environ.get('SRE_URL', 'http://sre:8090')
 TEMP_FOLDER = os.environ.get('TEMP_FOLDER', '/app/temp')
 
+# Speech synthesis is split into chunks that are synthesized in parallel
+PIPER_CHUNK_CHARS = int(os.environ.get('PIPER_CHUNK_CHARS', 1000))
+PIPER_MAX_WORKERS = int(os.environ.get('PIPER_MAX_WORKERS', 4))
+
+# MathML is sent to the SRE service in batches over a shared connection
+SRE_BATCH_SIZE = int(os.environ.get('SRE_BATCH_SIZE', 200))
+SRE_RETRY_INTERVAL = int(os.environ.get('SRE_RETRY_INTERVAL', 30))
+SRE_CONCURRENCY = int(os.environ.get('SRE_CONCURRENCY', 2))
+
+# Native text layer routing: pages below NATIVE_TEXT_OCR_QUALITY are OCRed,
+# pages below NATIVE_TEXT_MIN_QUALITY or with math go to GROBID
+NATIVE_TEXT_MIN_QUALITY = float(os.environ.get('NATIVE_TEXT_MIN_QUALITY', 0.6))
+NATIVE_TEXT_OCR_QUALITY = float(os.environ.get('NATIVE_TEXT_OCR_QUALITY', 0.2))
+NATIVE_TEXT_MIN_CHARS = 50
+NATIVE_MATH_THRESHOLD = int(os.environ.get('NATIVE_MATH_THRESHOLD', 3))
+
+WORD_PATTERN = re.compile(r"^\W*[^\W\d_]+(?:['-][^\W\d_]+)*\W*$")
+READABLE_PUNCTUATION = set('.,;:!?\'"()[]-–—/%')
+MATH_CHARACTERS = set('∑∫∏√∞≤≥≠≈≡±∓×÷∂∇∈∉⊂⊆⊃∪∩→←↔⇒⇔∀∃αβγδεζηθικλμνξπρστφχψωΓΔΘΛΞΠΣΦΨΩ')
+EQUATION_PATTERN = re.compile(r'(?<![\w])[A-Za-z](?:_\w+|\^\w+)?\s*[=<>≤≥]\s*[\w(\-]')
+
+# OCR fallback: pages are rasterized one at a time per worker process
+OCR_DPI = int(os.environ.get('OCR_DPI', 300))
+OCR_LANGUAGE = os.environ.get('OCR_LANGUAGE', 'eng')
+OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', 0))  # 0 = all available cores
+
+# Progress at which each pipeline stage starts; synthesis progress is spread
+# over the sections
+TEXT_PROGRESS_START = 25
+SYNTHESIS_PROGRESS_START = 30
+ENCODE_PROGRESS_START = 95
+
+TEI_NAMESPACES = {
+    'tei': 'http://www.tei-c.org/ns/1.0',
+    'm': 'http://www.w3.org/1998/Math/MathML'
+}
+
+# Clark-notation tags matched while streaming TEI
+TEI_HEADER = f"{{{TEI_NAMESPACES['tei']}}}teiHeader"
+TEI_TEXT = f"{{{TEI_NAMESPACES['tei']}}}text"
+TEI_BODY = f"{{{TEI_NAMESPACES['tei']}}}body"
+TEI_DIV = f"{{{TEI_NAMESPACES['tei']}}}div"
+TEI_HEAD = f"{{{TEI_NAMESPACES['tei']}}}head"
+TEI_P = f"{{{TEI_NAMESPACES['tei']}}}p"
+TEI_FORMULA = f"{{{TEI_NAMESPACES['tei']}}}formula"
+TEI_LABEL = f"{{{TEI_NAMESPACES['tei']}}}label"
+TEI_MATH = f"{{{TEI_NAMESPACES['m']}}}math"
+TEI_CHUNK_SIZE = 64 * 1024
+
+class SREUnavailable(Exception):
+    """Raised when the Speech Rule Engine service cannot be reached"""
+
+class SREClient:
+    """Client for the long-lived Speech Rule Engine service.
+    
+    Requests go through the process's pooled session for the service, so
+    batches reuse the same connections. After a connection failure the
+    service is treated as unavailable for SRE_RETRY_INTERVAL seconds, during
+    which callers fall back to running SRE directly instead of waiting on
+    timeouts.
+    """
+    
+    _unavailable_until = 0
+    
+    def __init__(self, url=SRE_URL):
+        self.url = url
+    
+    def to_speech(self, mathml_list, domain='mathspeak', style='default'):
+        """Convert a list of MathML strings to speech, None for failed items"""
+        if time.time() < SREClient._unavailable_until:
+            raise SREUnavailable("SRE service marked unavailable")
+        
+        batches = [mathml_list[i:i + SRE_BATCH_SIZE] for i in range(0, len(mathml_list), SRE_BATCH_SIZE)]
+        if len(batches) == 1:
+            return self._post_batch(batches[0], domain, style)
+        
+        # Large documents are split into a few batches sent side by side
+        with ThreadPoolExecutor(max_workers=SRE_CONCURRENCY) as executor:
+            post_batch = in_current_context(self._post_batch)
+            results = executor.map(lambda batch: post_batch(batch, domain, style), batches)
+            return [speech for batch_speech in results for speech in batch_speech]
+    
+    @tracer.start_as_current_span('sre', kind=SpanKind.CLIENT)
+    def _post_batch(self, batch, domain, style):
+        try:
+            response = get_session('sre').post(
+                f"{self.url}/speech",
+                json={'mathml': batch, 'domain': domain, 'style': style},
+                headers=trace_headers(),
+                timeout=service_timeout('sre')
+            )
+        except requests.RequestException as e:
+            SREClient._unavailable_until = time.time() + SRE_RETRY_INTERVAL
+            raise SREUnavailable(str(e))
+        
+        if response.status_code != 200:
+            raise SREUnavailable(f"SRE service returned {response.status_code}")
+        
+        return response.json()['speech']
+
 class MathMLProcessor:
     """Process MathML using Speech Rule Engine"""
     
-    def __init__(self):
+    FALLBACK_SPEECH = "[Mathematical expression]"
+    
+    def __init__(self, domain='mathspeak', style='default', cache=None):
         self.sre_path = '/app/speech-rule-engine'
+        self.domain = domain
+        self.style = style
+        self.client = SREClient()
+        self.cache = cache or get_math_cache()
     
     def mathml_to_speech(self, mathml_content):
         """Convert MathML to spoken text using SRE"""
+        return self.mathml_batch_to_speech([mathml_content])[0]
+    
+    def mathml_batch_to_speech(self, mathml_list):
+        """Convert a list of MathML strings to spoken text in one round trip.
+        
+        Expressions already in the speech cache are not sent to SRE, and
+        expressions that are equal after canonicalization are converted once.
+        """
+        if not mathml_list:
+            return []
+        
+        keys = [self.cache.make_key(m, self.domain, self.style) for m in mathml_list]
+        speech_by_key = self.cache.get_many(keys)
+        
+        missing = {}
+        for key, mathml in zip(keys, mathml_list):
+            if key not in speech_by_key:
+                missing.setdefault(key, mathml)
+        
+        if missing:
+            converted = dict(zip(missing, self.convert(list(missing.values()))))
+            # Placeholders from failed conversions are not worth remembering
+            self.cache.set_many({k: s for k, s in converted.items() if s != self.FALLBACK_SPEECH})
+            speech_by_key.update(converted)
+        
+        return [speech_by_key[key] for key in keys]
+    
+    def cache_stats(self):
+        """Return hit/miss counters of the speech cache in this process"""
+        return self.cache.stats()
+    
+    def convert(self, mathml_list):
+        """Convert MathML strings with the SRE service, or locally if it is down"""
+        try:
+            with timed('sre'):
+                speech = self.client.to_speech(mathml_list, self.domain, self.style)
+            return [s.strip() if s else self.FALLBACK_SPEECH for s in speech]
+        except SREUnavailable as e:
+            logger.warning(f"SRE service unavailable, running SRE locally: {e}")
+        except Exception as e:
+            logger.error(f"SRE service error, running SRE locally: {e}")
+        
+        with tracer.start_as_current_span('sre_local'), timed('sre_local'):
+            return [self.run_sre_locally(m) for m in mathml_list]
+    
+    def run_sre_locally(self, mathml_content):
+        """Convert MathML to spoken text by starting SRE in a new Node process"""
         try:
             # Create a temporary file for MathML
             with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as f:
@@ -51,7 +221,7 @@ class MathMLProcessor:
                 const sre = require('{self.sre_path}/lib/sre.js');
                 const fs = require('fs');
                 const mathml = fs.readFileSync('{mathml_file}', 'utf8');
-                sre.setupEngine({{domain: 'mathspeak', style: 'default', markup: 'none'}});
+                sre.setupEngine({{domain: '{self.domain}', style: '{self.style}', markup: 'none'}});
                 const speech = sre.toSpeech(mathml);
                 console.log(speech);
                 '''
@@ -66,238 +236,928 @@ class MathMLProcessor:
                 return result.stdout.strip()
             else:
                 logger.warning(f"SRE processing failed: {result.stderr}")
-                return "[Mathematical expression]"
+                return self.FALLBACK_SPEECH
                 
         except Exception as e:
             logger.error(f"MathML processing error: {e}")
-            return "[Mathematical expression]"
+            return self.FALLBACK_SPEECH
 
-def extract_text_with_grobid(pdf_path):
-    """Extract text and MathML from PDF using GROBID"""
+@tracer.start_as_current_span('grobid', kind=SpanKind.CLIENT)
+def extract_text_with_grobid(pdf_path, output_path):
+    """Extract text and MathML from PDF using GROBID.
+    
+    The TEI response is streamed to output_path rather than held in memory.
+    Returns output_path, or None on failure.
+    """
+    started = time.perf_counter()
     try:
         with open(pdf_path, 'rb') as pdf_file:
             files = {'input': pdf_file}
-            response = requests.post(
+            with get_session('grobid').post(
                 f"{GROBID_URL}/api/processFulltextDocument",
                 files=files,
-                timeout=300
-            )
+                headers=trace_headers(),
+                timeout=service_timeout('grobid'),
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f"GROBID processing failed: {response.status_code}")
+                    observe_stage('grobid', started, failed=True)
+                    return None
+                
+                with open(output_path, 'wb') as tei_file:
+                    for chunk in response.iter_content(chunk_size=TEI_CHUNK_SIZE):
+                        tei_file.write(chunk)
         
-        if response.status_code == 200:
-            return response.text
-        else:
-            logger.error(f"GROBID processing failed: {response.status_code}")
-            return None
+        observe_stage('grobid', started)
+        observe_artifact('tei', output_path)
+        return output_path
             
     except Exception as e:
         logger.error(f"GROBID extraction error: {e}")
+        observe_stage('grobid', started, failed=True)
         return None
 
-def extract_text_with_tesseract(pdf_path):
-    """Fallback OCR extraction using Tesseract"""
+def get_page_count(pdf_path):
+    """Return the number of pages in a PDF, asking Poppler if PyPDF2 cannot read it"""
     try:
-        # Convert PDF to images and OCR each page
-        # This is a simplified implementation
-        text_content = []
-        
-        # Use PyPDF2 to get page count
         with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            num_pages = len(pdf_reader.pages)
-        
-        # For each page, extract text using OCR
-        # Note: This would need pdf2image in production
-        for page_num in range(min(num_pages, 10)):  # Limit to 10 pages for demo
+            return len(PyPDF2.PdfReader(file).pages)
+    except Exception as e:
+        logger.warning(f"PyPDF2 could not count pages of {pdf_path}: {e}")
+        return pdfinfo_from_path(pdf_path)['Pages']
+
+def available_cores():
+    """Number of CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def ocr_page(pdf_path, page_number, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    """Rasterize a single PDF page and OCR it.
+    
+    Runs on an OCR worker thread; only this one page is ever rendered, so
+    each worker holds at most one page image in memory.
+    """
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    try:
+        return pytesseract.image_to_string(images[0], lang=language).strip()
+    finally:
+        for image in images:
+            image.close()
+
+def ocr_failed_text(page_number):
+    """Placeholder read out for a page that could not be OCRed"""
+    return f"[OCR failed for page {page_number}]"
+
+def iter_ocr_pages(pdf_path, dpi=OCR_DPI, pages=None):
+    """OCR a PDF on a thread pool and yield page texts in page order.
+    
+    pages optionally limits OCR to the given page numbers. Pages are submitted
+    a few at a time ahead of the page being yielded, so text streams out as
+    soon as the next page in order is done. Pages that cannot be OCRed yield
+    a placeholder instead of failing the document.
+    
+    pdftoppm and Tesseract run as subprocesses, so threads keep several cores
+    busy. A process pool cannot be used: Celery's prefork workers are daemon
+    processes, which may not have children.
+    """
+    if pages is None:
+        pages = range(1, get_page_count(pdf_path) + 1)
+    if not pages:
+        return
+    
+    page_queue = deque(pages)
+    workers = max(1, min(OCR_MAX_WORKERS or available_cores(), len(page_queue)))
+    window = workers * 2
+    pending = deque()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while page_queue or pending:
+            while page_queue and len(pending) < window:
+                page_number = page_queue.popleft()
+                try:
+                    future = executor.submit(ocr_page, pdf_path, page_number, dpi)
+                except Exception as e:
+                    logger.error(f"Could not start OCR for page {page_number}: {e}")
+                    future = None
+                pending.append((page_number, future))
+            
+            page_number, future = pending.popleft()
             try:
-                # Simplified OCR - in production would convert PDF page to image first
-                page_text = f"[OCR Page {page_num + 1} - Text extraction via Tesseract]"
-                text_content.append(page_text)
+                if future is None:
+                    raise RuntimeError("not started")
+                text = future.result()
             except Exception as e:
-                logger.warning(f"OCR failed for page {page_num}: {e}")
-                text_content.append(f"[OCR failed for page {page_num + 1}]")
-        
-        return "\n\n".join(text_content)
+                logger.warning(f"OCR failed for page {page_number}: {e}")
+                text = ocr_failed_text(page_number)
+            yield page_number, text
+
+def extract_text_with_tesseract(pdf_path):
+    """Fallback OCR extraction using Tesseract"""
+    try:
+        pages = [text for _, text in iter_ocr_pages(pdf_path) if text]
+        return "\n\n".join(pages) or None
         
     except Exception as e:
         logger.error(f"Tesseract extraction error: {e}")
         return None
 
-def parse_tei_xml(tei_content):
-    """Parse TEI XML and extract text with MathML"""
+def tei_inline_parts(elem, math, parts):
+    """Flatten an element into text strings and math references, in order.
+    
+    MathML is serialized into math and replaced by its index there, so the
+    markup never leaks into the prose and the speech can be put back in place.
+    """
+    if elem.text:
+        parts.append(elem.text)
+    for child in elem:
+        if child.tag == TEI_MATH:
+            parts.append(len(math))
+            math.append(etree.tostring(child, encoding='unicode', with_tail=False))
+        elif isinstance(child.tag, str):
+            tei_inline_parts(child, math, parts)
+        if child.tail:
+            parts.append(child.tail)
+    return parts
+
+def tei_formula_parts(elem, math):
+    """Flatten a display formula like a paragraph, without its number"""
+    for label in elem.findall(TEI_LABEL):
+        label.clear(keep_tail=True)
+    return tei_inline_parts(elem, math, [])
+
+def free_element(elem):
+    """Release a processed element and the siblings parsed before it"""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+@tracer.start_as_current_span('tei_parse')
+def parse_tei_xml(tei_source):
+    """Parse TEI XML into the sections to be read out, in a single pass.
+    
+    tei_source is a file path or file object. Each division with a heading or
+    paragraphs becomes a section; its paragraphs are lists of text strings and
+    indexes into the returned list of MathML strings, in document order.
+    Display formulas between paragraphs are paragraphs of their own, and text
+    after a nested division continues in a section after the nested one.
+    Elements are freed as soon as they are read, so memory use depends on the
+    largest paragraph rather than the size of the document.
+    
+    Returns (sections, math), or None if the TEI cannot be parsed.
+    """
+    started = time.perf_counter()
     try:
-        root = etree.fromstring(tei_content.encode('utf-8'))
-        
-        # Extract text content
-        text_elements = root.xpath('//text//p | //text//head')
-        mathml_elements = root.xpath('//m:math', namespaces={'m': 'http://www.w3.org/1998/Math/MathML'})
-        
-        content_parts = []
-        math_processor = MathMLProcessor()
-        
-        # Process text elements
-        for elem in text_elements:
-            text = etree.tostring(elem, method='text', encoding='unicode').strip()
-            if text:
-                content_parts.append(text)
+        sections = []
+        math = []
+        containers = []
         
-        # Process MathML elements
-        for math_elem in mathml_elements:
-            mathml_str = etree.tostring(math_elem, encoding='unicode')
-            spoken_math = math_processor.mathml_to_speech(mathml_str)
-            content_parts.append(f" {spoken_math} ")
+        for event, elem in etree.iterparse(tei_source, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                # The body itself only counts when it has no divisions
+                if tag == TEI_DIV and containers or tag == TEI_TEXT:
+                    section = {'title': '', 'paragraphs': []}
+                    containers.append((elem, section))
+                    if tag == TEI_DIV:
+                        sections.append(section)
+                continue
+            
+            if not containers:
+                if tag == TEI_HEADER:
+                    free_element(elem)
+                continue
+            
+            container, section = containers[-1]
+            if elem is container:
+                containers.pop()
+                if tag == TEI_TEXT and not any(s['paragraphs'] for s in sections):
+                    sections.append(section)
+                elif containers and containers[-1][0].tag == TEI_DIV:
+                    # The enclosing division continues after this one
+                    continuation = {'title': '', 'paragraphs': []}
+                    containers[-1] = (containers[-1][0], continuation)
+                    sections.append(continuation)
+                free_element(elem)
+            elif (tag == TEI_HEAD or tag == TEI_P) and (elem.getparent() is container or container.tag == TEI_TEXT):
+                if tag == TEI_HEAD and not section['title']:
+                    section['title'] = (elem.text or '').strip()
+                section['paragraphs'].append(tei_inline_parts(elem, math, []))
+                free_element(elem)
+            elif elem.getparent() is container or container.tag == TEI_TEXT and elem.getparent().tag == TEI_BODY:
+                # Display formulas sit between paragraphs, not inside them
+                block = container.tag == TEI_DIV or elem.getparent().tag == TEI_BODY
+                if block and (tag == TEI_FORMULA or elem.find(f'.//{TEI_MATH}') is not None):
+                    section['paragraphs'].append(tei_formula_parts(elem, math))
+                free_element(elem)
         
-        return " ".join(content_parts)
+        observe_stage('tei_parse', started)
+        return [s for s in sections if s['paragraphs']], math
         
     except Exception as e:
         logger.error(f"TEI parsing error: {e}")
+        observe_stage('tei_parse', started, failed=True)
         return None
 
-def synthesize_speech(text, voice_settings, output_path):
-    """Synthesize speech using Piper TTS"""
+def tei_text_length(sections):
+    """Count the characters of plain text in TEI sections"""
+    return sum(
+        len(part.strip())
+        for section in sections
+        for paragraph in section['paragraphs']
+        for part in paragraph
+        if isinstance(part, str)
+    )
+
+def section_to_text(section, math_speech):
+    """Join a parsed TEI section into text, with each formula read in place.
+    
+    math_speech holds the speech for the document's MathML, in the order
+    returned by parse_tei_xml.
+    """
+    content_parts = []
+    for paragraph in section['paragraphs']:
+        words = []
+        for part in paragraph:
+            words.extend((math_speech[part] if isinstance(part, int) else part).split())
+        if words:
+            content_parts.append(" ".join(words))
+    
+    return {'title': section['title'], 'text': "\n\n".join(content_parts)}
+
+def score_text_quality(text):
+    """Score a page's native text layer from 0 (unusable) to 1 (clean prose)"""
+    stripped = text.strip()
+    if len(stripped) < NATIVE_TEXT_MIN_CHARS:
+        return 0.0
+    
+    tokens = stripped.split()
+    words = sum(1 for token in tokens if WORD_PATTERN.match(token))
+    readable = sum(1 for c in stripped if c.isalnum() or c.isspace() or c in READABLE_PUNCTUATION)
+    
+    # Glyphs the PDF cannot map to Unicode come out as (cid:NN) or U+FFFD
+    broken = len(re.findall(r'\(cid:\d+\)', stripped)) + stripped.count('\ufffd')
+    
+    score = (words / len(tokens)) * (readable / len(stripped)) - broken / len(tokens)
+    return max(0.0, min(1.0, score))
+
+def page_has_math(text):
+    """Guess whether a page's text layer contains mathematics"""
+    math_characters = sum(1 for c in text if c in MATH_CHARACTERS)
+    equations = len(EQUATION_PATTERN.findall(text))
+    return math_characters + equations >= NATIVE_MATH_THRESHOLD
+
+@tracer.start_as_current_span('route_pages')
+def route_pages(pdf_path):
+    """Decide per page whether to use the native text layer, GROBID or OCR.
+    
+    Returns a list of dicts with the page number, the chosen route and, for
+    pages with a usable text layer, the extracted text. Returns None when
+    PyPDF2 cannot open or read the PDF at all.
+    """
+    routes = []
     try:
-        payload = {
-            'text': text,
-            'voice': voice_settings.get('voice', 'en_US-lessac-medium'),
-            'speed': voice_settings.get('speed', 1.0),
-            'output_path': output_path
-        }
+        with open(pdf_path, 'rb') as file:
+            for page_number, page in enumerate(PyPDF2.PdfReader(file).pages, start=1):
+                try:
+                    text = page.extract_text() or ""
+                except Exception as e:
+                    logger.warning(f"Native text extraction failed for page {page_number}: {e}")
+                    text = ""
+                
+                quality = score_text_quality(text)
+                if quality < NATIVE_TEXT_OCR_QUALITY:
+                    route = 'ocr'
+                elif quality < NATIVE_TEXT_MIN_QUALITY or page_has_math(text):
+                    route = 'grobid'
+                else:
+                    route = 'native'
+                
+                routes.append({
+                    'page': page_number,
+                    'route': route,
+                    'text': text if route != 'ocr' else None
+                })
+    except Exception as e:
+        logger.warning(f"Could not read the text layer of {pdf_path}: {e}")
+        return None
+    
+    return routes
+
+def write_page_subset(pdf_path, page_numbers, output_path):
+    """Write the given pages of a PDF to a new PDF"""
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        writer = PyPDF2.PdfWriter()
+        for page_number in page_numbers:
+            writer.add_page(reader.pages[page_number - 1])
+        with open(output_path, 'wb') as output:
+            writer.write(output)
+
+@tracer.start_as_current_span('grobid_extract')
+def extract_grobid_sections(pdf_path, page_numbers, whole_document, pdf_hash=None):
+    """Run a range of pages through GROBID and return (sections, math).
+    
+    pdf_hash is the PDF's SHA-256, hashed here if not given. Returns None when
+    GROBID fails or finds too little text, so the caller can fall back for
+    those pages.
+    """
+    subset_path = None
+    with tempfile.NamedTemporaryFile(suffix='.tei.xml', dir=TEMP_FOLDER, delete=False) as f:
+        tei_path = f.name
+    
+    def run_grobid(output_path):
+        nonlocal subset_path
+        if whole_document:
+            return extract_text_with_grobid(pdf_path, output_path)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', dir=TEMP_FOLDER, delete=False) as f:
+            subset_path = f.name
+        write_page_subset(pdf_path, page_numbers, subset_path)
+        return extract_text_with_grobid(subset_path, output_path)
+    
+    try:
+        # Jobs for the same PDF share GROBID's output, and one request for it
+        key = make_tei_key(pdf_hash or hash_file(pdf_path), None if whole_document else page_numbers)
+        parsed = TEICache().fetch(key, tei_path, run_grobid) and parse_tei_xml(tei_path)
+    finally:
+        for path in (subset_path, tei_path):
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    if not parsed or tei_text_length(parsed[0]) < 100:
+        return None
+    return parsed
+
+def iter_document_sections(pdf_path, math, on_stage=None, pdf_hash=None):
+    """Yield the text sections of a PDF in reading order.
+    
+    Pages with a clean text layer are read directly. Consecutive pages with
+    math or a poor text layer go to GROBID together, and if GROBID cannot
+    handle them their own text layer is read instead. Pages with no usable
+    text layer also go to GROBID first, then to OCR. A PDF that PyPDF2 cannot
+    read goes to GROBID whole, then to OCR. Each section carries 'position',
+    the fraction of the document's pages before it.
+    
+    Sections from GROBID carry 'paragraphs' as returned by parse_tei_xml, with
+    their MathML appended to math; the others carry 'text'. pdf_hash, the
+    PDF's SHA-256, saves hashing it for every GROBID group.
+    """
+    routes = route_pages(pdf_path)
+    if routes is None:
+        # Without page routing the whole document takes GROBID, then OCR
+        groups = [('grobid', None)]
+        total_pages = None
+    else:
+        groups = [(route, list(group)) for route, group in groupby(routes, key=lambda r: r['route'])]
+        total_pages = len(routes)
+        counts = {route: sum(1 for r in routes if r['route'] == route) for route in ('native', 'grobid', 'ocr')}
+        logger.info(f"Page routing for {pdf_path}: {counts}")
+    
+    for route, group in groups:
+        if route == 'native':
+            for r in group:
+                yield {
+                    'title': f"Page {r['page']}",
+                    'text': r['text'],
+                    'source': 'native',
+                    'position': (r['page'] - 1) / total_pages
+                }
+            continue
+        
+        whole_document = group is None or len(group) == total_pages
+        page_numbers = None if group is None else [r['page'] for r in group]
+        if whole_document:
+            page_range = "the document"
+        elif len(page_numbers) == 1:
+            page_range = f"page {page_numbers[0]}"
+        else:
+            page_range = f"pages {page_numbers[0]}-{page_numbers[-1]}"
+        
+        # Every page without a clean text layer gets GROBID first
+        if on_stage:
+            on_stage('extracting', f'Extracting text and mathematics from {page_range}...')
+        if pdf_hash is None:
+            pdf_hash = hash_file(pdf_path)
+        parsed = extract_grobid_sections(pdf_path, page_numbers, whole_document, pdf_hash)
+        if parsed:
+            sections, group_math = parsed
+            first_page, group_pages = (1, 1) if group is None else (page_numbers[0], len(group))
+            # Number this group's formulas after those of earlier groups
+            offset = len(math)
+            math.extend(group_math)
+            for index, section in enumerate(sections):
+                yield {
+                    'title': section['title'],
+                    'paragraphs': [
+                        [part + offset if isinstance(part, int) else part for part in paragraph]
+                        for paragraph in section['paragraphs']
+                    ],
+                    'source': 'grobid',
+                    'position': (first_page - 1 + group_pages * index / len(sections)) / (total_pages or 1)
+                }
+            continue
+        
+        if route == 'grobid' and group is not None:
+            # The text layer is poor or has math, but reads better than OCR would
+            logger.warning(f"GROBID failed for {page_range}, reading the native text layer")
+            for r in group:
+                yield {
+                    'title': f"Page {r['page']}",
+                    'text': r['text'],
+                    'source': 'native',
+                    'position': (r['page'] - 1) / total_pages
+                }
+            continue
+        
+        if on_stage:
+            on_stage('ocr_fallback', f'Using OCR for {page_range}...')
+        if total_pages is None:
+            total_pages = get_page_count(pdf_path)
+        for page_number, text in iter_ocr_pages(pdf_path, pages=page_numbers):
+            yield {
+                'title': f'Page {page_number}',
+                'text': text,
+                'source': 'ocr',
+                'position': (page_number - 1) / total_pages
+            }
+
+def split_text_into_chunks(text, max_chars=PIPER_CHUNK_CHARS):
+    """Split text into chunks of at most max_chars on paragraph and sentence boundaries"""
+    chunks = []
+    current = ""
+    
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
         
-        response = requests.post(
-            f"{PIPER_URL}/synthesize_file",
+        # Close the running chunk at paragraph boundaries once it is reasonably full
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            # Hard-split sentences that are longer than a whole chunk
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+            
+            if not sentence:
+                continue
+            if current and len(current) + len(sentence) + 1 > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
+
+def synthesize_chunk(text, voice_settings):
+    """Synthesize a single chunk of text and return the WAV bytes"""
+    payload = {
+        'text': text,
+        'voice': voice_settings.get('voice', 'en_US-lessac-medium'),
+        'speed': voice_settings.get('speed', 1.0)
+    }
+    
+    with tracer.start_as_current_span('piper', kind=SpanKind.CLIENT), timed('piper'):
+        response = get_session('piper').post(
+            f"{PIPER_URL}/synthesize",
             json=payload,
-            timeout=300
+            headers=trace_headers(),
+            timeout=service_timeout('piper')
         )
         
-        if response.status_code == 200:
-            result = response.json()
-            return result.get('success', False)
-        else:
-            logger.error(f"Piper TTS failed: {response.status_code}")
-            return False
+        if response.status_code != 200:
+            raise Exception(f"Piper TTS failed: {response.status_code}")
+    
+    return response.content
+
+def synthesize_chunks(chunks, voice_settings, appender, on_section=None):
+    """Synthesize chunks on a bounded thread pool and append the audio in order.
+    
+    chunks yields (section_index, section, text) tuples and may be lazy;
+    on_section is called as the audio of each new section starts.
+    """
+    # Only keep a small window of chunks in flight so finished audio that is
+    # waiting for an earlier chunk cannot pile up in memory
+    window = PIPER_MAX_WORKERS * 2
+    pending = deque()
+    current_section = None
+    
+    def append_next():
+        nonlocal current_section
+        section_index, section, future = pending.popleft()
+        if on_section and section_index != current_section:
+            on_section(section_index, section)
+        current_section = section_index
+        appender.append(future.result())
+    
+    with ThreadPoolExecutor(max_workers=PIPER_MAX_WORKERS) as executor:
+        for section_index, section, chunk in chunks:
+            future = executor.submit(in_current_context(synthesize_chunk), chunk, voice_settings)
+            pending.append((section_index, section, future))
+            if len(pending) >= window:
+                append_next()
+        
+        while pending:
+            append_next()
+
+def synthesize_speech(sections, voice_settings, output_path, on_section=None):
+    """Synthesize speech for a sequence of sections using Piper TTS.
+    
+    Sections are consumed lazily and their audio is appended to the WAV file
+    output_path as it is produced, so memory use does not grow with document
+    length. Returns a summary of what was synthesized, or None on failure.
+    """
+    stats = {'sections': 0, 'text_length': 0}
+    
+    def iter_chunks():
+        for section_index, section in enumerate(sections):
+            stats['sections'] += 1
+            for chunk in split_text_into_chunks(section['text']):
+                stats['text_length'] += len(chunk)
+                yield section_index, section, chunk
+    
+    try:
+        with WavAppender(output_path) as appender:
+            synthesize_chunks(iter_chunks(), voice_settings, appender, on_section)
+        
+        if not appender.frames_written:
+            logger.error("No text to synthesize")
+            return None
+        
+        stats['duration'] = round(appender.duration, 2)
+        return stats
             
     except Exception as e:
         logger.error(f"Speech synthesis error: {e}")
-        return False
+        return None
 
-@celery.task(bind=True)
-def process_pdf_to_audio(self, task_id, pdf_path, voice_settings):
-    """Main task to process PDF to audio"""
+def report_progress(task, task_id, stage, progress, message, **extra):
+    """Record a job's progress in the result backend and push it to subscribers.
+    
+    Pipeline stages run under task IDs of their own, so the progress is
+    stored under the job's task_id.
+    """
+    meta = dict(stage=stage, progress=progress, message=message, **extra)
+    task.update_state(task_id=task_id, state='PROGRESS', meta=meta)
+    publish_progress(task_id, status_payload(task_id, 'PROGRESS', meta))
+
+def link_cached_result(cache_key, task_id):
+    """Serve an earlier conversion's audio under task_id, if it is still cached"""
+    result_cache = ResultCache()
+    entry = result_cache.get(cache_key)
+    if not entry:
+        return None
+    
+    audio_format = entry['result'].get('format', 'wav')
+    audio_path = os.path.join(TEMP_FOLDER, audio_filename(task_id, audio_format))
+    return result_cache.link(cache_key, entry, task_id, audio_path)
+
+def artifact_path(task_id, name):
+    """Path of an intermediate file passed from one pipeline stage to the next"""
+    return os.path.join(TEMP_FOLDER, f"{task_id}.{name}")
+
+def write_artifact(path, data):
+    """Write a JSON artifact, renaming it into place once complete"""
+    with open(f"{path}.part", 'w') as f:
+        json.dump(data, f)
+    os.replace(f"{path}.part", path)
+
+def read_artifact(path):
+    with open(path) as f:
+        return json.load(f)
+
+def write_records(path, records):
+    """Write records to a JSON lines artifact as they arrive and return their count"""
+    count = 0
     try:
-        # Stage 1: PDF Analysis
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'stage': 'analyzing',
-                'progress': 10,
-                'message': 'Analyzing PDF structure...'
-            }
-        )
+        with open(f"{path}.part", 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                count += 1
+    except BaseException:
+        remove_files(f"{path}.part")
+        raise
+    os.replace(f"{path}.part", path)
+    return count
+
+def read_records(path):
+    """Yield the records of a JSON lines artifact one at a time"""
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+def remove_files(*paths):
+    for path in paths:
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def stage_failed(job, e):
+    """Clean up after a failed pipeline stage and tell subscribers.
+    
+    Celery marks the rest of the chain, and so the job's task_id, as failed
+    with the same exception once the stage raises.
+    """
+    task_id = job['task_id']
+    logger.error(f"Task {task_id} failed: {e}")
+    remove_files(
+        job['pdf_path'],
+        job.get('artifact'),
+        artifact_path(task_id, 'math.json'),
+        os.path.join(TEMP_FOLDER, partial_audio_filename(task_id, 'wav'))
+    )
+    publish_progress(task_id, status_payload(task_id, 'FAILURE', f'Processing failed: {str(e)}'))
+
+# Stages only pass their results down the chain. Failures are still stored,
+# which is how Celery propagates them to the job's task_id.
+STAGE_OPTIONS = {'bind': True, 'ignore_result': True, 'store_errors_even_if_ignored': True}
+
+@celery.task(**STAGE_OPTIONS)
+def extract_document(self, job):
+    """Pipeline stage 1: extract the document's sections and MathML"""
+    task_id = job['task_id']
+    try:
+        # Batch uploads are checked against the cache here rather than when
+        # submitted, so every document has a job for the batch to wait on
+        if job.get('cache_key') and job.get('check_cache'):
+            cached = link_cached_result(job['cache_key'], task_id)
+            if cached:
+                remove_files(job['pdf_path'])
+                return dict(job, result=cached)
         
-        # Stage 2: Text Extraction with GROBID
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'stage': 'extracting',
-                'progress': 25,
-                'message': 'Extracting text and mathematics...'
-            }
-        )
+        report_progress(self, task_id, 'analyzing', 5, 'Analyzing PDF structure...')
         
-        tei_content = extract_text_with_grobid(pdf_path)
-        extracted_text = None
+        # Pages are routed to the native text layer, GROBID or OCR
+        def on_stage(stage, message):
+            report_progress(self, task_id, stage, 10, message)
         
-        if tei_content:
-            extracted_text = parse_tei_xml(tei_content)
+        # Sections go to disk as they are extracted; the MathML is kept for
+        # the next stage's single batch
+        math = []
+        sections_path = artifact_path(task_id, 'sections.jsonl')
+        job = dict(job, artifact=sections_path)
+        sections = iter_document_sections(job['pdf_path'], math, on_stage, job.get('pdf_hash'))
+        if not write_records(sections_path, sections):
+            raise Exception("No text found in document")
         
-        # Stage 3: Fallback to OCR if needed
-        if not extracted_text or len(extracted_text.strip()) < 100:
-            self.update_state(
-                state='PROGRESS',
-                meta={
-                    'stage': 'ocr_fallback',
-                    'progress': 40,
-                    'message': 'Using OCR fallback for text extraction...'
-                }
-            )
-            
-            ocr_text = extract_text_with_tesseract(pdf_path)
-            if ocr_text:
-                extracted_text = ocr_text
-        
-        if not extracted_text:
-            raise Exception("Failed to extract text from PDF")
-        
-        # Stage 4: Text Processing
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'stage': 'processing',
-                'progress': 60,
-                'message': 'Processing text for speech synthesis...'
-            }
-        )
+        write_artifact(artifact_path(task_id, 'math.json'), math)
+        observe_artifact('sections', sections_path)
+        remove_files(job['pdf_path'])
+        return job
         
-        # Clean and prepare text for TTS
-        # Remove excessive whitespace, handle special characters
-        cleaned_text = " ".join(extracted_text.split())
-        
-        # Limit text length for demo (first 5000 characters)
-        if len(cleaned_text) > 5000:
-            cleaned_text = cleaned_text[:5000] + "... [Content truncated for demo]"
-        
-        # Stage 5: Speech Synthesis
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'stage': 'synthesizing',
-                'progress': 80,
-                'message': 'Generating audio...'
-            }
-        )
+    except Exception as e:
+        stage_failed(job, e)
+        raise
+
+@celery.task(**STAGE_OPTIONS)
+def speak_mathematics(self, job):
+    """Pipeline stage 2: read the document's formulas and join sections into text"""
+    if 'result' in job:
+        return job
+    
+    task_id = job['task_id']
+    try:
+        math_path = artifact_path(task_id, 'math.json')
+        math = read_artifact(math_path)
+        if math:
+            report_progress(self, task_id, 'processing', TEXT_PROGRESS_START, f'Converting {len(math)} formulas to speech...')
         
-        audio_path = os.path.join(TEMP_FOLDER, f"{task_id}_audio.wav")
+        # One batch for the whole document, so repeated formulas across
+        # GROBID groups are converted once
+        math_speech = MathMLProcessor().mathml_batch_to_speech(math)
         
-        if synthesize_speech(cleaned_text, voice_settings, audio_path):
-            # Stage 6: Completion
-            self.update_state(
-                state='PROGRESS',
-                meta={
-                    'stage': 'completed',
-                    'progress': 100,
-                    'message': 'Audio generation completed!'
-                }
+        def section_texts():
+            for section in read_records(job['artifact']):
+                if 'paragraphs' in section:
+                    section = dict(section_to_text(section, math_speech), source=section['source'], position=section['position'])
+                yield section
+        
+        text_path = artifact_path(task_id, 'text.jsonl')
+        write_records(text_path, section_texts())
+        observe_artifact('text', text_path)
+        remove_files(job['artifact'], math_path)
+        return dict(job, artifact=text_path)
+        
+    except Exception as e:
+        stage_failed(job, e)
+        raise
+
+@celery.task(**STAGE_OPTIONS)
+def synthesize_document(self, job):
+    """Pipeline stage 3: synthesize the document's text to WAV"""
+    if 'result' in job:
+        return job
+    
+    task_id = job['task_id']
+    # The WAV is written under the task's partial audio name, so it can be
+    # streamed while synthesis runs
+    partial_audio_path = os.path.join(TEMP_FOLDER, partial_audio_filename(task_id, 'wav'))
+    try:
+        # Sections are read from disk as synthesis reaches them
+        sections = read_records(job['artifact'])
+        
+        def on_section(section_index, section):
+            progress = SYNTHESIS_PROGRESS_START + int(
+                (ENCODE_PROGRESS_START - SYNTHESIS_PROGRESS_START) * section['position']
             )
-            
-            # Clean up original PDF
-            try:
-                os.remove(pdf_path)
-            except:
-                pass
-            
-            return {
-                'audio_url': f"/audio/{task_id}",
-                'text_length': len(cleaned_text),
-                'processing_time': time.time(),
-                'voice_used': voice_settings.get('voice', 'default')
-            }
-        else:
+            report_progress(
+                self, task_id, 'synthesizing', progress,
+                f"Generating audio for section {section_index + 1}"
+                + (f": {section['title']}" if section['title'] else '...'),
+                section=section_index + 1
+            )
+        
+        synthesis = synthesize_speech(sections, job['voice_settings'], partial_audio_path, on_section)
+        if not synthesis:
             raise Exception("Speech synthesis failed")
-            
+        
+        speech_path = artifact_path(task_id, 'speech.wav')
+        os.replace(partial_audio_path, speech_path)
+        observe_artifact('speech', speech_path)
+        remove_files(job['artifact'])
+        return dict(job, artifact=speech_path, synthesis=synthesis)
+        
     except Exception as e:
-        logger.error(f"Task {task_id} failed: {e}")
+        stage_failed(job, e)
+        raise
+
+@celery.task(**dict(STAGE_OPTIONS, ignore_result=False, track_started=False))
+def encode_audio(self, job):
+    """Pipeline stage 4: encode the speech to the requested format.
+    
+    Runs under the job's task_id, so its result is the job's result.
+    """
+    task_id = job['task_id']
+    if 'result' in job:
+        publish_progress(task_id, status_payload(task_id, 'SUCCESS', job['result']))
+        return job['result']
+    
+    try:
+        audio_format = job['audio_format']
+        report_progress(self, task_id, 'encoding', ENCODE_PROGRESS_START, 'Encoding audio...')
         
-        # Clean up files on failure
-        try:
-            os.remove(pdf_path)
-        except:
-            pass
-        
-        self.update_state(
-            state='FAILURE',
-            meta={
-                'stage': 'failed',
-                'progress': 0,
-                'message': f'Processing failed: {str(e)}'
-            }
-        )
-        raise e
\ No newline at end of file
+        audio_path = os.path.join(TEMP_FOLDER, audio_filename(task_id, audio_format))
+        if audio_format == 'wav':
+            os.replace(job['artifact'], audio_path)
+        else:
+            # Encoded under the partial name, which /audio/<id>/stream follows
+            partial_audio_path = os.path.join(TEMP_FOLDER, partial_audio_filename(task_id, audio_format))
+            with tracer.start_as_current_span('encode'), timed('encode'):
+                transcode_audio(job['artifact'], audio_path, audio_format, partial_audio_path)
+            remove_files(job['artifact'])
+        write_audio_etag(audio_path)
+        observe_artifact('audio', audio_path)
+        
+        # Jobs queued before submitted_at was recorded have no start time
+        processing_time = None
+        if job.get('submitted_at'):
+            processing_time = round(time.time() - job['submitted_at'], 2)
+            DOCUMENT_DURATION.labels(audio_format).observe(processing_time)
+        
+        synthesis = job['synthesis']
+        result = {
+            'audio_url': f"/audio/{task_id}",
+            'text_length': synthesis['text_length'],
+            'sections': synthesis['sections'],
+            'duration': synthesis['duration'],
+            'format': audio_format,
+            'processing_time': processing_time,
+            'voice_used': job['voice_settings'].get('voice', 'default')
+        }
+        
+        # Let repeat uploads of the same PDF reuse this audio
+        if job.get('cache_key'):
+            ResultCache().put(job['cache_key'], task_id, audio_path, result)
+        
+        publish_progress(task_id, status_payload(task_id, 'SUCCESS', result))
+        return result
+        
+    except Exception as e:
+        stage_failed(job, e)
+        raise
+
+PIPELINE_STAGES = (extract_document, speak_mathematics, synthesize_document, encode_audio)
+
+def document_pipeline(task_id, pdf_path, voice_settings, cache_key=None, audio_format=DEFAULT_AUDIO_FORMAT,
+                      check_cache=False, client_id=None, queues=None, priority=None, pdf_hash=None):
+    """Build the chain of tasks that converts a PDF to audio.
+    
+    Each stage runs on its own queue (queues maps stage task names to queue
+    names) and hands the next one a job dict that refers to its output file.
+    The last stage runs under task_id, so the chain's result and state are
+    found under the ID returned to the client. pdf_hash is the upload's
+    SHA-256, which keys the GROBID TEI cache.
+    """
+    job = {
+        'task_id': task_id,
+        'pdf_path': pdf_path,
+        'pdf_hash': pdf_hash,
+        'voice_settings': voice_settings,
+        'audio_format': audio_format,
+        'cache_key': cache_key,
+        'check_cache': check_cache,
+        'client_id': client_id,
+        'submitted_at': time.time()
+    }
+    
+    signatures = []
+    for stage in PIPELINE_STAGES:
+        options = {}
+        if queues and stage.name in queues:
+            options['queue'] = queues[stage.name]
+        if priority is not None:
+            options['priority'] = priority
+        signature = stage.s(job) if not signatures else stage.s()
+        signatures.append(signature.set(**options))
+    signatures[-1].set(task_id=task_id)
+    return chain(*signatures)
+
+@task_postrun.connect
+def release_fair_share(sender=None, args=None, state=None, **extra):
+    """Stop counting a finished document against its client's fair share"""
+    if sender is None or sender.name not in {stage.name for stage in PIPELINE_STAGES}:
+        return
+    job = args[0] if args else None
+    # A failed stage ends the chain early
+    if isinstance(job, dict) and job.get('client_id') and (sender.name == encode_audio.name or state == 'FAILURE'):
+        release_client(job['client_id'])
+
+@celery.task
+def convert_audio(task_id, audio_format):
+    """Convert a finished task's audio to another format, for GET /audio?format="""
+    try:
+        source_path = conversion_source(TEMP_FOLDER, task_id)
+        if source_path is None:
+            logger.warning(f"No audio to convert for {task_id}")
+            return None
+        
+        audio_path = os.path.join(TEMP_FOLDER, audio_filename(task_id, audio_format))
+        with tracer.start_as_current_span('encode'), timed('encode'):
+            transcode_audio(source_path, audio_path, audio_format)
+        write_audio_etag(audio_path)
+        return audio_path
+        
+    except Exception as e:
+        logger.error(f"Converting {task_id} to {audio_format} failed: {e}")
+        raise
+    finally:
+        # Let the next request queue the conversion again if this one failed
+        get_redis().delete(conversion_key(task_id, audio_format))
+
+@celery.task(bind=True)
+def combine_batch_audio(self, results, batch_id, task_ids, titles, audio_format=DEFAULT_AUDIO_FORMAT):
+    """Join the audio of a finished batch into one file, a chapter per document.
+    
+    Runs as the callback of the batch's chord, so results are the children's
+    results in upload order.
+    """
+    try:
+        source_paths = []
+        chapters = []
+        position = 0
+        for task_id, title, result in zip(task_ids, titles, results):
+            duration = result.get('duration') or 0
+            source_paths.append(os.path.join(TEMP_FOLDER, audio_filename(task_id, audio_format)))
+            chapters.append((title, position, position + duration))
+            position += duration
+        
+        audio_path = os.path.join(TEMP_FOLDER, audio_filename(batch_id, audio_format))
+        concat_audio(source_paths, chapters, audio_path, audio_format)
+        write_audio_etag(audio_path)
+        
+        combined = {
+            'audio_url': f"/audio/{batch_id}",
+            'duration': position,
+            'format': audio_format,
+            'chapters': [
+                {'title': title, 'start': start, 'end': end}
+                for title, start, end in chapters
+            ]
+        }
+        update_batch(batch_id, combined=combined)
+        return combined
+        
+    except Exception as e:
+        logger.error(f"Combining batch {batch_id} failed: {e}")
+        update_batch(batch_id, combined={'error': str(e)})
+        raise
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Distributed tracing with OpenTelemetry.
+
+Every API request gets a span. The trace context travels to Celery tasks in
+their message headers and on to GROBID, SRE and Piper in W3C traceparent
+headers, so the spans of one job, across processes and services, form one
+trace. All stages of a job are children of the upload request, each preceded
+by a span for the time it waited in its queue.
+
+Spans go to TRACING_EXPORTER: 'file' appends one JSON object per span to
+TRACING_DIR/<service>.jsonl, 'otlp' sends them to the collector at
+OTEL_EXPORTER_OTLP_ENDPOINT and 'console' prints them. The default, 'none',
+records nothing.
+
+Run as a script to turn a job's spans into a Chrome trace, which Perfetto,
+chrome://tracing or speedscope show as a flame chart:
+
+    python tracing.py <task_id> [spans.jsonl ...] > job.json
+"""
+
+import os
+import sys
+import glob
+import json
+import logging
+import argparse
+import threading
+from opentelemetry import trace, context
+from opentelemetry.propagate import inject, extract
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from celery import current_task
+from celery.signals import before_task_publish, task_prerun, task_postrun, worker_process_shutdown
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'none').lower()
+TRACING_DIR = os.environ.get('TRACING_DIR', '/app/traces')
+SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'pdf2audio-backend')
+
+# Attribute that ties the spans of a job to the task ID returned on upload
+JOB_ATTRIBUTE = 'pdf2audio.task_id'
+
+tracer = trace.get_tracer('pdf2audio')
+
+def span_record(span):
+    """The JSON line written for a finished span"""
+    parent = span.parent.span_id if span.parent else None
+    return {
+        'trace_id': format(span.context.trace_id, '032x'),
+        'span_id': format(span.context.span_id, '016x'),
+        'parent_id': format(parent, '016x') if parent else None,
+        'name': span.name,
+        'kind': span.kind.name,
+        'service': span.resource.attributes.get('service.name'),
+        'start_ns': span.start_time,
+        'end_ns': span.end_time,
+        'status': span.status.status_code.name,
+        'attributes': dict(span.attributes or {})
+    }
+
+def create_exporter(name):
+    """The span exporter selected by TRACING_EXPORTER, or None"""
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult, ConsoleSpanExporter
+    
+    class FileSpanExporter(SpanExporter):
+        """Append spans as JSON lines; each batch is one write to a shared file"""
+        
+        def __init__(self, path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.path = path
+        
+        def export(self, spans):
+            lines = ''.join(json.dumps(span_record(span), default=str) + '\n' for span in spans)
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(lines)
+            except OSError as e:
+                logger.warning(f"Writing spans to {self.path} failed: {e}")
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+    
+    if name == 'file':
+        return FileSpanExporter(os.path.join(TRACING_DIR, f"{SERVICE_NAME}.jsonl"))
+    if name == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if name == 'console':
+        return ConsoleSpanExporter()
+    if name != 'none':
+        logger.warning(f"Unknown TRACING_EXPORTER {name}, tracing is off")
+    return None
+
+def setup_tracing():
+    """Install a tracer provider that exports to TRACING_EXPORTER"""
+    exporter = create_exporter(TRACING_EXPORTER)
+    if exporter is None:
+        return
+    
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    
+    class ThreadProcessor(SpanProcessor):
+        """Record the process and thread of each span, the rows of a flame chart"""
+        
+        def on_start(self, span, parent_context=None):
+            span.set_attribute('process.pid', os.getpid())
+            span.set_attribute('thread.id', threading.get_ident())
+    
+    provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}))
+    provider.add_span_processor(ThreadProcessor())
+    # The batch processor restarts its export thread in forked worker processes
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing to {TRACING_EXPORTER} as {SERVICE_NAME}")
+
+def trace_headers():
+    """W3C trace context headers for an outgoing request"""
+    headers = {}
+    inject(headers)
+    return headers
+
+def in_current_context(fn):
+    """Wrap fn to run in the caller's trace context, e.g. on a thread pool"""
+    parent = context.get_current()
+    
+    def run(*args, **kwargs):
+        token = context.attach(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            context.detach(token)
+    return run
+
+def start_request_span(name, headers, **attributes):
+    """Start a server span for an incoming request and make it current.
+    
+    Returns (span, token); pass both to end_span when the request is done.
+    """
+    span = tracer.start_span(name, context=extract(headers), kind=SpanKind.SERVER, attributes=attributes)
+    return span, context.attach(trace.set_span_in_context(span))
+
+def end_span(span, token, error=None):
+    if error is not None:
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+    context.detach(token)
+    span.end()
+
+def tag_job(task_id):
+    """Mark the current span as belonging to a job"""
+    trace.get_current_span().set_attribute(JOB_ATTRIBUTE, task_id)
+
+# Celery. Publishers put the trace context in the message headers. Stages
+# publish the next stage of their chain under the context they were started
+# with, so the stages of a job are siblings rather than nested ever deeper.
+_task_spans = {}
+
+@before_task_publish.connect
+def inject_trace_context(headers=None, **extra):
+    if headers is None:
+        return
+    running = _task_spans.get(current_task.request.id) if current_task else None
+    inject(headers, context=running[2] if running else None)
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, args=None, **extra):
+    carrier = {key: getattr(task.request, key, None) for key in ('traceparent', 'tracestate')}
+    parent = extract({key: value for key, value in carrier.items() if value})
+    
+    job = args[0] if args and isinstance(args[0], dict) else {}
+    attributes = {'celery.task_id': task_id}
+    if job.get('task_id'):
+        attributes[JOB_ATTRIBUTE] = job['task_id']
+    
+    # The time spent queued, from the publisher's timestamp (see metrics.py)
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        queue = (task.request.delivery_info or {}).get('routing_key') or 'unknown'
+        tracer.start_span(
+            f"queued {queue}", context=parent, start_time=int(published_at * 1e9),
+            attributes=dict(attributes, **{'celery.queue': queue})
+        ).end()
+    
+    span = tracer.start_span(task.name, context=parent, kind=SpanKind.CONSUMER, attributes=attributes)
+    _task_spans[task_id] = (span, context.attach(trace.set_span_in_context(span)), parent)
+
+@task_postrun.connect
+def end_task_span(task_id=None, state=None, retval=None, **extra):
+    running = _task_spans.pop(task_id, None)
+    if running is None:
+        return
+    span, token, _ = running
+    span.set_attribute('celery.state', state or 'UNKNOWN')
+    end_span(span, token, retval if state == 'FAILURE' and isinstance(retval, BaseException) else None)
+
+@worker_process_shutdown.connect
+def flush_spans(**extra):
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, 'force_flush'):
+        provider.force_flush()
+
+setup_tracing()
+
+def load_spans(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def chrome_trace(spans, task_id):
+    """Chrome trace events for every trace that contains the job task_id"""
+    spans = list(spans)
+    trace_ids = {s['trace_id'] for s in spans if s['attributes'].get(JOB_ATTRIBUTE) == task_id}
+    events = []
+    for s in spans:
+        if s['trace_id'] not in trace_ids:
+            continue
+        events.append({
+            'name': s['name'],
+            'cat': s['kind'],
+            'ph': 'X',
+            'ts': s['start_ns'] / 1000,
+            'dur': (s['end_ns'] - s['start_ns']) / 1000,
+            'pid': f"{s['service']} {s['attributes'].get('process.pid', '')}".strip(),
+            'tid': s['attributes'].get('thread.id', 0),
+            'args': dict(s['attributes'], status=s['status'])
+        })
+    events.sort(key=lambda event: event['ts'])
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the spans of a job as a Chrome trace')
+    parser.add_argument('task_id')
+    parser.add_argument('files', nargs='*', help=f'span files (default: {TRACING_DIR}/*.jsonl)')
+    args = parser.parse_args()
+    
+    paths = args.files or sorted(glob.glob(os.path.join(TRACING_DIR, '*.jsonl')))
+    report = chrome_trace(load_spans(paths), args.task_id)
+    if not report['traceEvents']:
+        print(f"No spans found for {args.task_id}", file=sys.stderr)
+        return 1
+    json.dump(report, sys.stdout)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import io
+import os
+import hashlib
+import logging
+import tempfile
+import zipfile
+import magic
+from flask import Request, current_app
+from werkzeug.exceptions import BadRequest
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_EXTENSIONS = {'pdf'}
+BATCH_EXTENSIONS = {'pdf', 'zip'}
+PDF_MIME_TYPES = {'application/pdf'}
+UPLOAD_MIME_TYPES = {
+    'pdf': PDF_MIME_TYPES,
+    'zip': {'application/zip'}
+}
+
+# Bytes buffered before the upload's type is sniffed; enough for libmagic
+# to find a PDF header, which may follow up to 1 KB of leading junk
+UPLOAD_SNIFF_BYTES = 2048
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# One libmagic handle for the whole process; python-magic serializes calls
+_magic = magic.Magic(mime=True)
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+def allowed_file(filename, extensions=ALLOWED_EXTENSIONS):
+    return file_extension(filename) in extensions
+
+class InvalidUpload(BadRequest):
+    """Raised while a file is still being received to reject it early"""
+
+class UploadStream:
+    """Receive an uploaded file straight into the upload folder.
+    
+    Each block of the request body is hashed and written to disk as it
+    arrives, and the first UPLOAD_SNIFF_BYTES are checked with libmagic, so a
+    file that is not of one of mime_types is rejected before the rest of it
+    is read. The file is kept only if it is committed; otherwise it is
+    removed on close.
+    """
+    
+    def __init__(self, directory, mime_types=PDF_MIME_TYPES):
+        self.mime_types = mime_types
+        fd, self.path = tempfile.mkstemp(prefix='upload_', suffix='.part', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self.mime_type = None
+        self.size = 0
+        self.committed = False
+    
+    def write(self, data):
+        if self.mime_type is None:
+            self._head += data[:UPLOAD_SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= UPLOAD_SNIFF_BYTES:
+                self._sniff()
+        
+        self._digest.update(data)
+        self._file.write(data)
+        self.size += len(data)
+        return len(data)
+    
+    def _sniff(self):
+        self.mime_type = _magic.from_buffer(self._head)
+        if self.mime_type not in self.mime_types:
+            self.discard()
+            raise InvalidUpload('Invalid PDF file' if self.mime_types == PDF_MIME_TYPES else 'Invalid PDF or ZIP file')
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        # The form parser rewinds the stream once the file part is complete
+        if self.mime_type is None:
+            self._sniff()
+        return self._file.seek(offset, whence)
+    
+    def tell(self):
+        return self._file.tell()
+    
+    def read(self, size=-1):
+        return self._file.read(size)
+    
+    def readline(self, size=-1):
+        return self._file.readline(size)
+    
+    def hexdigest(self):
+        """SHA-256 of everything written so far"""
+        return self._digest.hexdigest()
+    
+    def commit(self, path):
+        """Keep the upload under its final name"""
+        self._file.flush()
+        os.replace(self.path, path)
+        self.path = path
+        self.committed = True
+    
+    def discard(self):
+        """Close and remove an upload that will not be processed"""
+        self._file.close()
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+    
+    def close(self):
+        if self.committed:
+            self._file.close()
+        else:
+            self.discard()
+
+def extract_zip_pdfs(zip_path, directory, max_files, max_size):
+    """Extract the PDFs of a ZIP archive into directory.
+    
+    Entries are copied in blocks and hashed on the way, and anything that is
+    not a PDF is skipped. Entry sizes are enforced while copying, since the
+    sizes recorded in the archive cannot be trusted. Returns a list of
+    (filename, path, sha256) in archive order and the names skipped; on
+    error, nothing extracted is left behind.
+    """
+    documents = []
+    skipped = []
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise InvalidUpload('Invalid ZIP file')
+    
+    try:
+        with archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or name.startswith('.') or '__MACOSX' in info.filename:
+                    continue
+                if not allowed_file(name) or info.file_size > max_size:
+                    skipped.append(info.filename)
+                    continue
+                if len(documents) >= max_files:
+                    raise InvalidUpload(f'At most {max_files} PDFs per batch')
+                
+                path = _extract_pdf(archive, info, directory, max_size)
+                if path is None:
+                    skipped.append(info.filename)
+                else:
+                    documents.append((name, *path))
+    except Exception:
+        for _, path, _ in documents:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    
+    return documents, skipped
+
+def _extract_pdf(archive, info, directory, max_size):
+    """Copy one archive entry to disk; returns (path, sha256), or None if it is not a PDF"""
+    stream = UploadStream(directory)
+    try:
+        with archive.open(info) as entry:
+            for block in iter(lambda: entry.read(STREAM_BLOCK_SIZE), b''):
+                if stream.size + len(block) > max_size:
+                    raise InvalidUpload(f'{info.filename} is too large')
+                stream.write(block)
+        stream.seek(0)
+    except InvalidUpload:
+        stream.discard()
+        if stream.mime_type is not None and stream.mime_type not in PDF_MIME_TYPES:
+            return None
+        raise
+    except (zipfile.BadZipFile, RuntimeError, NotImplementedError) as e:
+        # Corrupt, encrypted or unsupported entries
+        stream.discard()
+        raise InvalidUpload(f'Cannot extract {info.filename}: {e}')
+    
+    stream.commit(stream.path[:-len('.part')] + '.pdf')
+    stream.close()
+    return stream.path, stream.hexdigest()
+
+class UploadRequest(Request):
+    """Request that streams uploads into the upload folder in one pass.
+    
+    The batch upload endpoint also accepts ZIP archives and has its own
+    size limit.
+    """
+    
+    @property
+    def is_batch_upload(self):
+        return self.endpoint == 'upload_batch'
+    
+    @property
+    def max_content_length(self):
+        if self.is_batch_upload:
+            return current_app.config['MAX_BATCH_CONTENT_LENGTH']
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # An empty file field; the view reports that no file was selected
+        if not filename:
+            return io.BytesIO()
+        if self.is_batch_upload:
+            if not allowed_file(filename, BATCH_EXTENSIONS):
+                raise InvalidUpload('Invalid file type. Only PDF and ZIP files are allowed.')
+        elif not allowed_file(filename):
+            raise InvalidUpload('Invalid file type. Only PDF files are allowed.')
+        
+        stream = UploadStream(current_app.config['UPLOAD_FOLDER'], UPLOAD_MIME_TYPES[file_extension(filename)])
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+    
+    def close(self):
+        super().close()
+        # Also covers uploads whose form parsing was aborted part way
+        for stream in self.__dict__.get('_upload_streams', []):
+            stream.close()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Synthetic PDF corpus for the pipeline benchmark.
+
+Documents are generated from a seed, so every run (and every commit) sees
+the same text. Pages are plain Helvetica text; a share of each page's lines
+are equations, which decides whether the backend routes a page to GROBID.
+"""
+
+import random
+
+WORDS = (
+    "the of and to in is that for it as with was on be by this are or from at "
+    "an which we have not but can all their has been one more its were will "
+    "model result method value data function system process analysis paper "
+    "section theorem proof example number order space time case field form "
+    "point set given show follows approach problem study state energy rate"
+).split()
+
+VARIABLES = 'abcdfgknpqrstuvwxyz'
+LINES_PER_PAGE = 40
+LINE_WORDS = (8, 14)
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(*LINE_WORDS))]
+    return ' '.join(words).capitalize() + '.'
+
+def equation(rng):
+    """An ASCII equation the backend's math detection recognises"""
+    left = rng.choice(VARIABLES)
+    if rng.random() < 0.5:
+        left += f"_{rng.randint(0, 9)}"
+    terms = [
+        f"{rng.randint(2, 9)} {rng.choice(VARIABLES)}^{rng.randint(2, 4)}",
+        f"{rng.choice(VARIABLES)} / {rng.randint(2, 9)}",
+        f"sqrt({rng.choice(VARIABLES)})",
+        f"({rng.choice(VARIABLES)} - {rng.randint(1, 9)})"
+    ]
+    rng.shuffle(terms)
+    return f"{left} = {' + '.join(terms[:rng.randint(2, 4)])}"
+
+def document_pages(pages, math_density, seed):
+    """Lines of text for each page of one document"""
+    rng = random.Random(seed)
+    content = []
+    for page in range(pages):
+        lines = [f"Section {page + 1}"]
+        for _ in range(LINES_PER_PAGE - 1):
+            lines.append(equation(rng) if rng.random() < math_density else sentence(rng))
+        content.append(lines)
+    return content
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def render_pdf(pages, nonce=''):
+    """Render pages of text lines as PDF bytes.
+    
+    nonce is written into a comment, so the same document can be uploaded
+    again without hitting the result cache.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = ' '.join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    font = 3 + 2 * len(pages)
+    
+    for i, lines in enumerate(pages):
+        objects.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>"
+        ).encode())
+        operators = ['BT', '/F1 10 Tf', '17 TL', '60 750 Td']
+        operators += [f"({escape(line)}) Tj T*" for line in lines]
+        operators.append('ET')
+        stream = '\n'.join(operators).encode('latin-1', 'replace')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    
+    output = b"%PDF-1.4\n" + f"% {nonce}\n".encode()
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += b''.join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return output
+
+def build_corpus(sizes, math_densities, seed=0):
+    """One document spec for each combination of page count and math density"""
+    corpus = []
+    for pages in sizes:
+        for density in math_densities:
+            name = f"synthetic-{pages}p-math{int(density * 100)}"
+            corpus.append({
+                'name': name,
+                'pages': pages,
+                'math_density': density,
+                'content': document_pages(pages, density, f"{seed}:{name}")
+            })
+    return corpus
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline benchmark against the local mock services.
+
+Starts Redis, grobid-mock, piper-mock, the Flask app and both Celery worker
+pools as local processes (or uses a stack that is already running with
+--no-start), uploads a synthetic corpus with a number of concurrent clients,
+follows every job over /events and prints a JSON report: throughput,
+per-stage latency percentiles and the peak RSS of each service.
+
+    python benchmarks/run_benchmark.py --documents 24 --concurrency 4 \\
+        --output bench-$(git rev-parse --short HEAD).json
+    python benchmarks/run_benchmark.py --baseline bench-abc1234.json
+
+Every run starts from an empty Redis and a fixed corpus, so reports taken
+on different commits with the same options can be compared.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from corpus import build_corpus, render_pdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+SERVICES = os.path.join(ROOT, 'docker-services')
+
+DOCUMENT_QUEUES = 'extract,extract.long,text,synthesize,synthesize.long'
+STAGES = ['queued', 'analyzing', 'extracting', 'ocr_fallback', 'processing', 'synthesizing', 'encoding']
+PERCENTILES = (50, 90, 95, 99)
+RSS_SAMPLE_INTERVAL = 0.25
+STARTUP_TIMEOUT = 60
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for(url, timeout=STARTUP_TIMEOUT):
+    """Wait until url answers, or raise"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def process_tree(pid):
+    """pid and all of its descendants, from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; fields resume after ')'
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+def resident_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, IndexError, ValueError):
+        return 0
+
+class RSSSampler(threading.Thread):
+    """Track the peak total RSS of each service's process tree"""
+    
+    def __init__(self, processes):
+        super().__init__(daemon=True)
+        self.processes = processes
+        self.peaks = {name: 0 for name in processes}
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.wait(RSS_SAMPLE_INTERVAL):
+            self.sample()
+    
+    def sample(self):
+        for name, process in self.processes.items():
+            total = sum(resident_bytes(pid) for pid in process_tree(process.pid))
+            self.peaks[name] = max(self.peaks[name], total)
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+        return {name: round(peak / 2 ** 20, 1) for name, peak in self.peaks.items()}
+
+class LocalStack:
+    """The backend and its mock services, run as local processes"""
+    
+    def __init__(self, args):
+        self.args = args
+        self.processes = {}
+        self.workdir = tempfile.mkdtemp(prefix='pdf2audio-bench-')
+        self.api_port = args.api_port or free_port()
+        self.url = f"http://127.0.0.1:{self.api_port}"
+        self.redis_url = args.redis_url
+    
+    def spawn(self, name, command, cwd, env):
+        log = open(os.path.join(self.workdir, f'{name}.log'), 'wb')
+        self.processes[name] = subprocess.Popen(
+            command, cwd=cwd, env=dict(os.environ, **env),
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    
+    def start(self):
+        if not self.redis_url:
+            if not shutil.which('redis-server'):
+                raise RuntimeError('redis-server not found; install it or pass --redis-url')
+            port = free_port()
+            self.spawn('redis', ['redis-server', '--port', str(port), '--save', '', '--appendonly', 'no'], self.workdir, {})
+            self.redis_url = f"redis://127.0.0.1:{port}/0"
+        
+        grobid_port, piper_port = free_port(), free_port()
+        self.spawn('grobid-mock', [sys.executable, 'app.py'], os.path.join(SERVICES, 'grobid-mock'),
+                   {'PORT': str(grobid_port), 'MOCK_DEBUG': 'false'})
+        self.spawn('piper-mock', [sys.executable, 'app.py'], os.path.join(SERVICES, 'piper-mock'),
+                   {'PORT': str(piper_port), 'MOCK_DEBUG': 'false', 'MOCK_PROFILE': self.args.profile})
+        
+        backend_env = {
+            'REDIS_URL': self.redis_url,
+            'CELERY_BROKER_URL': self.redis_url,
+            'CELERY_RESULT_BACKEND': self.redis_url,
+            'GROBID_URL': f"http://127.0.0.1:{grobid_port}",
+            'PIPER_URL': f"http://127.0.0.1:{piper_port}",
+            'SRE_URL': self.args.sre_url,
+            'UPLOAD_FOLDER': os.path.join(self.workdir, 'uploads'),
+            'TEMP_FOLDER': os.path.join(self.workdir, 'temp'),
+            'PYTHONPATH': BACKEND
+        }
+        self.spawn('api', [
+            'gunicorn', '--bind', f'127.0.0.1:{self.api_port}', '--workers', '4',
+            '--worker-class', 'gthread', '--threads', '8', '--timeout', '300', 'app:app'
+        ], BACKEND, backend_env)
+        self.spawn('worker', [
+            'celery', '-A', 'app.celery', 'worker', '--loglevel=warning', '-Q', DOCUMENT_QUEUES,
+            f'--concurrency={self.args.worker_concurrency}', '--hostname=bench-documents@%h'
+        ], BACKEND, backend_env)
+        self.spawn('worker-cpu', [
+            'celery', '-A', 'app.celery', 'worker', '--loglevel=warning', '-Q', 'cpu',
+            f'--concurrency={self.args.cpu_concurrency}', '--hostname=bench-cpu@%h'
+        ], BACKEND, backend_env)
+        
+        wait_for(f"http://127.0.0.1:{grobid_port}/health")
+        wait_for(f"http://127.0.0.1:{piper_port}/health")
+        wait_for(f"{self.url}/health")
+    
+    def stop(self):
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.args.keep_logs:
+            print(f"Service logs kept in {self.workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+def follow_events(url, task_id, timeout):
+    """Record when each stage of a job is first seen, until it finishes"""
+    seen = {}
+    with requests.get(f"{url}/events/{task_id}", stream=True, timeout=(5, timeout)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            status = json.loads(line[5:])
+            seen.setdefault(status['stage'], time.time())
+            if status['state'] in ('SUCCESS', 'FAILURE'):
+                return status, seen
+    raise RuntimeError(f"Event stream for {task_id} ended early")
+
+def run_document(url, document, client, run_id, voice, audio_format, timeout):
+    """Upload one document and follow it to the end"""
+    pdf = render_pdf(document['content'], nonce=f"{run_id}:{uuid.uuid4()}")
+    record = {'name': document['name'], 'pages': document['pages'], 'math_density': document['math_density']}
+    
+    started = time.time()
+    try:
+        response = requests.post(
+            f"{url}/upload",
+            files={'file': (f"{document['name']}.pdf", pdf, 'application/pdf')},
+            data={'voice': voice, 'format': audio_format},
+            headers={'X-Client-ID': client},
+            timeout=60
+        )
+        response.raise_for_status()
+        accepted = time.time()
+        task_id = response.json()['task_id']
+        status, seen = follow_events(url, task_id, timeout)
+    except Exception as e:
+        return dict(record, state='ERROR', error=str(e))
+    finished = time.time()
+    
+    # A stage lasts until the next stage is first seen
+    ordered = sorted(seen.items(), key=lambda item: item[1])
+    stages = {}
+    for (stage, at), (_, until) in zip(ordered, ordered[1:]):
+        if stage in STAGES:
+            stages[stage] = until - at
+    if 'queued' in stages:
+        # The first event arrives after the event stream connects
+        stages['queued'] += seen['queued'] - accepted
+    
+    return dict(
+        record,
+        task_id=task_id,
+        state=status['state'],
+        error=status.get('error'),
+        upload=accepted - started,
+        end_to_end=finished - started,
+        stages=stages
+    )
+
+def percentiles(values):
+    """Percentile summary of a list of seconds, by linear interpolation"""
+    if not values:
+        return None
+    values = sorted(values)
+    summary = {'count': len(values), 'mean': sum(values) / len(values), 'max': values[-1]}
+    for p in PERCENTILES:
+        position = (len(values) - 1) * p / 100
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        summary[f'p{p}'] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in summary.items()}
+
+def summarize(records, wall_time):
+    succeeded = [r for r in records if r['state'] == 'SUCCESS']
+    stage_times = {}
+    for record in succeeded:
+        for stage, seconds in record['stages'].items():
+            stage_times.setdefault(stage, []).append(seconds)
+    
+    return {
+        'documents': len(records),
+        'succeeded': len(succeeded),
+        'failed': len(records) - len(succeeded),
+        'wall_time': round(wall_time, 3),
+        'throughput': {
+            'documents_per_minute': round(len(succeeded) * 60 / wall_time, 2),
+            'pages_per_minute': round(sum(r['pages'] for r in succeeded) * 60 / wall_time, 2)
+        },
+        'latency': {
+            'upload': percentiles([r['upload'] for r in succeeded]),
+            'end_to_end': percentiles([r['end_to_end'] for r in succeeded]),
+            'stages': {stage: percentiles(stage_times[stage]) for stage in STAGES if stage in stage_times}
+        }
+    }
+
+def compare(report, baseline):
+    """Ratio of each headline figure to the baseline's (above 1 means larger now)"""
+    def ratio(current, previous):
+        if not current or not previous:
+            return None
+        return round(current / previous, 3)
+    
+    summary, previous = report['summary'], baseline['summary']
+    comparison = {
+        'baseline_commit': baseline['meta'].get('commit'),
+        'documents_per_minute': ratio(summary['throughput']['documents_per_minute'],
+                                      previous['throughput']['documents_per_minute']),
+        'end_to_end_p50': ratio((summary['latency']['end_to_end'] or {}).get('p50'),
+                                (previous['latency']['end_to_end'] or {}).get('p50')),
+        'end_to_end_p95': ratio((summary['latency']['end_to_end'] or {}).get('p95'),
+                                (previous['latency']['end_to_end'] or {}).get('p95')),
+        'stages_p95': {
+            stage: ratio(stats['p95'], previous['latency']['stages'].get(stage, {}).get('p95'))
+            for stage, stats in summary['latency']['stages'].items()
+        }
+    }
+    if report.get('peak_rss_mb') and baseline.get('peak_rss_mb'):
+        comparison['peak_rss'] = {
+            name: ratio(peak, baseline['peak_rss_mb'].get(name))
+            for name, peak in report['peak_rss_mb'].items()
+        }
+    return comparison
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=24, help='documents to upload (default: 24)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients (default: 4)')
+    parser.add_argument('--sizes', default='2,12,48', help='page counts in the corpus (default: 2,12,48)')
+    parser.add_argument('--math', default='0,0.1,0.4', help='share of equation lines per page (default: 0,0.1,0.4)')
+    parser.add_argument('--seed', type=int, default=0, help='corpus seed (default: 0)')
+    parser.add_argument('--format', default='wav', help='audio format to request (default: wav)')
+    parser.add_argument('--voice', default='en_US-lessac-medium')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed documents run first (default: 1)')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for one job (default: 600)')
+    parser.add_argument('--profile', default='instant', help='piper-mock latency profile (default: instant)')
+    parser.add_argument('--worker-concurrency', type=int, default=8)
+    parser.add_argument('--cpu-concurrency', type=int, default=2)
+    parser.add_argument('--no-start', action='store_true', help='benchmark a stack that is already running at --url')
+    parser.add_argument('--url', default='http://localhost:5000', help='API URL with --no-start')
+    parser.add_argument('--api-port', type=int, help='port for the API started by the benchmark')
+    parser.add_argument('--redis-url', help='use this Redis instead of starting redis-server (it is not flushed)')
+    parser.add_argument('--sre-url', default='http://127.0.0.1:9', help='SRE service; by default none, so math uses the fallback')
+    parser.add_argument('--keep-logs', action='store_true', help='keep service logs and files')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    args = parser.parse_args()
+    
+    corpus = build_corpus(parse_list(args.sizes, int), parse_list(args.math, float), args.seed)
+    schedule = [corpus[i % len(corpus)] for i in range(args.documents)]
+    run_id = uuid.uuid4().hex
+    
+    stack = None
+    sampler = None
+    url = args.url
+    if not args.no_start:
+        stack = LocalStack(args)
+        stack.start()
+        url = stack.url
+    
+    try:
+        for document in corpus[:args.warmup]:
+            result = run_document(url, document, 'warmup', run_id, args.voice, args.format, args.timeout)
+            if result['state'] != 'SUCCESS':
+                raise RuntimeError(f"Warm-up document failed: {result.get('error')}")
+        
+        if stack:
+            sampler = RSSSampler(stack.processes)
+            sampler.start()
+        
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_document, url, document, f"bench-{i % args.concurrency}",
+                            run_id, args.voice, args.format, args.timeout)
+                for i, document in enumerate(schedule)
+            ]
+            records = [future.result() for future in futures]
+        wall_time = time.time() - started
+        peak_rss = sampler.stop() if sampler else None
+    finally:
+        if stack:
+            stack.stop()
+    
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'options': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+        },
+        'summary': summarize(records, wall_time),
+        'peak_rss_mb': peak_rss,
+        'documents': records
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f))
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0 if report['summary']['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -34,12 +34,16 @@ def cleanup_old_files(directory, ttl_hours):
             if os.path.isfile(filepath):
                 file_mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
                 
+                # The backend result cache refreshes the mtime of audio it
+                # serves again, so frequently requested files are kept
                 if file_mtime < cutoff_time:
                     try:
-                        file_size = os.path.getsize(filepath)
+                        file_stat = os.stat(filepath)
                         os.remove(filepath)
                         removed_count += 1
-                        total_size += file_size
+                        # Cached audio is hard-linked; space is only freed with the last link
+                        if file_stat.st_nlink == 1:
+                            total_size += file_stat.st_size
                         logger.info(f"Removed {filepath} (age: {datetime.now() - file_mtime})")
                     except Exception as e:
                         logger.error(f"Failed to remove {filepath}: {e}")
@@ -1,3 +1,4 @@
+import os
 import time
 import logging
 from flask import Flask, request, jsonify
@@ -164,4 +165,4 @@ def health_check():
 
 if __name__ == '__main__':
     logger.info("Starting GROBID Mock Service")
-    app.run(host='0.0.0.0', port=8070, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8070)), debug=os.environ.get('MOCK_DEBUG', 'true').lower() == 'true')
\ No newline at end of file
@@ -1,9 +1,12 @@
+import io
 import os
 import time
 import wave
-import struct
+import random
 import logging
-from flask import Flask, request, jsonify, send_file
+import threading
+import numpy as np
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 
 # Configure logging
@@ -16,40 +19,91 @@ CORS(app)
 TEMP_DIR = '/app/temp'
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-def generate_mock_audio(text, output_path, duration_seconds=None):
-    """Generate a mock audio file with sine wave"""
-    if duration_seconds is None:
-        # Estimate duration based on text length (roughly 150 words per minute)
-        words = len(text.split())
-        duration_seconds = max(2, words / 2.5)  # Minimum 2 seconds
+SAMPLE_RATE = 22050  # Piper's medium voices
+
+# Simulated service behaviour. latency is the fixed cost of a request and
+# real_time_factor the seconds of work per second of audio, varied by up to
+# +/- jitter; concurrency is the number of requests served at once (Piper's
+# pool size, 0 for unlimited), with other requests waiting up to
+# acquire_timeout; error_rate is the share of requests answered 503.
+PROFILES = {
+    # No delay at all, to measure the pipeline alone
+    'instant': {'latency': 0, 'real_time_factor': 0, 'jitter': 0, 'concurrency': 0, 'acquire_timeout': 60, 'error_rate': 0},
+    # Piper with a warm pool of two processes on a modern CPU
+    'realistic': {'latency': 0.05, 'real_time_factor': 0.15, 'jitter': 0.2, 'concurrency': 2, 'acquire_timeout': 60, 'error_rate': 0},
+    # A loaded or low-end host
+    'slow': {'latency': 0.3, 'real_time_factor': 0.6, 'jitter': 0.3, 'concurrency': 1, 'acquire_timeout': 60, 'error_rate': 0},
+    # Realistic, with occasional overload responses to exercise retries
+    'flaky': {'latency': 0.05, 'real_time_factor': 0.15, 'jitter': 0.5, 'concurrency': 2, 'acquire_timeout': 60, 'error_rate': 0.05},
+}
+
+# Settings that are counts; the others are seconds or fractions
+INTEGER_SETTINGS = {'concurrency', 'acquire_timeout'}
+
+def load_profile():
+    """Return the profile named by MOCK_PROFILE, with MOCK_* overrides"""
+    name = os.environ.get('MOCK_PROFILE', 'realistic')
+    profile = dict(PROFILES[name], name=name)
+    for key in PROFILES[name]:
+        override = os.environ.get(f"MOCK_{key.upper()}")
+        if override is not None:
+            profile[key] = int(float(override)) if key in INTEGER_SETTINGS else float(override)
+    return profile
+
+PROFILE = load_profile()
+_slots = threading.BoundedSemaphore(PROFILE['concurrency']) if PROFILE['concurrency'] else None
+
+def estimate_duration(text, speed=1.0):
+    """Estimate spoken duration from text length (roughly 150 words per minute)"""
+    words = len(text.split())
+    return max(2, words / 2.5) / speed  # Minimum 2 seconds
+
+def generate_mock_audio(text, duration_seconds=None, speed=1.0):
+    """Generate mock speech, a tone with a triangle envelope, as WAV bytes.
     
-    sample_rate = 22050
-    num_samples = int(sample_rate * duration_seconds)
+    The samples are computed with NumPy and written in one call, so even
+    long outputs cost milliseconds rather than seconds.
+    """
+    if duration_seconds is None:
+        duration_seconds = estimate_duration(text, speed)
     
-    # Generate a simple sine wave
+    t = np.arange(int(SAMPLE_RATE * duration_seconds)) / SAMPLE_RATE
     frequency = 440  # A4 note
-    samples = []
-    for i in range(num_samples):
-        # Create a simple tone that fades in and out
-        t = i / sample_rate
-        amplitude = 0.3 * (1 - abs(2 * t / duration_seconds - 1))  # Triangle envelope
-        sample = amplitude * 32767 * (
-            0.5 * (1 + 0.5 * (t * frequency % 1)) +  # Sawtooth-like wave
-            0.3 * (1 if (t * frequency * 2) % 1 > 0.5 else -1)  # Square wave component
-        )
-        samples.append(int(sample))
+    amplitude = 0.3 * (1 - np.abs(2 * t / duration_seconds - 1))  # Triangle envelope
+    samples = amplitude * 32767 * (
+        0.5 * (1 + 0.5 * (t * frequency % 1)) +  # Sawtooth-like wave
+        0.3 * np.where((t * frequency * 2) % 1 > 0.5, 1, -1)  # Square wave component
+    )
     
-    # Write WAV file
-    with wave.open(output_path, 'w') as wav_file:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
         wav_file.setnchannels(1)  # Mono
         wav_file.setsampwidth(2)  # 16-bit
-        wav_file.setframerate(sample_rate)
-        
-        # Convert samples to bytes
-        for sample in samples:
-            wav_file.writeframes(struct.pack('<h', sample))
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
     
-    return True
+    return buffer.getvalue()
+
+class Overloaded(Exception):
+    """Raised to simulate a busy or failing Piper service"""
+
+def simulate_synthesis(audio_duration, profile=PROFILE):
+    """Take as long as Piper would to synthesize audio_duration seconds of speech"""
+    if random.random() < profile['error_rate']:
+        raise Overloaded('Simulated overload')
+    
+    delay = profile['latency'] + profile['real_time_factor'] * audio_duration
+    delay *= 1 + random.uniform(-profile['jitter'], profile['jitter'])
+    
+    if _slots is None:
+        time.sleep(delay)
+        return
+    if not _slots.acquire(timeout=profile['acquire_timeout']):
+        raise Overloaded('No idle Piper process')
+    try:
+        time.sleep(delay)
+    finally:
+        _slots.release()
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -57,7 +111,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'piper-mock',
-        'available_voices': ['en_US-lessac-medium']
+        'available_voices': ['en_US-lessac-medium'],
+        'profile': PROFILE
     })
 
 @app.route('/voices', methods=['GET'])
@@ -90,21 +145,13 @@ def synthesize_speech():
         
         logger.info(f"Mock TTS request: {len(text)} characters, voice: {voice}, speed: {speed}")
         
-        # Simulate processing time
-        time.sleep(1)
-        
-        # Generate mock audio file
-        output_path = os.path.join(TEMP_DIR, f"mock_audio_{int(time.time())}.wav")
+        audio_data = generate_mock_audio(text, speed=speed)
+        simulate_synthesis(estimate_duration(text, speed))
         
-        if generate_mock_audio(text, output_path):
-            return send_file(
-                output_path,
-                mimetype='audio/wav',
-                as_attachment=False
-            )
-        else:
-            return jsonify({'error': 'Audio generation failed'}), 500
-            
+        return Response(audio_data, mimetype='audio/wav')
+    
+    except Overloaded as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Mock synthesis error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -127,25 +174,25 @@ def synthesize_to_file():
         
         logger.info(f"Mock TTS file request: {len(text)} characters, output: {output_path}")
         
-        # Simulate processing time
-        time.sleep(2)
+        audio_data = generate_mock_audio(text)
+        simulate_synthesis(estimate_duration(text))
+        with open(output_path, 'wb') as f:
+            f.write(audio_data)
         
-        # Generate mock audio
-        if generate_mock_audio(text, output_path):
-            return jsonify({
-                'success': True,
-                'output_path': output_path,
-                'voice_used': voice,
-                'text_length': len(text),
-                'mock': True
-            })
-        else:
-            return jsonify({'error': 'Audio generation failed'}), 500
-            
+        return jsonify({
+            'success': True,
+            'output_path': output_path,
+            'voice_used': voice,
+            'text_length': len(text),
+            'mock': True
+        })
+    
+    except Overloaded as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Mock file synthesis error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
-    logger.info("Starting Piper TTS Mock Service")
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    logger.info(f"Starting Piper TTS Mock Service with the {PROFILE['name']} profile")
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=os.environ.get('MOCK_DEBUG', 'true').lower() == 'true', threaded=True)
\ No newline at end of file
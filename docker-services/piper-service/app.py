@@ -1,9 +1,18 @@
 import os
-import subprocess
+import json
+import time
+import queue
+import select
 import tempfile
+import threading
+import subprocess
 import logging
-from flask import Flask, request, jsonify, send_file
+from collections import deque, OrderedDict
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
+from opentelemetry import trace, context
+from opentelemetry.propagate import extract
+from opentelemetry.trace import SpanKind, Status, StatusCode
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +25,85 @@ PIPER_BINARY = '/app/piper'
 MODELS_DIR = '/app/models'
 TEMP_DIR = '/app/temp'
 
+# Worker pool configuration
+POOL_SIZE = int(os.environ.get('PIPER_POOL_SIZE', 2))
+SYNTHESIS_TIMEOUT = int(os.environ.get('PIPER_SYNTHESIS_TIMEOUT', 120))
+ACQUIRE_TIMEOUT = int(os.environ.get('PIPER_ACQUIRE_TIMEOUT', 60))
+HEALTH_CHECK_INTERVAL = int(os.environ.get('PIPER_HEALTH_CHECK_INTERVAL', 30))
+# Every voice and speed has its own pool of processes, each holding the model,
+# so speeds are rounded to a few steps and idle pools are shut down beyond
+# PIPER_MAX_POOLS, least recently used first
+MAX_POOLS = int(os.environ.get('PIPER_MAX_POOLS', 4))
+MIN_SPEED = 0.5
+MAX_SPEED = 2.0
+SPEED_STEP = 0.1
+WARMUP_TEXT = 'Warming up.'
+
+# Tracing: requests join the caller's trace from its traceparent header. The
+# span records match the backend's (see backend/tracing.py), so one job's
+# spans from both can be read together.
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'none').lower()
+TRACING_DIR = os.environ.get('TRACING_DIR', '/app/traces')
+SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'piper-service')
+tracer = trace.get_tracer('piper-service')
+
+def setup_tracing():
+    """Install a tracer provider that exports to TRACING_EXPORTER"""
+    if TRACING_EXPORTER not in ('file', 'otlp', 'console'):
+        return
+    
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult, ConsoleSpanExporter
+    
+    class FileSpanExporter(SpanExporter):
+        def __init__(self, path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.path = path
+        
+        def export(self, spans):
+            records = []
+            for span in spans:
+                records.append(json.dumps({
+                    'trace_id': format(span.context.trace_id, '032x'),
+                    'span_id': format(span.context.span_id, '016x'),
+                    'parent_id': format(span.parent.span_id, '016x') if span.parent else None,
+                    'name': span.name,
+                    'kind': span.kind.name,
+                    'service': SERVICE_NAME,
+                    'start_ns': span.start_time,
+                    'end_ns': span.end_time,
+                    'status': span.status.status_code.name,
+                    'attributes': dict(span.attributes or {})
+                }, default=str) + '\n')
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(''.join(records))
+            except OSError as e:
+                logger.warning(f"Writing spans to {self.path} failed: {e}")
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+    
+    class ThreadProcessor(SpanProcessor):
+        def on_start(self, span, parent_context=None):
+            span.set_attribute('process.pid', os.getpid())
+            span.set_attribute('thread.id', threading.get_ident())
+    
+    if TRACING_EXPORTER == 'file':
+        exporter = FileSpanExporter(os.path.join(TRACING_DIR, f"{SERVICE_NAME}.jsonl"))
+    elif TRACING_EXPORTER == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    else:
+        exporter = ConsoleSpanExporter()
+    
+    provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}))
+    provider.add_span_processor(ThreadProcessor())
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+setup_tracing()
+
 # Ensure temp directory exists
 os.makedirs(TEMP_DIR, exist_ok=True)
 
@@ -30,13 +118,285 @@ AVAILABLE_VOICES = {
     }
 }
 
+class PiperProcess:
+    """A long-lived Piper process with its voice model loaded.
+    
+    Requests are written to stdin as JSON lines; Piper writes the audio to the
+    requested output file and prints its path on stdout once done.
+    """
+    
+    def __init__(self, voice, length_scale):
+        self.voice = voice
+        self.length_scale = length_scale
+        self.process = None
+        self.stderr_tail = deque(maxlen=20)
+        self.start()
+    
+    @tracer.start_as_current_span('piper.spawn')
+    def start(self):
+        voice_info = AVAILABLE_VOICES[self.voice]
+        cmd = [
+            PIPER_BINARY,
+            '--model', os.path.join(MODELS_DIR, voice_info['model']),
+            '--config', os.path.join(MODELS_DIR, voice_info['config']),
+            '--json-input',
+            '--output_dir', TEMP_DIR
+        ]
+        if self.length_scale != 1.0:
+            cmd.extend(['--length_scale', str(self.length_scale)])
+        
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        
+        self.served = 0
+        
+        # Drain stderr so Piper's logging can never fill the pipe and block it
+        threading.Thread(target=self._drain_stderr, args=(self.process,), daemon=True).start()
+    
+    def _drain_stderr(self, process):
+        for line in process.stderr:
+            self.stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+    
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+    
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        self.process = None
+    
+    def restart(self):
+        self.stop()
+        self.start()
+    
+    def synthesize(self, text, output_path, timeout=SYNTHESIS_TIMEOUT):
+        """Synthesize text into output_path"""
+        # A process's first request also waits for Piper to load the model
+        with tracer.start_as_current_span('piper.subprocess', attributes={
+            'piper.pid': self.process.pid,
+            'piper.cold_start': self.served == 0,
+            'piper.text_length': len(text)
+        }):
+            request_line = json.dumps({'text': text, 'output_file': output_path}) + '\n'
+            self.process.stdin.write(request_line.encode('utf-8'))
+            self.process.stdin.flush()
+            
+            ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+            if not ready:
+                raise TimeoutError(f"Piper did not respond within {timeout}s")
+            
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"Piper exited: {' | '.join(self.stderr_tail)}")
+            
+            self.served += 1
+            return line.decode('utf-8').strip()
+
+class PiperPool:
+    """A fixed-size pool of warm Piper processes for one voice and speed"""
+    
+    def __init__(self, voice, length_scale, size=POOL_SIZE):
+        self.voice = voice
+        self.length_scale = length_scale
+        self.processes = [PiperProcess(voice, length_scale) for _ in range(size)]
+        self.idle = queue.Queue()
+        for process in self.processes:
+            self.idle.put(process)
+        self.restarts = 0
+        self.requests = 0
+        self.closed = False
+    
+    def synthesize(self, text, output_path):
+        try:
+            with tracer.start_as_current_span('piper.acquire'):
+                process = self.idle.get(timeout=ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"No idle Piper process for {self.voice}")
+        
+        try:
+            if not process.is_alive():
+                self._restart(process, 'found dead')
+            self.requests += 1
+            return process.synthesize(text, output_path)
+        except Exception:
+            # The process state is unknown after a failure, start over
+            self._restart(process, 'failed')
+            raise
+        finally:
+            if self.closed:
+                process.stop()
+            else:
+                self.idle.put(process)
+    
+    def shutdown(self):
+        """Stop the idle processes now and busy ones when they finish.
+        
+        A request that picked the pool just before it was shut down still gets
+        a process, restarted for it and stopped again afterwards.
+        """
+        self.closed = True
+        for _ in range(self.idle.qsize()):
+            try:
+                process = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            process.stop()
+            self.idle.put(process)
+    
+    def warmup(self):
+        """Run a short synthesis on every process so the first request is fast"""
+        for _ in self.processes:
+            output_path = os.path.join(TEMP_DIR, f"warmup_{threading.get_ident()}_{time.time_ns()}.wav")
+            try:
+                self.synthesize(WARMUP_TEXT, output_path)
+            finally:
+                try:
+                    os.unlink(output_path)
+                except OSError:
+                    pass
+    
+    def check_health(self):
+        """Restart idle processes that have exited"""
+        for _ in range(self.idle.qsize()):
+            try:
+                process = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if not process.is_alive():
+                    self._restart(process, 'crashed')
+            finally:
+                self.idle.put(process)
+    
+    def _restart(self, process, reason):
+        logger.warning(f"Restarting Piper process for {self.voice} ({reason}): {' | '.join(process.stderr_tail)}")
+        trace.get_current_span().add_event('piper.restart', {'reason': reason})
+        process.restart()
+        self.restarts += 1
+    
+    def status(self):
+        return {
+            'voice': self.voice,
+            'length_scale': self.length_scale,
+            'size': len(self.processes),
+            'alive': sum(1 for p in self.processes if p.is_alive()),
+            'idle': self.idle.qsize(),
+            'requests': self.requests,
+            'restarts': self.restarts
+        }
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+def parse_speed(value):
+    """Round a requested speed to a SPEED_STEP multiple; ValueError if out of range"""
+    speed = float(value)
+    if not MIN_SPEED <= speed <= MAX_SPEED:
+        raise ValueError(f"Speed must be between {MIN_SPEED} and {MAX_SPEED}")
+    return round(round(speed / SPEED_STEP) * SPEED_STEP, 2)
+
+def get_pool(voice, speed):
+    """Return the pool for a voice and speed, starting it on first use"""
+    length_scale = round(1.0 / parse_speed(speed), 2)
+    key = (voice, length_scale)
+    evicted = []
+    with _pools_lock:
+        if key in _pools:
+            _pools.move_to_end(key)
+            return _pools[key]
+        with tracer.start_as_current_span('piper.start_pool', attributes={'piper.voice': voice}):
+            pool = _pools[key] = PiperPool(voice, length_scale)
+        while len(_pools) > MAX_POOLS:
+            evicted.append(_pools.popitem(last=False)[1])
+    for old in evicted:
+        logger.info(f"Shutting down Piper pool for {old.voice} at length scale {old.length_scale}")
+        old.shutdown()
+    return pool
+
+def warmup_pools():
+    """Start and warm a default-speed pool for every installed voice"""
+    for voice, voice_info in AVAILABLE_VOICES.items():
+        if not os.path.exists(os.path.join(MODELS_DIR, voice_info['model'])):
+            logger.warning(f"Skipping warmup for {voice}: model not found")
+            continue
+        try:
+            started = time.time()
+            get_pool(voice, 1.0).warmup()
+            logger.info(f"Warmed up {POOL_SIZE} Piper processes for {voice} in {time.time() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Warmup failed for {voice}: {e}")
+
+def health_monitor():
+    """Periodically restart crashed Piper processes"""
+    while True:
+        time.sleep(HEALTH_CHECK_INTERVAL)
+        with _pools_lock:
+            pools = list(_pools.values())
+        for pool in pools:
+            try:
+                pool.check_health()
+            except Exception as e:
+                logger.error(f"Health check failed for {pool.voice}: {e}")
+
+def validate_request(data):
+    """Validate a synthesis request, returning an error response or None"""
+    if not data or 'text' not in data:
+        return jsonify({'error': 'Text is required'}), 400
+    
+    voice = data.get('voice', 'en_US-lessac-medium')
+    if voice not in AVAILABLE_VOICES:
+        return jsonify({'error': f'Voice {voice} not available'}), 400
+    
+    try:
+        parse_speed(data.get('speed', 1.0))
+    except (TypeError, ValueError):
+        return jsonify({'error': f'Speed must be a number between {MIN_SPEED} and {MAX_SPEED}'}), 400
+    
+    model_path = os.path.join(MODELS_DIR, AVAILABLE_VOICES[voice]['model'])
+    if not os.path.exists(model_path):
+        return jsonify({'error': f'Model file not found: {AVAILABLE_VOICES[voice]["model"]}'}), 500
+    
+    return None
+
+@app.before_request
+def start_request_span():
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    span = tracer.start_span(
+        f"{request.method} {route}", context=extract(request.headers), kind=SpanKind.SERVER,
+        attributes={'http.method': request.method, 'http.route': route}
+    )
+    g.request_span = (span, context.attach(trace.set_span_in_context(span)))
+
+@app.teardown_request
+def end_request_span(error=None):
+    if 'request_span' in g:
+        span, token = g.pop('request_span')
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+        context.detach(token)
+        span.end()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    with _pools_lock:
+        pools = [pool.status() for pool in _pools.values()]
+    
     return jsonify({
         'status': 'healthy',
         'available_voices': list(AVAILABLE_VOICES.keys()),
-        'piper_binary': os.path.exists(PIPER_BINARY)
+        'piper_binary': os.path.exists(PIPER_BINARY),
+        'pools': pools
     })
 
 @app.route('/voices', methods=['GET'])
@@ -52,78 +412,33 @@ def synthesize_speech():
     try:
         data = request.get_json()
         
-        if not data or 'text' not in data:
-            return jsonify({'error': 'Text is required'}), 400
+        error = validate_request(data)
+        if error:
+            return error
         
-        text = data['text']
-        voice = data.get('voice', 'en_US-lessac-medium')
-        speed = data.get('speed', 1.0)
+        pool = get_pool(data.get('voice', 'en_US-lessac-medium'), data.get('speed', 1.0))
         
-        if voice not in AVAILABLE_VOICES:
-            return jsonify({'error': f'Voice {voice} not available'}), 400
-        
-        # Prepare model paths
-        voice_info = AVAILABLE_VOICES[voice]
-        model_path = os.path.join(MODELS_DIR, voice_info['model'])
-        config_path = os.path.join(MODELS_DIR, voice_info['config'])
-        
-        if not os.path.exists(model_path):
-            return jsonify({'error': f'Model file not found: {voice_info["model"]}'}), 500
-        
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as text_file:
-            text_file.write(text)
-            text_file_path = text_file.name
-        
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as audio_file:
+        with tempfile.NamedTemporaryFile(suffix='.wav', dir=TEMP_DIR, delete=False) as audio_file:
             audio_file_path = audio_file.name
         
         try:
-            # Run Piper TTS
-            cmd = [
-                PIPER_BINARY,
-                '--model', model_path,
-                '--config', config_path,
-                '--output_file', audio_file_path
-            ]
-            
-            # Add speed control if supported
-            if speed != 1.0:
-                cmd.extend(['--length_scale', str(1.0 / speed)])
-            
-            # Run the command with text input
-            with open(text_file_path, 'r') as input_file:
-                result = subprocess.run(
-                    cmd,
-                    stdin=input_file,
-                    capture_output=True,
-                    text=True,
-                    timeout=120
-                )
-            
-            if result.returncode != 0:
-                logger.error(f"Piper failed: {result.stderr}")
-                return jsonify({'error': 'Speech synthesis failed'}), 500
+            pool.synthesize(data['text'], audio_file_path)
             
-            # Return the audio file
-            return send_file(
-                audio_file_path,
-                mimetype='audio/wav',
-                as_attachment=False
-            )
+            # Return the audio; chunks are small enough to send from memory
+            with open(audio_file_path, 'rb') as f:
+                audio_data = f.read()
             
+            return Response(audio_data, mimetype='audio/wav')
+        
         finally:
-            # Clean up temporary files
             try:
-                os.unlink(text_file_path)
+                os.unlink(audio_file_path)
             except:
                 pass
-            
-            # Note: audio file will be cleaned up by Flask after sending
-            
+    
     except Exception as e:
         logger.error(f"Synthesis error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return jsonify({'error': 'Speech synthesis failed'}), 500
 
 @app.route('/synthesize_file', methods=['POST'])
 def synthesize_to_file():
@@ -131,65 +446,30 @@ def synthesize_to_file():
     try:
         data = request.get_json()
         
-        if not data or 'text' not in data:
-            return jsonify({'error': 'Text is required'}), 400
+        error = validate_request(data)
+        if error:
+            return error
         
-        text = data['text']
         voice = data.get('voice', 'en_US-lessac-medium')
         output_path = data.get('output_path')
         
         if not output_path:
             return jsonify({'error': 'Output path is required'}), 400
         
-        if voice not in AVAILABLE_VOICES:
-            return jsonify({'error': f'Voice {voice} not available'}), 400
-        
-        # Prepare model paths
-        voice_info = AVAILABLE_VOICES[voice]
-        model_path = os.path.join(MODELS_DIR, voice_info['model'])
+        get_pool(voice, data.get('speed', 1.0)).synthesize(data['text'], output_path)
         
-        # Create temporary text file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as text_file:
-            text_file.write(text)
-            text_file_path = text_file.name
-        
-        try:
-            # Run Piper TTS
-            cmd = [
-                PIPER_BINARY,
-                '--model', model_path,
-                '--output_file', output_path
-            ]
-            
-            with open(text_file_path, 'r') as input_file:
-                result = subprocess.run(
-                    cmd,
-                    stdin=input_file,
-                    capture_output=True,
-                    text=True,
-                    timeout=120
-                )
-            
-            if result.returncode != 0:
-                logger.error(f"Piper failed: {result.stderr}")
-                return jsonify({'error': 'Speech synthesis failed'}), 500
-            
-            return jsonify({
-                'success': True,
-                'output_path': output_path,
-                'voice_used': voice
-            })
-            
-        finally:
-            # Clean up temporary text file
-            try:
-                os.unlink(text_file_path)
-            except:
-                pass
-            
+        return jsonify({
+            'success': True,
+            'output_path': output_path,
+            'voice_used': voice
+        })
+    
     except Exception as e:
         logger.error(f"File synthesis error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return jsonify({'error': 'Speech synthesis failed'}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    warmup_pools()
+    threading.Thread(target=health_monitor, daemon=True).start()
+    # The reloader would start a second copy of every Piper process
+    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False, threaded=True)
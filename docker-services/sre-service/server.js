@@ -0,0 +1,132 @@
+// Speech Rule Engine service
+//
+// Keeps one SRE instance loaded and converts batches of MathML strings to
+// speech over HTTP, so callers do not pay Node start-up and engine setup
+// for every expression.
+
+const http = require('http');
+const sre = require('speech-rule-engine');
+
+const PORT = parseInt(process.env.PORT || '8090', 10);
+const MAX_BATCH_SIZE = parseInt(process.env.SRE_MAX_BATCH_SIZE || '1000', 10);
+const MAX_BODY_BYTES = 10 * 1024 * 1024;
+
+let currentConfig = null;
+let processed = 0;
+
+// SRE has one global configuration, so batches are configured and converted
+// one at a time; otherwise a batch could be read under another's rules while
+// the engine is being set up for it
+let engineQueue = Promise.resolve();
+
+function withEngine(domain, style, locale, convert) {
+  const run = engineQueue.then(async () => {
+    await configure(domain, style, locale);
+    return convert();
+  });
+  // A failed batch must not stop the ones queued after it
+  engineQueue = run.catch(() => {});
+  return run;
+}
+
+// Only reconfigure the engine when a request asks for different rules
+async function configure(domain, style, locale) {
+  const key = `${domain}/${style}/${locale}`;
+  if (currentConfig === key) {
+    return;
+  }
+  await sre.setupEngine({ domain, style, locale, markup: 'none' });
+  await sre.engineReady();
+  currentConfig = key;
+}
+
+function sendJson(res, status, body) {
+  const payload = JSON.stringify(body);
+  res.writeHead(status, {
+    'Content-Type': 'application/json',
+    'Content-Length': Buffer.byteLength(payload),
+  });
+  res.end(payload);
+}
+
+function readBody(req) {
+  return new Promise((resolve, reject) => {
+    const chunks = [];
+    let size = 0;
+    req.on('data', (chunk) => {
+      size += chunk.length;
+      if (size > MAX_BODY_BYTES) {
+        reject(new Error('Request body too large'));
+        req.destroy();
+        return;
+      }
+      chunks.push(chunk);
+    });
+    req.on('end', () => resolve(Buffer.concat(chunks).toString('utf8')));
+    req.on('error', reject);
+  });
+}
+
+async function handleSpeech(req, res) {
+  let data;
+  try {
+    data = JSON.parse(await readBody(req));
+  } catch (e) {
+    sendJson(res, 400, { error: 'Invalid JSON body' });
+    return;
+  }
+
+  const mathml = data.mathml;
+  if (!Array.isArray(mathml)) {
+    sendJson(res, 400, { error: 'mathml must be a list of MathML strings' });
+    return;
+  }
+  if (mathml.length > MAX_BATCH_SIZE) {
+    sendJson(res, 413, { error: `Batch too large (max ${MAX_BATCH_SIZE})` });
+    return;
+  }
+
+  const speech = await withEngine(
+    data.domain || 'mathspeak', data.style || 'default', data.locale || 'en',
+    // A single bad expression should not fail the whole batch
+    () => mathml.map((expression) => {
+      try {
+        return sre.toSpeech(expression);
+      } catch (e) {
+        return null;
+      }
+    })
+  );
+  processed += mathml.length;
+
+  sendJson(res, 200, { speech });
+}
+
+const server = http.createServer(async (req, res) => {
+  try {
+    if (req.method === 'GET' && req.url === '/health') {
+      sendJson(res, 200, {
+        status: 'healthy',
+        service: 'sre',
+        config: currentConfig,
+        processed,
+      });
+    } else if (req.method === 'POST' && req.url === '/speech') {
+      await handleSpeech(req, res);
+    } else {
+      sendJson(res, 404, { error: 'Endpoint not found' });
+    }
+  } catch (e) {
+    console.error(`SRE request failed: ${e}`);
+    sendJson(res, 500, { error: 'Internal server error' });
+  }
+});
+
+// Keep connections open so the backend can reuse them between batches
+server.keepAliveTimeout = 65000;
+
+withEngine('mathspeak', 'default', 'en', () => {}).then(() => {
+  server.listen(PORT, () => {
+    console.log(`SRE service listening on port ${PORT}`);
+  });
+});
@@ -11,10 +11,11 @@ function App() {
   const [voiceSettings, setVoiceSettings] = useState({
     language: 'en',
     voice: 'en_US-lessac-medium',
-    speed: 1.0
+    speed: 1.0,
+    format: 'mp3'
   });
   const [showSettings, setShowSettings] = useState(false);
-  const { uploadFile, getTaskStatus, getVoices } = useApi();
+  const { uploadFile, subscribeToTask, getVoices } = useApi();
 
   const handleFileUpload = async (file) => {
     try {
@@ -36,31 +37,22 @@ function App() {
     setCurrentTask(null);
   };
 
-  // Poll for task status updates
+  // Subscribe to pushed status updates until the task finishes
+  const taskId = currentTask?.id;
+  const taskFinished = currentTask?.state === 'SUCCESS' || currentTask?.state === 'FAILURE';
+
   useEffect(() => {
-    if (!currentTask || currentTask.status === 'completed' || currentTask.status === 'failed') {
+    if (!taskId || taskFinished) {
       return;
     }
 
-    const pollInterval = setInterval(async () => {
-      try {
-        const status = await getTaskStatus(currentTask.id);
-        setCurrentTask(prev => ({
-          ...prev,
-          ...status
-        }));
-
-        if (status.state === 'SUCCESS' || status.state === 'FAILURE') {
-          clearInterval(pollInterval);
-        }
-      } catch (error) {
-        console.error('Status polling failed:', error);
-        clearInterval(pollInterval);
-      }
-    }, 2000);
-
-    return () => clearInterval(pollInterval);
-  }, [currentTask, getTaskStatus]);
+    return subscribeToTask(taskId, (status) => {
+      setCurrentTask(prev => ({
+        ...prev,
+        ...status
+      }));
+    });
+  }, [taskId, taskFinished, subscribeToTask]);
 
   return (
     <div className="min-h-screen bg-gradient-to-br from-blue-50 to-indigo-100">
@@ -159,18 +151,25 @@ function App() {
             <div className="space-y-6">
               <ProcessingStatus task={currentTask} />
               
-              {currentTask.state === 'SUCCESS' && (
+              {/* Audio can be played while the rest is still being synthesized */}
+              {(currentTask.state === 'SUCCESS' || (currentTask.stream_url && currentTask.state !== 'FAILURE')) && (
                 <div className="fade-in">
-                  <AudioPlayer taskId={currentTask.id} result={currentTask.result} />
+                  <AudioPlayer
+                    taskId={currentTask.id}
+                    result={currentTask.result}
+                    streaming={currentTask.state !== 'SUCCESS'}
+                  />
                   
-                  <div className="mt-6 text-center">
-                    <button
-                      onClick={handleNewUpload}
-                      className="btn-primary"
-                    >
-                      Convert Another PDF
-                    </button>
-                  </div>
+                  {currentTask.state === 'SUCCESS' && (
+                    <div className="mt-6 text-center">
+                      <button
+                        onClick={handleNewUpload}
+                        className="btn-primary"
+                      >
+                        Convert Another PDF
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
               
@@ -7,7 +7,10 @@ import {
   SpeakerXMarkIcon
 } from '@heroicons/react/24/outline';
 
-const AudioPlayer = ({ taskId, result }) => {
+// Milliseconds between attempts to open a stream that has no audio yet
+const STREAM_RETRY_MS = 2000;
+
+const AudioPlayer = ({ taskId, result, streaming = false }) => {
   const [isPlaying, setIsPlaying] = useState(false);
   const [currentTime, setCurrentTime] = useState(0);
   const [duration, setDuration] = useState(0);
@@ -18,10 +21,37 @@ const AudioPlayer = ({ taskId, result }) => {
   
   const audioRef = useRef(null);
   const progressRef = useRef(null);
+  const resumeAtRef = useRef(null);
+  const awaitingStreamRef = useRef(false);
 
-  const audioUrl = `/audio/${taskId}`;
+  const fileUrl = `/audio/${taskId}`;
+  const streamUrl = `/audio/${taskId}/stream`;
   const downloadUrl = `/audio/${taskId}?download=true`;
 
+  // While synthesis runs, play the growing stream. Once the file is complete,
+  // switch to it (so seeking works) as soon as playback is paused.
+  const [audioUrl, setAudioUrl] = useState(streaming ? streamUrl : fileUrl);
+  awaitingStreamRef.current = streaming && audioUrl === streamUrl;
+
+  useEffect(() => {
+    if (streaming || audioUrl === fileUrl) return;
+    const audio = audioRef.current;
+
+    const switchToFile = () => {
+      resumeAtRef.current = audio && !audio.ended ? audio.currentTime : 0;
+      setIsLoading(true);
+      setAudioUrl(fileUrl);
+    };
+
+    if (!audio || audio.paused) {
+      switchToFile();
+      return;
+    }
+
+    audio.addEventListener('pause', switchToFile, { once: true });
+    return () => audio.removeEventListener('pause', switchToFile);
+  }, [streaming, audioUrl, fileUrl]);
+
   useEffect(() => {
     const audio = audioRef.current;
     if (!audio) return;
@@ -29,6 +59,10 @@ const AudioPlayer = ({ taskId, result }) => {
     const handleLoadedMetadata = () => {
       setDuration(audio.duration);
       setIsLoading(false);
+      if (resumeAtRef.current) {
+        audio.currentTime = resumeAtRef.current;
+      }
+      resumeAtRef.current = null;
     };
 
     const handleTimeUpdate = () => {
@@ -40,7 +74,13 @@ const AudioPlayer = ({ taskId, result }) => {
       setCurrentTime(0);
     };
 
+    let retryTimer = null;
     const handleError = () => {
+      // The stream is answered with 202 until the first audio is written
+      if (awaitingStreamRef.current) {
+        retryTimer = setTimeout(() => audio.load(), STREAM_RETRY_MS);
+        return;
+      }
       setError('Failed to load audio file');
       setIsLoading(false);
     };
@@ -61,6 +101,7 @@ const AudioPlayer = ({ taskId, result }) => {
       audio.removeEventListener('ended', handleEnded);
       audio.removeEventListener('error', handleError);
       audio.removeEventListener('canplay', handleCanPlay);
+      clearTimeout(retryTimer);
     };
   }, []);
 
@@ -82,7 +123,8 @@ const AudioPlayer = ({ taskId, result }) => {
   const handleProgressClick = (e) => {
     const audio = audioRef.current;
     const progressBar = progressRef.current;
-    if (!audio || !progressBar) return;
+    // A stream in progress has no known duration and cannot be seeked
+    if (!audio || !progressBar || !isFinite(duration)) return;
 
     const rect = progressBar.getBoundingClientRect();
     const clickX = e.clientX - rect.left;
@@ -116,13 +158,14 @@ const AudioPlayer = ({ taskId, result }) => {
 
   const formatTime = (time) => {
     if (isNaN(time)) return '0:00';
+    if (!isFinite(time)) return '--:--';
     
     const minutes = Math.floor(time / 60);
     const seconds = Math.floor(time % 60);
     return `${minutes}:${seconds.toString().padStart(2, '0')}`;
   };
 
-  const progressPercentage = duration > 0 ? (currentTime / duration) * 100 : 0;
+  const progressPercentage = duration > 0 && isFinite(duration) ? (currentTime / duration) * 100 : 0;
 
   if (error) {
     return (
@@ -141,7 +184,7 @@ const AudioPlayer = ({ taskId, result }) => {
     <div className="card">
       <div className="mb-4">
         <h3 className="text-lg font-semibold text-gray-900 mb-2">
-          Audio Generated Successfully
+          {streaming ? 'Audio Preview (still generating)' : 'Audio Generated Successfully'}
         </h3>
         
         {result && (
@@ -269,15 +312,17 @@ const AudioPlayer = ({ taskId, result }) => {
           </div>
 
           {/* Download Button */}
-          <a
-            href={downloadUrl}
-            download={`audio_${taskId}.wav`}
-            className="btn-secondary"
-            aria-label="Download audio file"
-          >
-            <ArrowDownTrayIcon className="w-5 h-5 mr-2" />
-            Download
-          </a>
+          {!streaming && (
+            <a
+              href={downloadUrl}
+              download={`audio_${taskId}.${result?.format || 'wav'}`}
+              className="btn-secondary"
+              aria-label="Download audio file"
+            >
+              <ArrowDownTrayIcon className="w-5 h-5 mr-2" />
+              Download
+            </a>
+          )}
         </div>
       </div>
 
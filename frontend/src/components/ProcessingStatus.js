@@ -1,7 +1,6 @@
 import React from 'react';
 import { 
   DocumentTextIcon, 
-  CogIcon, 
   SpeakerWaveIcon, 
   CheckCircleIcon,
   ExclamationCircleIcon 
@@ -11,8 +10,9 @@ const ProcessingStatus = ({ task }) => {
   const stages = [
     { id: 'analyzing', label: 'Analyzing PDF', icon: DocumentTextIcon },
     { id: 'extracting', label: 'Extracting Text', icon: DocumentTextIcon },
-    { id: 'processing', label: 'Processing Content', icon: CogIcon },
+    { id: 'processing', label: 'Reading Mathematics', icon: DocumentTextIcon },
     { id: 'synthesizing', label: 'Generating Audio', icon: SpeakerWaveIcon },
+    { id: 'encoding', label: 'Encoding Audio', icon: SpeakerWaveIcon },
     { id: 'completed', label: 'Completed', icon: CheckCircleIcon }
   ];
 
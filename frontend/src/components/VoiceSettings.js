@@ -56,6 +56,20 @@ const VoiceSettings = ({ settings, onChange, onClose }) => {
     });
   };
 
+  const handleFormatChange = (format) => {
+    onChange({
+      ...settings,
+      format
+    });
+  };
+
+  const audioFormats = [
+    { id: 'mp3', name: 'MP3 (widely supported)' },
+    { id: 'opus', name: 'Opus (smallest files)' },
+    { id: 'aac', name: 'AAC' },
+    { id: 'wav', name: 'WAV (uncompressed)' }
+  ];
+
   const languages = Object.keys(availableVoices);
   const currentLanguageVoices = availableVoices[settings.language] || [];
 
@@ -188,6 +202,25 @@ const VoiceSettings = ({ settings, onChange, onClose }) => {
           </div>
         </div>
 
+        {/* Audio Format */}
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-2">
+            Audio Format
+          </label>
+          <select
+            value={settings.format || 'mp3'}
+            onChange={(e) => handleFormatChange(e.target.value)}
+            className="w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:ring-primary-500 focus:border-primary-500"
+            aria-label="Select audio format"
+          >
+            {audioFormats.map(format => (
+              <option key={format.id} value={format.id}>
+                {format.name}
+              </option>
+            ))}
+          </select>
+        </div>
+
         {/* Preview Section */}
         <div className="pt-4 border-t border-gray-200">
           <h4 className="text-sm font-medium text-gray-700 mb-2">
@@ -208,6 +241,10 @@ const VoiceSettings = ({ settings, onChange, onClose }) => {
               <span className="text-gray-600">Speed:</span>
               <span className="font-medium">{settings.speed}x</span>
             </div>
+            <div className="flex justify-between">
+              <span className="text-gray-600">Format:</span>
+              <span className="font-medium">{(settings.format || 'mp3').toUpperCase()}</span>
+            </div>
           </div>
         </div>
       </div>
@@ -216,7 +253,8 @@ const VoiceSettings = ({ settings, onChange, onClose }) => {
       <div className="sr-only">
         <p>
           Voice settings panel. Use the language dropdown to select the speech language, 
-          voice dropdown to choose a specific voice, and speed slider to adjust playback speed.
+          voice dropdown to choose a specific voice, speed slider to adjust playback speed,
+          and format dropdown to choose the audio file format.
         </p>
       </div>
     </div>
@@ -37,6 +37,7 @@ export const useApi = () => {
     formData.append('language', voiceSettings.language);
     formData.append('voice', voiceSettings.voice);
     formData.append('speed', voiceSettings.speed.toString());
+    formData.append('format', voiceSettings.format || 'mp3');
 
     const response = await api.post('/upload', formData, {
       headers: {
@@ -53,6 +54,55 @@ export const useApi = () => {
     return response.data;
   }, []);
 
+  // Follow a task's progress over Server-Sent Events. Falls back to polling
+  // when the browser lacks EventSource or the server refuses the stream.
+  // Returns a function that stops listening.
+  const subscribeToTask = useCallback((taskId, onUpdate) => {
+    let source = null;
+    let pollInterval = null;
+    let finished = false;
+
+    const stop = () => {
+      if (source) source.close();
+      clearInterval(pollInterval);
+    };
+
+    const handleStatus = (status) => {
+      onUpdate(status);
+      if (status.state === 'SUCCESS' || status.state === 'FAILURE') {
+        finished = true;
+        stop();
+      }
+    };
+
+    const startPolling = () => {
+      pollInterval = setInterval(async () => {
+        try {
+          handleStatus(await getTaskStatus(taskId));
+        } catch (error) {
+          console.error('Status polling failed:', error);
+          stop();
+        }
+      }, 2000);
+    };
+
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return stop;
+    }
+
+    source = new EventSource(`${API_BASE_URL}/events/${taskId}`);
+    source.onmessage = (event) => handleStatus(JSON.parse(event.data));
+    source.onerror = () => {
+      // The browser reconnects by itself unless the stream was refused
+      if (source.readyState === EventSource.CLOSED && !finished) {
+        startPolling();
+      }
+    };
+
+    return stop;
+  }, [getTaskStatus]);
+
   const getVoices = useCallback(async () => {
     const response = await api.get('/voices');
     return response.data;
@@ -71,6 +121,7 @@ export const useApi = () => {
   return {
     uploadFile,
     getTaskStatus,
+    subscribeToTask,
     getVoices,
     getAudioUrl,
     checkHealth,
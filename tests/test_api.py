@@ -46,6 +46,88 @@ def test_voices():
         print(f"✗ Voices request error: {e}")
         return False
 
+def test_cache_stats():
+    """Test result cache statistics endpoint"""
+    print("Testing cache stats endpoint...")
+    try:
+        response = requests.get(f"{API_BASE}/cache/stats", timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            results = data['results']
+            print(f"✓ Result cache: {results['hits']} hits, {results['misses']} misses")
+            print(f"✓ Math cache hit rate: {data['math']['hit_rate']:.0%}")
+            print(f"✓ GROBID TEI cache hit rate: {data['tei']['hit_rate']:.0%}")
+            return True
+        else:
+            print(f"✗ Cache stats request failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"✗ Cache stats request error: {e}")
+        return False
+
+def test_metrics():
+    """Test Prometheus metrics endpoint"""
+    print("Testing metrics endpoint...")
+    try:
+        response = requests.get(f"{API_BASE}/metrics", timeout=10)
+        if response.status_code == 200 and 'pdf2audio_http_request_duration_seconds' in response.text:
+            print(f"✓ Metrics served ({len(response.text.splitlines())} lines)")
+            return True
+        else:
+            print(f"✗ Metrics request failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"✗ Metrics request error: {e}")
+        return False
+
+def test_batch_status():
+    """Test batch status endpoint"""
+    print("Testing batch status endpoint...")
+    unknown_id = "00000000-0000-4000-8000-000000000000"
+    try:
+        response = requests.post(
+            f"{API_BASE}/status/batch",
+            json={'task_ids': [unknown_id, "invalid-task-id"]},
+            timeout=10
+        )
+        if response.status_code == 200:
+            data = response.json()
+            if data['tasks'][unknown_id]['state'] == 'PENDING' and data['invalid'] == ["invalid-task-id"]:
+                print(f"✓ Batch status returned {len(data['tasks'])} task(s)")
+                return True
+            print(f"✗ Unexpected batch status: {data}")
+            return False
+        else:
+            print(f"✗ Batch status request failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"✗ Batch status request error: {e}")
+        return False
+
+def test_batch_job_errors():
+    """Test batch upload and batch job error handling"""
+    print("Testing batch job endpoints...")
+    try:
+        response = requests.post(
+            f"{API_BASE}/upload/batch",
+            files={'files': ('notes.txt', b'not a pdf', 'text/plain')},
+            timeout=10
+        )
+        if response.status_code != 400:
+            print(f"✗ Non-PDF batch upload returned {response.status_code}")
+            return False
+        
+        response = requests.get(f"{API_BASE}/batch/00000000-0000-4000-8000-000000000000", timeout=10)
+        if response.status_code != 404:
+            print(f"✗ Unknown batch returned {response.status_code}")
+            return False
+        
+        print("✓ Batch endpoints reject invalid requests")
+        return True
+    except Exception as e:
+        print(f"✗ Batch job request error: {e}")
+        return False
+
 def create_test_pdf():
     """Create a simple test PDF with text content"""
     test_content = """
@@ -181,7 +263,23 @@ def test_invalid_requests():
             print(f"✗ Unexpected response for no file: {response.status_code}")
     except Exception as e:
         print(f"✗ Error testing no file upload: {e}")
-    
+
+    # Test upload with a speed Piper cannot use
+    for speed in ['fast', '3.0']:
+        try:
+            response = requests.post(
+                f"{API_BASE}/upload",
+                files={'file': ('test.pdf', b'%PDF-1.4\n%%EOF\n', 'application/pdf')},
+                data={'speed': speed},
+                timeout=10
+            )
+            if response.status_code == 400:
+                print(f"✓ Correctly rejected speed {speed}: {response.json().get('error')}")
+            else:
+                print(f"✗ Unexpected response for speed {speed}: {response.status_code}")
+        except Exception as e:
+            print(f"✗ Error testing speed {speed}: {e}")
+
     # Test status with invalid task ID
     try:
         response = requests.get(f"{API_BASE}/status/invalid-task-id", timeout=10)
@@ -210,6 +308,10 @@ def main():
     tests = [
         ("Health Check", test_health),
         ("Voices Endpoint", test_voices),
+        ("Cache Stats", test_cache_stats),
+        ("Metrics", test_metrics),
+        ("Batch Status", test_batch_status),
+        ("Batch Job Errors", test_batch_job_errors),
         ("Error Handling", test_invalid_requests),
         # ("Upload and Process", test_upload_and_process),  # Commented out for quick testing
     ]
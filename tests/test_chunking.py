@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for splitting text into Piper synthesis chunks
+"""
+
+import sys
+from pathlib import Path
+
+# The chunker lives in the backend package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from tasks import split_text_into_chunks
+
+def test_short_text_is_one_chunk():
+    """Test that text under the limit is one chunk with its whitespace collapsed"""
+    assert split_text_into_chunks("  Hello\tworld.\n  Second   line. ", max_chars=100) == [
+        "Hello world. Second line."
+    ]
+
+def test_empty_text():
+    """Test that blank text produces no chunks"""
+    assert split_text_into_chunks("", max_chars=100) == []
+    assert split_text_into_chunks(" \n\n \n", max_chars=100) == []
+
+def test_sentences_are_not_split():
+    """Test that chunks end on sentence boundaries when sentences fit"""
+    text = "One two three. Four five six! Seven eight nine? Ten eleven twelve."
+    chunks = split_text_into_chunks(text, max_chars=32)
+    
+    assert chunks == [
+        "One two three. Four five six!",
+        "Seven eight nine?",
+        "Ten eleven twelve.",
+    ]
+
+def test_paragraph_boundary_closes_full_chunk():
+    """Test that a paragraph that would overflow the chunk starts a new one"""
+    text = "First paragraph here.\n\nSecond paragraph, a bit longer."
+    chunks = split_text_into_chunks(text, max_chars=40)
+    
+    assert chunks == ["First paragraph here.", "Second paragraph, a bit longer."]
+
+def test_short_paragraphs_share_a_chunk():
+    """Test that paragraphs are joined while they fit"""
+    assert split_text_into_chunks("Alpha.\n\nBeta.\n\nGamma.", max_chars=100) == ["Alpha. Beta. Gamma."]
+
+def test_long_sentence_is_split_on_words():
+    """Test that a sentence longer than a chunk is cut between words"""
+    sentence = " ".join(f"word{i}" for i in range(40)) + "."
+    chunks = split_text_into_chunks(f"Intro. {sentence}", max_chars=50)
+    
+    assert chunks[0] == "Intro."
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert all(not chunk.startswith(' ') and not chunk.endswith(' ') for chunk in chunks)
+    assert " ".join(chunks).split() == f"Intro. {sentence}".split()
+
+def test_word_longer_than_chunk_is_cut():
+    """Test that a run without spaces is cut at max_chars"""
+    assert split_text_into_chunks("x" * 25, max_chars=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+def test_no_text_is_lost():
+    """Test that every word comes out once, in order, in chunks within the limit"""
+    paragraphs = [
+        " ".join(f"p{p}s{s}w{w}" for w in range(s % 7 + 1)) + "."
+        for p in range(12) for s in range(p % 5 + 1)
+    ]
+    text = "\n\n".join(" ".join(paragraphs[i:i + 3]) for i in range(0, len(paragraphs), 3))
+    chunks = split_text_into_chunks(text, max_chars=80)
+    
+    assert all(0 < len(chunk) <= 80 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
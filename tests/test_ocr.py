@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for the PDF2Audio OCR fallback
+"""
+
+import sys
+import time
+import shutil
+import threading
+from pathlib import Path
+
+import PyPDF2
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+# The OCR stage lives in the backend package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import tasks
+from tasks import iter_ocr_pages, ocr_page, ocr_failed_text
+
+PAGE_TEXTS = [
+    "The quick brown fox jumps over the lazy dog",
+    "Speech synthesis for academic papers",
+    "Mathematics is the language of science",
+]
+
+def ocr_tools_available():
+    """Check that Tesseract and Poppler are installed"""
+    return shutil.which('tesseract') is not None and shutil.which('pdftoppm') is not None
+
+def create_scanned_pdf(path, page_texts, dpi=150):
+    """Create an image-only PDF, one rendered page per text, like a scanner would"""
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    try:
+        font = ImageFont.truetype('DejaVuSans.ttf', 40)
+    except OSError:
+        font = ImageFont.load_default()
+    
+    pages = []
+    for text in page_texts:
+        page = Image.new('L', (width, height), color=255)
+        ImageDraw.Draw(page).text((100, 200), text, fill=0, font=font)
+        pages.append(page)
+    
+    pages[0].save(path, 'PDF', resolution=dpi, save_all=True, append_images=pages[1:])
+    return path
+
+class FakeOCR:
+    """Stand-in for ocr_page: later pages finish first, chosen pages fail"""
+    
+    def __init__(self, failing=(), delay=0.02):
+        self.failing = set(failing)
+        self.delay = delay
+        self.started = []
+        self.lock = threading.Lock()
+    
+    def __call__(self, pdf_path, page_number, dpi=tasks.OCR_DPI):
+        with self.lock:
+            self.started.append(page_number)
+        time.sleep(self.delay / page_number)
+        if page_number in self.failing:
+            raise RuntimeError(f"page {page_number} is unreadable")
+        return f"text of page {page_number}"
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    fake = FakeOCR()
+    monkeypatch.setattr(tasks, 'ocr_page', fake)
+    monkeypatch.setattr(tasks, 'OCR_MAX_WORKERS', 2)
+    return fake
+
+def test_scanned_pdf_fixture(tmp_path):
+    """Test that the generated fixture has no text layer to fall back on"""
+    pdf_path = create_scanned_pdf(str(tmp_path / 'scanned.pdf'), PAGE_TEXTS)
+    with open(pdf_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        native_text = "".join(page.extract_text() or "" for page in reader.pages)
+        assert len(reader.pages) == len(PAGE_TEXTS)
+    assert not native_text.strip()
+
+def test_pages_in_order(fake_ocr):
+    """Test that pages come out in page order even when later ones finish first"""
+    pages = list(iter_ocr_pages('document.pdf', pages=range(1, 9)))
+    
+    assert pages == [(n, f"text of page {n}") for n in range(1, 9)]
+    assert sorted(fake_ocr.started) == list(range(1, 9))
+
+def test_selected_pages_only(fake_ocr):
+    """Test that only the requested pages are OCRed"""
+    assert [n for n, _ in iter_ocr_pages('document.pdf', pages=[3, 7])] == [3, 7]
+    assert list(iter_ocr_pages('document.pdf', pages=[])) == []
+
+def test_window_limits_pages_ahead(fake_ocr):
+    """Test that at most two pages per worker are queued ahead of the reader"""
+    pages = iter_ocr_pages('document.pdf', pages=range(1, 21))
+    assert next(pages) == (1, "text of page 1")
+    time.sleep(0.1)
+    
+    # Two workers: pages 1-4 queued before page 1 was yielded, none since
+    assert sorted(fake_ocr.started) == [1, 2, 3, 4]
+    pages.close()
+
+def test_failed_page_gets_placeholder(fake_ocr):
+    """Test that a page that cannot be OCRed is read as a placeholder"""
+    fake_ocr.failing = {2}
+    pages = dict(iter_ocr_pages('document.pdf', pages=[1, 2, 3]))
+    
+    assert pages == {1: "text of page 1", 2: ocr_failed_text(2), 3: "text of page 3"}
+
+def test_executor_failure_gets_placeholders(fake_ocr, monkeypatch):
+    """Test that pages the pool cannot run are placeholders, not a failed job"""
+    class BrokenExecutor(tasks.ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise RuntimeError("cannot start new thread")
+    
+    monkeypatch.setattr(tasks, 'ThreadPoolExecutor', BrokenExecutor)
+    
+    assert list(iter_ocr_pages('document.pdf', pages=[1, 2])) == [(1, ocr_failed_text(1)), (2, ocr_failed_text(2))]
+
+def ocr_in_daemon(pdf_path):
+    return list(iter_ocr_pages(pdf_path, pages=[1, 2, 3]))
+
+def test_runs_in_celery_prefork_worker(fake_ocr):
+    """Test that OCR works inside a daemonic billiard process, like a Celery worker"""
+    from billiard import Pool
+    
+    with Pool(1) as pool:
+        pages = pool.apply(ocr_in_daemon, ('document.pdf',))
+    
+    assert pages == [(n, f"text of page {n}") for n in (1, 2, 3)]
+
+def test_ocr_page_renders_one_page(monkeypatch):
+    """Test that ocr_page rasterizes only its page, OCRs it and frees the image"""
+    rendered = []
+    image = Image.new('L', (10, 10), color=255)
+    
+    def convert_from_path(pdf_path, dpi, first_page, last_page):
+        rendered.append((pdf_path, dpi, first_page, last_page))
+        return [image]
+    
+    monkeypatch.setattr(tasks, 'convert_from_path', convert_from_path)
+    monkeypatch.setattr(tasks.pytesseract, 'image_to_string', lambda img, lang: f"  {lang} text \n")
+    
+    assert ocr_page('document.pdf', 5, dpi=150, language='deu') == "deu text"
+    assert rendered == [('document.pdf', 150, 5, 5)]
+    with pytest.raises(ValueError):
+        image.load()  # Closed
+
+def test_ocr_page_order(tmp_path):
+    """Test that real OCR returns every page, in page order"""
+    if not ocr_tools_available():
+        pytest.skip("tesseract or pdftoppm not installed")
+    
+    pdf_path = create_scanned_pdf(str(tmp_path / 'scanned.pdf'), PAGE_TEXTS)
+    pages = list(iter_ocr_pages(pdf_path, dpi=150))
+    
+    assert [page_number for page_number, _ in pages] == list(range(1, len(PAGE_TEXTS) + 1))
+    for (page_number, text), expected in zip(pages, PAGE_TEXTS):
+        assert expected.split()[-1].lower() in text.lower(), f"Page {page_number} OCR mismatch: {text!r}"
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the files pipeline stages hand each other, without GROBID, SRE or Piper
+"""
+
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+# The pipeline lives in the backend package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import tasks
+from tasks import extract_document, speak_mathematics, synthesize_document, read_records, write_records
+
+SECTIONS = [
+    {'title': 'Page 1', 'text': 'Native text.', 'source': 'native', 'position': 0.0},
+    {'title': 'Results', 'paragraphs': [['Energy is'], [0]], 'source': 'grobid', 'position': 0.5},
+]
+
+@pytest.fixture
+def job(monkeypatch, tmp_path):
+    """A job whose extraction yields SECTIONS, with progress and SRE stubbed out"""
+    def iter_document_sections(pdf_path, math, on_stage=None, pdf_hash=None):
+        for section in SECTIONS:
+            if 'paragraphs' in section:
+                math.append('<math><mi>E</mi></math>')
+            yield section
+    
+    class MathMLProcessor:
+        def mathml_batch_to_speech(self, math):
+            return [f"formula {index}" for index in range(len(math))]
+    
+    monkeypatch.setattr(tasks, 'TEMP_FOLDER', str(tmp_path))
+    monkeypatch.setattr(tasks, 'iter_document_sections', iter_document_sections)
+    monkeypatch.setattr(tasks, 'MathMLProcessor', MathMLProcessor)
+    monkeypatch.setattr(tasks, 'report_progress', lambda *args, **kwargs: None)
+    monkeypatch.setattr(tasks, 'publish_progress', lambda *args: None)
+    
+    pdf_path = tmp_path / 'document.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4')
+    return {'task_id': 'task-1', 'pdf_path': str(pdf_path), 'voice_settings': {}}
+
+def test_records_round_trip(tmp_path):
+    """Test that JSON lines artifacts are written whole and read back in order"""
+    path = str(tmp_path / 'records.jsonl')
+    
+    assert write_records(path, iter(SECTIONS)) == 2
+    assert list(read_records(path)) == SECTIONS
+    assert not Path(f"{path}.part").exists()
+
+def test_failed_write_leaves_no_files(tmp_path):
+    """Test that a generator that fails midway leaves neither the artifact nor its part file"""
+    path = str(tmp_path / 'records.jsonl')
+    
+    def failing():
+        yield SECTIONS[0]
+        raise RuntimeError("GROBID went away")
+    
+    with pytest.raises(RuntimeError):
+        write_records(path, failing())
+    assert list(tmp_path.iterdir()) == []
+
+def test_stages_pass_sections_one_at_a_time(job, monkeypatch, tmp_path):
+    """Test that sections flow through extraction, math speech and synthesis as JSON lines"""
+    synthesized = {}
+    
+    def synthesize_speech(sections, voice_settings, output_path, on_section=None):
+        synthesized['lazy'] = isinstance(sections, types.GeneratorType)
+        synthesized['sections'] = list(sections)
+        Path(output_path).write_bytes(b'RIFF')
+        return {'sections': len(synthesized['sections']), 'text_length': 0, 'duration': 0}
+    
+    monkeypatch.setattr(tasks, 'synthesize_speech', synthesize_speech)
+    
+    job = extract_document(job)
+    assert job['artifact'].endswith('sections.jsonl')
+    assert list(read_records(job['artifact'])) == SECTIONS
+    assert not Path(job['pdf_path']).exists()
+    
+    job = speak_mathematics(job)
+    assert [s['text'] for s in read_records(job['artifact'])] == ['Native text.', 'Energy is\n\nformula 0']
+    
+    job = synthesize_document(job)
+    assert synthesized['lazy']
+    assert [s['source'] for s in synthesized['sections']] == ['native', 'grobid']
+    # Only the synthesized speech is left for the encoding stage
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['task-1.speech.wav']
+
+def test_document_without_text_fails_and_cleans_up(job, monkeypatch, tmp_path):
+    """Test that extraction with no sections fails and removes its files"""
+    monkeypatch.setattr(tasks, 'iter_document_sections', lambda pdf_path, math, on_stage=None, pdf_hash=None: iter(()))
+    
+    with pytest.raises(Exception, match="No text found"):
+        extract_document(job)
+    assert list(tmp_path.iterdir()) == []
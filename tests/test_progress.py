@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for Server-Sent Events progress streams, against fakeredis
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+# The event stream lives in the backend package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import progress
+from progress import progress_events, publish_progress, status_payload
+
+TASK_ID = 'task-1'
+
+@pytest.fixture(autouse=True)
+def client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(progress, 'get_redis', lambda: client)
+    monkeypatch.setattr(progress, 'SSE_HEARTBEAT_INTERVAL', 0.05)
+    return client
+
+def events(stream):
+    """The status payloads of an event stream, with keepalives counted"""
+    payloads, keepalives = [], 0
+    for chunk in stream:
+        if chunk.startswith('data: '):
+            payloads.append(json.loads(chunk[len('data: '):]))
+        elif chunk.startswith(': keepalive'):
+            keepalives += 1
+    return payloads, keepalives
+
+def test_updates_until_terminal_state():
+    """Test that published updates are streamed and the stream ends on success"""
+    running = status_payload(TASK_ID, 'PROGRESS', {'stage': 'extracting', 'progress': 10})
+    done = status_payload(TASK_ID, 'SUCCESS', {'audio_url': '/audio/task-1'})
+    
+    def snapshot():
+        # Published once the stream is subscribed, as a worker would
+        publish_progress(TASK_ID, running)
+        publish_progress(TASK_ID, done)
+        return status_payload(TASK_ID, 'PENDING', None)
+    
+    payloads, _ = events(progress_events(TASK_ID, snapshot))
+    assert [p['state'] for p in payloads] == ['PENDING', 'PROGRESS', 'SUCCESS']
+
+def test_missed_terminal_state_is_found_on_heartbeat():
+    """Test that a result stored after its publish ends the stream at the next heartbeat"""
+    states = iter(['PROGRESS', 'PROGRESS', 'SUCCESS'])
+    
+    def snapshot():
+        return status_payload(TASK_ID, next(states), {'stage': 'encoding'})
+    
+    payloads, keepalives = events(progress_events(TASK_ID, snapshot))
+    assert [p['state'] for p in payloads] == ['PROGRESS', 'SUCCESS']
+    assert keepalives == 2
+
+def test_idle_stream_is_closed(monkeypatch):
+    """Test that a task with no updates ends its stream with a retry hint"""
+    monkeypatch.setattr(progress, 'SSE_IDLE_TIMEOUT', 0.1)
+    stream = list(progress_events(TASK_ID, lambda: status_payload(TASK_ID, 'PENDING', None)))
+    
+    assert stream[-1] == f"retry: {progress.SSE_TIMEOUT_RETRY_MS}\n\n"
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for routing PDF pages to the native text layer, GROBID or OCR
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The router lives in the backend package; the benchmark corpus renders text PDFs
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import tasks
+from tasks import route_pages, score_text_quality, page_has_math, iter_document_sections
+from corpus import render_pdf
+
+PROSE_PAGE = ["The model is trained on a large corpus of academic papers and evaluated on held out data."] * 10
+MATH_PAGE = ["The energy of the system is given below."] * 5 + ["x = 2 y^2 + 3", "a_1 = b / 2 + c", "E = m c^2"]
+TABLE_PAGE = ["Results 12.5 33.1 40.2 value 7.7 8.1 run 3 0.51 0.62 0.77"] * 8
+BROKEN_PAGE = ["(cid:12)(cid:13) 3.1 4.2 (cid:9) %% ## 12 7 (cid:40) 33"] * 6
+EMPTY_PAGE = []
+
+def route(pages):
+    """Route the pages of a PDF rendered from lines of text"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, 'document.pdf')
+        with open(pdf_path, 'wb') as f:
+            f.write(render_pdf(pages))
+        return route_pages(pdf_path)
+
+def test_routes_each_page():
+    """Test that every page gets the route its text layer calls for, in order"""
+    routes = route([PROSE_PAGE, MATH_PAGE, TABLE_PAGE, BROKEN_PAGE, EMPTY_PAGE])
+    
+    assert [(r['page'], r['route']) for r in routes] == [
+        (1, 'native'),
+        (2, 'grobid'),  # Equations
+        (3, 'grobid'),  # Poor text layer
+        (4, 'ocr'),     # Unmapped glyphs
+        (5, 'ocr'),     # No text layer
+    ]
+
+def test_usable_text_layers_are_kept():
+    """Test that the text layer is kept for pages that can fall back to it"""
+    routes = route([PROSE_PAGE, MATH_PAGE, EMPTY_PAGE])
+    
+    assert routes[0]['text'].split() == " ".join(PROSE_PAGE).split()
+    assert "E = m c^2" in routes[1]['text']
+    assert routes[2]['text'] is None
+
+def test_unreadable_pdf_is_not_routed(tmp_path):
+    """Test that a PDF PyPDF2 cannot open returns None instead of raising"""
+    pdf_path = tmp_path / 'broken.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4 not really a PDF')
+    
+    assert route_pages(str(pdf_path)) is None
+
+def test_text_quality_scores():
+    """Test the text quality score at its extremes and in between"""
+    assert score_text_quality(" ".join(PROSE_PAGE)) == 1.0
+    assert score_text_quality("Too short.") == 0.0
+    assert score_text_quality(" ".join(BROKEN_PAGE)) == 0.0
+    assert 0.2 <= score_text_quality(" ".join(TABLE_PAGE)) < 0.6
+
+def test_math_detection():
+    """Test that equations and math symbols are recognised, and prose is not"""
+    assert page_has_math("\n".join(MATH_PAGE))
+    assert page_has_math("We sum ∑ over α and β.")
+    assert not page_has_math(" ".join(PROSE_PAGE))
+    assert not page_has_math("Set x = 2 once.")
+
+GROBID_SECTION = {'title': 'Results', 'paragraphs': [['GROBID text with'], [0]]}
+
+@pytest.fixture
+def sections(monkeypatch):
+    """Read a PDF's sections with GROBID and OCR replaced by stand-ins"""
+    calls = {'grobid': [], 'ocr': []}
+    grobid_fails = set()
+    
+    def extract_grobid_sections(pdf_path, page_numbers, whole_document, pdf_hash=None):
+        calls['grobid'].append((page_numbers, whole_document))
+        calls.setdefault('pdf_hash', []).append(pdf_hash)
+        if (None if page_numbers is None else page_numbers[0]) in grobid_fails:
+            return None
+        return [GROBID_SECTION], ['<math/>']
+    
+    def iter_ocr_pages(pdf_path, pages=None):
+        calls['ocr'].append(pages)
+        for page_number in pages or range(1, 3):
+            yield page_number, f"OCR page {page_number}"
+    
+    monkeypatch.setattr(tasks, 'extract_grobid_sections', extract_grobid_sections)
+    monkeypatch.setattr(tasks, 'iter_ocr_pages', iter_ocr_pages)
+    
+    def read(pages=None, failing=(), pdf_bytes=None, pdf_hash=None):
+        grobid_fails.update(failing)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, 'document.pdf')
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_bytes or render_pdf(pages))
+            math = []
+            return list(iter_document_sections(pdf_path, math, pdf_hash=pdf_hash)), math, calls
+    
+    return read
+
+def test_grobid_is_tried_before_ocr(sections):
+    """Test that pages with no text layer only go to OCR once GROBID has failed"""
+    found, math, calls = sections([PROSE_PAGE, EMPTY_PAGE, MATH_PAGE], failing={2})
+    
+    assert [s['source'] for s in found] == ['native', 'ocr', 'grobid']
+    assert calls['grobid'] == [([2], False), ([3], False)]
+    assert calls['ocr'] == [[2]]
+    # Formula indexes follow the document's math list
+    assert found[2]['paragraphs'] == [['GROBID text with'], [0]] and math == ['<math/>']
+
+def test_grobid_failure_reads_poor_text_layer(sections):
+    """Test that math pages GROBID cannot handle are read from their text layer, not OCRed"""
+    found, math, calls = sections([PROSE_PAGE, MATH_PAGE, TABLE_PAGE], failing={2})
+    
+    assert [(s['title'], s['source']) for s in found] == [
+        ('Page 1', 'native'), ('Page 2', 'native'), ('Page 3', 'native')
+    ]
+    assert "E = m c^2" in found[1]['text']
+    assert calls['ocr'] == [] and math == []
+
+def test_scanned_document_goes_to_grobid_whole(sections):
+    """Test that a document with no text layer gets one whole-document GROBID request"""
+    found, math, calls = sections([EMPTY_PAGE, EMPTY_PAGE])
+    
+    assert calls['grobid'] == [([1, 2], True)]
+    assert [s['source'] for s in found] == ['grobid']
+
+def test_unreadable_pdf_falls_back_to_grobid_then_ocr(sections, monkeypatch):
+    """Test that a PDF PyPDF2 cannot read goes to GROBID whole, then to OCR"""
+    monkeypatch.setattr(tasks, 'get_page_count', lambda pdf_path: 2)
+    
+    found, math, calls = sections(pdf_bytes=b'%PDF-1.4 not really a PDF')
+    assert calls['grobid'] == [(None, True)]
+    assert [s['source'] for s in found] == ['grobid']
+    
+    found, math, calls = sections(failing={None}, pdf_bytes=b'%PDF-1.4 not really a PDF')
+    assert calls['ocr'] == [None]
+    assert [(s['title'], s['position']) for s in found] == [('Page 1', 0.0), ('Page 2', 0.5)]
+
+def test_upload_digest_keys_grobid_groups(sections, monkeypatch):
+    """Test that every GROBID group reuses the upload's digest, hashing the PDF at most once"""
+    hashed = []
+    monkeypatch.setattr(tasks, 'hash_file', lambda pdf_path: hashed.append(pdf_path) or 'computed')
+    
+    found, math, calls = sections([MATH_PAGE, PROSE_PAGE, MATH_PAGE], pdf_hash='uploaded')
+    assert calls['pdf_hash'] == ['uploaded', 'uploaded'] and hashed == []
+    
+    found, math, calls = sections([MATH_PAGE, PROSE_PAGE, MATH_PAGE])
+    assert calls['pdf_hash'][2:] == ['computed', 'computed'] and len(hashed) == 1
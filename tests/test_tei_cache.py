@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the GROBID TEI cache and its request coalescing, against fakeredis
+"""
+
+import gzip
+import sys
+import time
+import threading
+from pathlib import Path
+
+import fakeredis
+import pytest
+import redis
+
+# The cache lives in the backend package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import cache
+from cache import TEICache, make_tei_key
+
+TEI = b'<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>Cached text.</p></body></text></TEI>'
+KEY = make_tei_key('0' * 64, [1, 2, 3])
+
+class Grobid:
+    """Stand-in for a GROBID request: counts calls, optionally slow or failing"""
+    
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.lock = threading.Lock()
+    
+    def __call__(self, output_path):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            return None
+        with open(output_path, 'wb') as f:
+            f.write(TEI)
+        return output_path
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+@pytest.fixture
+def tei_cache(client):
+    return TEICache(client=client, wait_interval=0.02)
+
+def test_miss_then_hit(tei_cache, tmp_path):
+    """Test that GROBID runs once and the second fetch is served from Redis"""
+    grobid = Grobid()
+    first, second = tmp_path / 'first.xml', tmp_path / 'second.xml'
+    
+    assert tei_cache.fetch(KEY, str(first), grobid) == str(first)
+    assert tei_cache.fetch(KEY, str(second), grobid) == str(second)
+    
+    assert grobid.calls == 1
+    assert first.read_bytes() == second.read_bytes() == TEI
+    stats = tei_cache.stats()
+    assert (stats['hits'], stats['coalesced'], stats['misses'], stats['hit_rate']) == (1, 0, 1, 0.5)
+
+def test_entries_are_gzipped_with_ttl(tei_cache, client, tmp_path):
+    """Test that TEI is stored compressed and expires"""
+    tei_cache.fetch(KEY, str(tmp_path / 'tei.xml'), Grobid())
+    
+    stored = client.get(f"{TEICache.ENTRY_PREFIX}{KEY}")
+    assert gzip.decompress(stored) == TEI
+    assert 0 < client.ttl(f"{TEICache.ENTRY_PREFIX}{KEY}") <= tei_cache.ttl
+
+def test_concurrent_fetches_share_one_request(tei_cache, tmp_path):
+    """Test that jobs for the same PDF wait for the first one's GROBID request"""
+    grobid = Grobid(delay=0.3)
+    paths = [tmp_path / f"tei{i}.xml" for i in range(4)]
+    results = [None] * len(paths)
+    
+    def fetch(index):
+        results[index] = tei_cache.fetch(KEY, str(paths[index]), grobid)
+    
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(paths))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert grobid.calls == 1
+    assert results == [str(path) for path in paths]
+    assert all(path.read_bytes() == TEI for path in paths)
+    stats = tei_cache.stats()
+    assert (stats['coalesced'], stats['misses']) == (3, 1)
+
+def test_failure_is_not_cached_and_waiter_retries(tei_cache, client, tmp_path):
+    """Test that when the lock holder's request fails, a waiting job runs its own"""
+    failing, working = Grobid(delay=0.2, fail=True), Grobid()
+    results = {}
+    
+    leader = threading.Thread(target=lambda: results.update(leader=tei_cache.fetch(KEY, str(tmp_path / 'a.xml'), failing)))
+    leader.start()
+    time.sleep(0.05)
+    results['waiter'] = tei_cache.fetch(KEY, str(tmp_path / 'b.xml'), working)
+    leader.join()
+    
+    assert results == {'leader': None, 'waiter': str(tmp_path / 'b.xml')}
+    assert (failing.calls, working.calls) == (1, 1)
+    assert gzip.decompress(client.get(f"{TEICache.ENTRY_PREFIX}{KEY}")) == TEI
+    assert client.get(f"{TEICache.LOCK_PREFIX}{KEY}") is None
+
+def test_lock_of_dead_holder_expires(client, tmp_path):
+    """Test that a lock left by a crashed worker only delays others until it expires"""
+    tei_cache = TEICache(client=client, lock_timeout=5, wait_interval=0.02)
+    client.set(f"{TEICache.LOCK_PREFIX}{KEY}", 'crashed-worker', px=300)
+    grobid = Grobid()
+    
+    started = time.monotonic()
+    assert tei_cache.fetch(KEY, str(tmp_path / 'tei.xml'), grobid) == str(tmp_path / 'tei.xml')
+    
+    assert time.monotonic() - started >= 0.25
+    assert grobid.calls == 1
+    assert client.get(f"{TEICache.LOCK_PREFIX}{KEY}") is None
+
+def test_gives_up_waiting_after_lock_timeout(client, tmp_path):
+    """Test that a job stops waiting after lock_timeout and runs GROBID itself"""
+    tei_cache = TEICache(client=client, lock_timeout=0.2, wait_interval=0.02)
+    client.set(f"{TEICache.LOCK_PREFIX}{KEY}", 'other-job')
+    grobid = Grobid()
+    
+    assert tei_cache.fetch(KEY, str(tmp_path / 'tei.xml'), grobid) == str(tmp_path / 'tei.xml')
+    assert grobid.calls == 1
+    # Another job's lock is left alone
+    assert client.get(f"{TEICache.LOCK_PREFIX}{KEY}") == b'other-job'
+
+def test_oversize_tei_is_not_cached(client, tmp_path):
+    """Test that TEI larger than max_bytes once compressed is not stored"""
+    tei_cache = TEICache(client=client, max_bytes=10)
+    
+    assert tei_cache.fetch(KEY, str(tmp_path / 'tei.xml'), Grobid()) == str(tmp_path / 'tei.xml')
+    assert client.get(f"{TEICache.ENTRY_PREFIX}{KEY}") is None
+
+def test_redis_unavailable_falls_back_to_grobid(tmp_path):
+    """Test that GROBID is still called when Redis cannot be reached"""
+    tei_cache = TEICache(client=redis.Redis(port=1, socket_connect_timeout=0.1))
+    grobid = Grobid()
+    
+    assert tei_cache.fetch(KEY, str(tmp_path / 'tei.xml'), grobid) == str(tmp_path / 'tei.xml')
+    assert grobid.calls == 1
+    assert (tmp_path / 'tei.xml').read_bytes() == TEI
+
+def test_keys_depend_on_pages_and_version(monkeypatch):
+    """Test that page subsets and GROBID versions get separate entries"""
+    pdf_hash = 'f' * 64
+    assert make_tei_key(pdf_hash) == make_tei_key(pdf_hash, None)
+    assert make_tei_key(pdf_hash) != make_tei_key(pdf_hash, [1, 2])
+    assert make_tei_key(pdf_hash, [1, 2]) != make_tei_key(pdf_hash, [1, 3])
+    
+    before = make_tei_key(pdf_hash)
+    monkeypatch.setattr(cache, 'TEI_CACHE_VERSION', '0.8.1')
+    assert make_tei_key(pdf_hash) != before
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming TEI parsing, without GROBID
+"""
+
+import io
+import sys
+from pathlib import Path
+
+# The TEI parser lives in the backend package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from tasks import parse_tei_xml, section_to_text
+
+TEI_DOCUMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xmlns:m="http://www.w3.org/1998/Math/MathML">
+  <teiHeader><fileDesc><titleStmt><title>Header title</title></titleStmt></fileDesc></teiHeader>
+  <text>
+    <body>
+      <div>
+        <head>Introduction</head>
+        <p>Energy is related to mass.</p>
+        <formula xml:id="formula_0"><m:math><m:mi>E</m:mi><m:mo>=</m:mo><m:mi>m</m:mi></m:math><label>(1)</label></formula>
+        <p>With <m:math><m:mi>c</m:mi></m:math> the speed of light.</p>
+        <div>
+          <head>Details</head>
+          <p>Nested text.</p>
+        </div>
+        <p>Back in the introduction.</p>
+      </div>
+    </body>
+  </text>
+</TEI>
+"""
+
+BODY_ONLY_DOCUMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xmlns:m="http://www.w3.org/1998/Math/MathML">
+  <text>
+    <body>
+      <p>Before.</p>
+      <formula><m:math><m:mi>x</m:mi></m:math></formula>
+      <p>After.</p>
+    </body>
+  </text>
+</TEI>
+"""
+
+def speak(math):
+    """Stand-in speech: each formula read as its index"""
+    return [f"formula {index}" for index in range(len(math))]
+
+def test_display_formula_is_read_in_place():
+    """Test that a display formula between paragraphs becomes its own paragraph"""
+    sections, math = parse_tei_xml(io.BytesIO(TEI_DOCUMENT))
+    
+    assert len(math) == 2
+    assert '<m:mi>E</m:mi><m:mo>=</m:mo><m:mi>m</m:mi>' in math[0]
+    assert 'label' not in math[0]
+    assert sections[0]['title'] == 'Introduction'
+    assert sections[0]['paragraphs'][1:3] == [
+        ['Energy is related to mass.'],
+        [0],
+    ]
+    assert section_to_text(sections[0], speak(math))['text'].split('\n\n') == [
+        'Introduction',
+        'Energy is related to mass.',
+        'formula 0',
+        'With formula 1 the speed of light.',
+    ]
+
+def test_nested_division_keeps_document_order():
+    """Test that text after a nested division is read after it"""
+    sections, math = parse_tei_xml(io.BytesIO(TEI_DOCUMENT))
+    texts = [section_to_text(section, speak(math))['text'] for section in sections]
+    
+    assert [section['title'] for section in sections] == ['Introduction', 'Details', '']
+    assert texts[1] == 'Details\n\nNested text.'
+    assert texts[2] == 'Back in the introduction.'
+
+def test_body_without_divisions():
+    """Test that a body with no divisions is read as one section, formulas included"""
+    sections, math = parse_tei_xml(io.BytesIO(BODY_ONLY_DOCUMENT))
+    
+    assert len(sections) == 1
+    assert sections[0]['paragraphs'] == [['Before.'], [0], ['After.']]
+    assert len(math) == 1
+
+def test_invalid_tei():
+    """Test that unparseable TEI returns None"""
+    assert parse_tei_xml(io.BytesIO(b'<TEI><text>')) is None